@@ -0,0 +1,48 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+from mapcss_engine import load_stylesheet, parse_settings, style_cardinality
+from osm_extract import load_dataset
+
+def main():
+    parser = argparse.ArgumentParser(description="Count the distinct styles MapCSS styles resolve for the objects of an OSM extract per zoom band, and the properties creating most of them. Combinations no object of the extract produces are not counted.")
+    parser.add_argument("extract", help="OSM extract (.osm, .osm.gz, .osm.bz2 or .pbf)")
+    parser.add_argument("styles", nargs="+", help="generated MapCSS styles to analyze")
+    parser.add_argument("--setting", action="append", default=[], metavar="NAME=VALUE", help="override a style setting, e.g. hide_icons=false")
+    parser.add_argument("--top", type=int, default=10, help="number of properties creating most styles to print (default: 10)")
+    parser.add_argument("--json", metavar="FILE", help="save the full report as JSON")
+    args = parser.parse_args()
+
+    settings = parse_settings(args.setting)
+
+    start = time.perf_counter()
+    dataset = load_dataset(args.extract)
+    print(f"📥 Loaded {len(dataset)} objects from '{args.extract}' in {time.perf_counter() - start:.2f}s")
+
+    report = {"extract": os.path.abspath(args.extract), "objects": len(dataset), "styles": {}}
+    for style_file in args.styles:
+        style_report = style_cardinality(load_stylesheet(style_file), dataset, settings)
+        report["styles"][style_file] = style_report
+
+        print(f"\n📊 {os.path.basename(style_file)}: {style_report['distinct_styles']} distinct styles over {len(style_report['bands'])} zoom bands")
+        print(f"{'Zooms':>7} {'Styles':>7}")
+        for band in style_report["bands"]:
+            print(f"{band['zooms']:>7} {band['distinct_styles']:>7}")
+        print(f"\n{'Property':40} {'Values':>7} {'Styles created':>15}")
+        for name, entry in list(style_report["properties"].items())[:args.top]:
+            print(f"{name[:40]:40} {entry['values']:>7} {entry['styles_created']:>15}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\n💾 Report saved as '{args.json}'")
+
+if __name__ == "__main__":
+    try:
+        main()
+    except (OSError, ValueError) as e:
+        print(f"❌ {e}")
+        sys.exit(1)
@@ -0,0 +1,73 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+
+from mapcss_coverage import coverage_rows, rule_coverage
+from mapcss_engine import parse_settings
+from osm_extract import load_dataset
+
+def main():
+    parser = argparse.ArgumentParser(description="Count how often each rule of a MapCSS style fires on an OSM extract, per zoom band, to find dead and hot rules.")
+    parser.add_argument("extract", help="OSM extract (.osm, .osm.gz, .osm.bz2 or .pbf)")
+    parser.add_argument("style", help="generated MapCSS style to profile")
+    parser.add_argument("--zooms", help="comma separated zoom levels to evaluate instead of the zoom bands of the style")
+    parser.add_argument("--jobs", type=int, default=None, help="number of worker processes (default: CPU count)")
+    parser.add_argument("--setting", action="append", default=[], metavar="NAME=VALUE", help="override a style setting, e.g. hide_icons=false")
+    parser.add_argument("--no-index", action="store_true", help="test every selector against every object instead of using JOSM's key index")
+    parser.add_argument("--top", type=int, default=10, help="number of hottest rules to print (default: 10)")
+    parser.add_argument("--csv", metavar="FILE", help="save the heat table as CSV, one row per selector with its hits per zoom band")
+    parser.add_argument("--json", metavar="FILE", help="save the full report as JSON")
+    args = parser.parse_args()
+
+    zooms = [int(zoom) for zoom in args.zooms.split(",") if zoom.strip()] if args.zooms else None
+    with open(args.style, "r", encoding="utf-8") as f:
+        text = f.read()
+
+    start = time.perf_counter()
+    dataset = load_dataset(args.extract)
+    print(f"📥 Loaded {len(dataset)} objects from '{args.extract}' in {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    report = rule_coverage(args.extract, text, zooms, parse_settings(args.setting), args.jobs, not args.no_index, dataset)
+    report["extract"], report["style"] = os.path.abspath(args.extract), args.style
+    report["seconds"] = round(time.perf_counter() - start, 3)
+    rules = report["rules"]
+    print(f"🔍 Styled {report['objects']} objects at {len(report['bands'])} zoom bands with {len(rules)} rules in {report['seconds']}s")
+
+    hot = sorted((rule for rule in rules if rule["hits"]), key=lambda rule: -rule["hits"])[:args.top]
+    if hot:
+        print(f"\n🔥 Hottest rules:\n{'Line':>6} {'Hits':>10} {'Tests':>10}  Selectors")
+        for rule in hot:
+            print(f"{rule['line']:>6} {rule['hits']:>10} {rule['tests']:>10}  {', '.join(selector['selector'] for selector in rule['selectors'])[:80]}")
+
+    if report["dead_rules"]:
+        print(f"\n💀 {report['dead_rules']} rules never fire on this extract:")
+        for rule in rules:
+            if not rule["hits"]:
+                print(f"{rule['line']:>6}  {', '.join(selector['selector'] for selector in rule['selectors'])[:90]}")
+    partly_dead = [(rule, selector) for rule in rules if rule["hits"] for selector in rule["selectors"] if not selector["hits"]]
+    if partly_dead:
+        print(f"\n⚠️ {len(partly_dead)} selectors never match in rules that do fire:")
+        for rule, selector in partly_dead:
+            print(f"{selector['line']:>6}  {selector['selector'][:90]}")
+    if not report["dead_selectors"]:
+        print("\n✅ Every selector matches at least one object")
+
+    if args.csv:
+        with open(args.csv, "w", encoding="utf-8", newline="") as f:
+            csv.writer(f).writerows(coverage_rows(report))
+        print(f"\n💾 Heat table saved as '{args.csv}'")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Report saved as '{args.json}'")
+
+if __name__ == "__main__":
+    try:
+        main()
+    except (OSError, ValueError) as e:
+        print(f"❌ {e}")
+        sys.exit(1)
@@ -0,0 +1,58 @@
+import argparse
+import json
+import sys
+import time
+
+from mapcss_engine import parse_settings
+from mapcss_equivalence import check_equivalence
+
+def format_tags(tags) -> str:
+    return "".join(f"[{key}={value}]" for key, value in tags.items()) if tags else "(no tags)"
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that two MapCSS styles resolve to the same visible properties on random objects.")
+    parser.add_argument("style_a", help="reference MapCSS style")
+    parser.add_argument("style_b", help="MapCSS style to compare, e.g. an optimised or refactored version")
+    parser.add_argument("--cases", type=int, default=2000, help="number of random objects to test (default: 2000)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed, the same seed gives the same cases (default: 0)")
+    parser.add_argument("--jobs", type=int, default=None, help="number of worker processes (default: CPU count)")
+    parser.add_argument("--setting", action="append", default=[], metavar="NAME=VALUE", help="override a style setting in both styles, e.g. hide_icons=false")
+    parser.add_argument("--examples", type=int, default=10, help="maximum number of counterexamples to report (default: 10)")
+    parser.add_argument("--json", metavar="FILE", help="save the report as JSON")
+    args = parser.parse_args()
+
+    texts = []
+    for path in (args.style_a, args.style_b):
+        with open(path, "r", encoding="utf-8") as f:
+            texts.append(f.read())
+
+    start = time.perf_counter()
+    report = check_equivalence(texts[0], texts[1], args.cases, args.seed, args.jobs, parse_settings(args.setting), args.examples)
+    report["style_a"], report["style_b"] = args.style_a, args.style_b
+    report["seconds"] = round(time.perf_counter() - start, 3)
+
+    print(f"🔍 Tested {report['cases']} random objects over {report['keys']} keys and {len(report['zooms'])} zoom levels in {report['seconds']}s")
+    if report["equivalent"]:
+        print(f"✅ '{args.style_a}' and '{args.style_b}' paint every tested object the same way")
+    else:
+        print(f"❌ {report['failures']} objects are painted differently, minimal counterexamples:")
+        for example in report["examples"]:
+            case = example["object"]
+            parent = f" in {'way' if case['kind'] == 'node' else 'relation'}{format_tags(case['parent'])}" if case["parent"] is not None else ""
+            print(f"\n  {case['kind']}|z{case['zoom']}{format_tags(case['tags'])}{parent}")
+            for layer, properties in example["differences"].items():
+                for name, (value_a, value_b) in properties.items():
+                    print(f"    {layer}::{name}: {value_a!r} → {value_b!r}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, default=str)
+        print(f"\n💾 Report saved as '{args.json}'")
+    return 0 if report["equivalent"] else 1
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main())
+    except (OSError, ValueError) as e:
+        print(f"❌ {e}")
+        sys.exit(1)
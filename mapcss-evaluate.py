@@ -0,0 +1,62 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+from mapcss_engine import evaluate_dataset, load_stylesheet, parse_settings
+from osm_extract import load_dataset
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply MapCSS styles to an OSM extract offline and report evaluation counts and timings.")
+    parser.add_argument("extract", help="OSM extract (.osm, .osm.gz, .osm.bz2 or .pbf)")
+    parser.add_argument("styles", nargs="+", help="generated MapCSS styles to evaluate")
+    parser.add_argument("--zooms", default="10,15,18", help="comma separated zoom levels to evaluate (default: 10,15,18)")
+    parser.add_argument("--setting", action="append", default=[], metavar="NAME=VALUE", help="override a style setting, e.g. hide_icons=false")
+    parser.add_argument("--no-index", action="store_true", help="test every selector against every object instead of using JOSM's key index")
+    parser.add_argument("--json", metavar="FILE", help="save the full report as JSON")
+    parser.add_argument("--dump-styles", metavar="FILE", help="save the resolved style of every object as JSON lines")
+    args = parser.parse_args()
+
+    zooms = [int(zoom) for zoom in args.zooms.split(",") if zoom.strip()]
+    settings = parse_settings(args.setting)
+
+    start = time.perf_counter()
+    dataset = load_dataset(args.extract)
+    print(f"📥 Loaded {len(dataset)} objects from '{args.extract}' in {time.perf_counter() - start:.2f}s")
+
+    dump = open(args.dump_styles, "w", encoding="utf-8") if args.dump_styles else None
+    report = {"extract": os.path.abspath(args.extract), "objects": len(dataset), "zooms": zooms, "styles": {}}
+    try:
+        for style_file in args.styles:
+            stylesheet = load_stylesheet(style_file)
+
+            def write_style(zoom, element, style):
+                dump.write(json.dumps({"style": style_file, "zoom": zoom, "type": element.type, "id": element.id, "layers": style}) + "\n")
+
+            style_report = evaluate_dataset(stylesheet, dataset, zooms, settings, not args.no_index, write_style if dump else None)
+            style_report["rule_hits"] = {
+                f"line {rule.line}": hits for rule, hits in zip(stylesheet.rules, style_report["rule_hits"]) if rule.is_object_rule
+            }
+            report["styles"][style_file] = style_report
+    finally:
+        if dump:
+            dump.close()
+
+    print(f"\n{'Style':40} {'Zoom':>5} {'Selectors':>12} {'Conditions':>12} {'Functions':>12} {'Styles':>7} {'Seconds':>9}")
+    for style_file, style_report in report["styles"].items():
+        for zoom, zoom_report in style_report["zooms"].items():
+            print(f"{os.path.basename(style_file)[:40]:40} {zoom:>5} {zoom_report['selectors_tested']:>12} {zoom_report['conditions_evaluated']:>12} "
+                  f"{zoom_report['function_calls']:>12} {zoom_report['distinct_styles']:>7} {zoom_report['seconds']:>9.3f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\n💾 Report saved as '{args.json}'")
+
+if __name__ == "__main__":
+    try:
+        main()
+    except (OSError, ValueError) as e:
+        print(f"❌ {e}")
+        sys.exit(1)
@@ -1,8 +1,17 @@
-import jinja2
-import re
+import argparse
+import concurrent.futures
+import contextlib
+import hashlib
+import itertools
+import json
+import shutil
 import sys
 import os
-from typing import Dict, List, Tuple, Any
+import time
+from typing import Dict, Iterable, Iterator, List, Tuple, Any, Optional
+
+# jinja2, re and the optimisation and OSM modules are imported where needed, so that
+# rendering from a cached template artifact starts quickly
 
 DEFAULT_VALUES = {
     # Power nodes and supports styling variables
@@ -53,6 +62,12 @@ DEFAULT_VALUES = {
     "segment_multi_circuit_casing_width_low": 2,
     "segment_multi_circuit_casing_width_mid": 4,
     "segment_multi_circuit_casing_width_high": 5,
+
+    # Zoom gating variables
+    "icon_hidden_max_zoom": 15,
+    "node_label_hidden_max_zoom": 17,
+    "line_label_min_zoom": 18,
+    "casing_min_zoom": 0,
 }
 
 DENSE_VALUES = {
@@ -104,6 +119,20 @@ DENSE_VALUES = {
     "segment_multi_circuit_casing_width_low": 1,
     "segment_multi_circuit_casing_width_mid": 3,
     "segment_multi_circuit_casing_width_high": 5,
+
+    # Zoom gating variables
+    "icon_hidden_max_zoom": 15,
+    "node_label_hidden_max_zoom": 17,
+    "line_label_min_zoom": 18,
+    "casing_min_zoom": 0,
+}
+
+# Zoom gates derived from the grid density, as (sparse grid, dense grid) values
+DENSITY_ZOOM_GATES = {
+    "icon_hidden_max_zoom": (15, 17),
+    "node_label_hidden_max_zoom": (17, 18),
+    "line_label_min_zoom": (18, 19),
+    "casing_min_zoom": (0, 15),
 }
 
 # Define default voltage rules
@@ -130,6 +159,19 @@ DENSE_VOLTAGE_RULES = [
     (550000, None, "#00ced1", "#000000")
 ]
 
+# Primary and secondary voltage of a power way, as MapCSS expressions
+VOLTAGE_1ST_EXPRESSION = 'to_int(get(split(";",tag(voltage)),0))'
+VOLTAGE_2ND_EXPRESSION = 'count(split(";",tag(voltage)))>1 ? to_int(get(split(";",tag(voltage)),1)) : tag(voltage)'
+
+# How voltage range selectors are emitted for power lines
+VOLTAGE_MODES = ["flat", "compiled", "tree"]
+
+# Base presets selectable by name in batch configurations
+PRESETS = {
+    "default": (DEFAULT_VALUES, DEFAULT_VOLTAGE_RULES),
+    "dense": (DENSE_VALUES, DENSE_VOLTAGE_RULES),
+}
+
 # User-friendly descriptions for variable categories
 FRIENDLY_DESCRIPTIONS = {
     "basic_power_node_symbol_size_low": "Size of power node symbols at low zoom levels",
@@ -176,6 +218,11 @@ FRIENDLY_DESCRIPTIONS = {
     "segment_multi_circuit_casing_width_low": "Width of multi-circuit line casings at low zoom levels",
     "segment_multi_circuit_casing_width_mid": "Width of multi-circuit line casings at medium zoom levels",
     "segment_multi_circuit_casing_width_high": "Width of multi-circuit line casings at high zoom levels",
+
+    "icon_hidden_max_zoom": "Highest zoom level at which icons are hidden (with the hide_icons setting)",
+    "node_label_hidden_max_zoom": "Highest zoom level at which node labels are hidden (with the hide_icons setting)",
+    "line_label_min_zoom": "Zoom level from which power line voltage labels are shown",
+    "casing_min_zoom": "Zoom level from which busbar, bay and multi-circuit casings are drawn",
 }
 
 def get_user_input_for_variable(var_name: str, default_value: Any) -> Any:
@@ -223,10 +270,10 @@ def get_user_voltage_rules() -> List[Tuple[int, int, str, str]]:
                 print("❌ Hmm, that format doesn't look right. Please use: lower_voltage upper_voltage color [text halo color]")
                 continue
             
-            lower_input = int(parts[0]) if int(parts[0]) >= 0 else None
-            upper_input = int(parts[1]) if int(parts[1]) >= 0 else None
-            lower = min(lower_input, upper_input)
-            upper = max(lower_input, upper_input)
+            lower = int(parts[0]) if int(parts[0]) >= 0 else None
+            upper = int(parts[1]) if int(parts[1]) >= 0 else None
+            if lower is not None and upper is not None and lower > upper:
+                lower, upper = upper, lower
             color = parts[2]
             halo = parts[3] if len(parts) == 4 else "#FFFFFF"
             
@@ -235,25 +282,22 @@ def get_user_voltage_rules() -> List[Tuple[int, int, str, str]]:
         except ValueError as e:
             print(f"❌ Oops! {e}. Please try again.")
     
-    # Voltage ranges sorting and consistency test
-    voltage_rules = sorted(voltage_rules_input, key=lambda d: d[0])
-    current_voltage = 0
-    for lower, upper, color, halo in voltage_rules:
-        if lower is not None and lower < current_voltage:
-            print(f"❌ Inconsistent range {lower} kV to {upper} kV, overlapping lower ones. Please try again.")
-        current_voltage = upper
+    return voltage_rules_input
 
-    return voltage_rules
+# Variables of the voltage rules, filled in by the generated sections rather than asked for
+VOLTAGE_VARIABLES = ['lower_voltage', 'upper_voltage', 'line_color', 'line']
 
 def extract_vars_from_template(template_content: str) -> List[str]:
     """Extract all non-voltage variables from the template."""
+    import re
+
     vars_pattern = r'{{([^{}]+?)}}'
     all_vars = re.findall(vars_pattern, template_content)
     
     non_voltage_vars = [
         var.strip() 
         for var in all_vars 
-        if var.strip() not in ['lower_voltage', 'upper_voltage', 'line_color', 'line']
+        if var.strip() not in VOLTAGE_VARIABLES
     ]
     
     unique_vars = []
@@ -263,20 +307,14 @@ def extract_vars_from_template(template_content: str) -> List[str]:
     
     return unique_vars
 
-def process_template(template_content: str, voltage_rules: List[Tuple[int, int, str, str]]) -> str:
-    """Process the template to replace voltage rules and fix any syntax issues."""
-    # Voltage global classes
-    start_section = re.search(r'/\* Voltage-based classes \*/', template_content)
-    end_section = re.search(r'/\* End of voltage-based classes \*/', template_content)
+def voltage_classes_section(voltage_rules: List[Tuple[int, int, str, str]], voltage_mode: str = "flat") -> str:
+    """Colour classes of every voltage range."""
+    new_rules = "/* Voltage-based classes with voltage labels for all lines/cables */\n"
     
-    if start_section and end_section:
-        # Build new voltage rules
-        new_rules = "/* Voltage-based classes with voltage labels for all lines/cables */\n"
-        
-        # Create voltage classes
-        for lower, upper, color, halo in voltage_rules:
-            if lower is None and upper is None:
-                new_rules += f"""way.voltage_no, area.voltage_no {{
+    # Create voltage classes
+    for lower, upper, color, halo in voltage_rules:
+        if lower is None and upper is None:
+            new_rules += f"""way.voltage_no, area.voltage_no {{
     color: {color};
     fill-color: {color};
     text-color: {color};
@@ -285,9 +323,9 @@ def process_template(template_content: str, voltage_rules: List[Tuple[int, int,
     text-halo-color: {halo};
 }}
 """
-            else:
-                voltage_class = voltage_range_name (lower, upper)
-                new_rules += f"""way.voltage_{voltage_class}, area.voltage_{voltage_class} {{
+        else:
+            voltage_class = voltage_range_name (lower, upper)
+            new_rules += f"""way.voltage_{voltage_class}, area.voltage_{voltage_class} {{
     color: {color};
     fill-color: {color};
     text-color: {color};
@@ -299,72 +337,86 @@ way.voltage_2nd_{voltage_class}, area.voltage_2nd_{voltage_class} {{
 }}
 """
 
-        # Replace the entire section with our new voltage rules
-        start_pos = start_section.start()
-        end_pos = end_section.start()
-        template_content = template_content[:start_pos] + new_rules + template_content[end_pos:]
+    return new_rules
 
-    # Switchgears voltage styles
-    start_section = re.search(r'/\* Switchgears voltage-based styles \*/', template_content)
-    end_section = re.search(r'/\* End of switchgears voltage-based styles \*/', template_content)
+def switchgear_voltage_section(voltage_rules: List[Tuple[int, int, str, str]], voltage_mode: str = "flat") -> str:
+    """Voltage classes of switchgear areas."""
+    new_rules = "/* Switchgears voltage-based styles */\n"
+
+    if voltage_mode == "tree":
+        new_rules += voltage_tree_rules(
+            build_voltage_tree(voltage_intervals(voltage_rules)), "area", "area[power=switchgear]", "voltage", "voltage_switchgear_tree",
+            lambda rules: "".join(f"    set .voltage_{voltage_range_name(*voltage_rules[i][:2])};\n" for i in rules))
     
-    if start_section and end_section:
-        # Build new voltage rules
-        new_rules = "/* Switchgears voltage-based styles */\n"
-        
-        # Create voltage styles
-        for lower, upper, color, halo in voltage_rules:
-            if lower is None and upper is None:
-                continue
+    # Create voltage styles
+    for lower, upper, color, halo in voltage_rules if voltage_mode != "tree" else []:
+        if lower is None and upper is None:
+            continue
 
-            selector = "area[power=switchgear]"
-            voltage_class = voltage_range_name (lower, upper)
+        selector = "area[power=switchgear]"
+        voltage_class = voltage_range_name (lower, upper)
 
-            if lower is not None:
-                selector += f"[voltage>={lower}]"
-            
-            if upper is not None:
-                selector += f"[voltage<{upper}]"
+        if lower is not None:
+            selector += f"[voltage>={lower}]"
+        
+        if upper is not None:
+            selector += f"[voltage<{upper}]"
 
-            new_rules += f"""{selector}{{
+        new_rules += f"""{selector}{{
     set .voltage_{voltage_class};
 }}
 """
 
-        # Replace the entire section with our new voltage rules
-        start_pos = start_section.start()
-        end_pos = end_section.start()
-        template_content = template_content[:start_pos] + new_rules + template_content[end_pos:]
+    return new_rules
+
+def line_voltage_section(voltage_rules: List[Tuple[int, int, str, str]], voltage_mode: str = "flat") -> str:
+    """Voltage classes and z-index of power lines and cables."""
+    new_rules = "/* Power lines voltage-based styles */\n"
+
+    if voltage_mode in ("compiled", "tree"):
+        # Parse the voltage tag once per way into properties read by the range rules
+        voltage_1st, voltage_2nd = "prop(voltage_1st)", "prop(voltage_2nd)"
+        new_rules += f"""way.power_segment_live[voltage] {{
+    voltage_1st: eval({VOLTAGE_1ST_EXPRESSION});
+    voltage_2nd: eval({VOLTAGE_2ND_EXPRESSION});
+}}
+"""
+    else:
+        voltage_1st, voltage_2nd = VOLTAGE_1ST_EXPRESSION, f"({VOLTAGE_2ND_EXPRESSION})"
 
-    # Lines voltage styles
-    start_section = re.search(r'/\* Power lines voltage-based styles \*/', template_content)
-    end_section = re.search(r'/\* End of power lines voltage-based styles \*/', template_content)
+    if voltage_mode == "tree":
+        tree = build_voltage_tree(voltage_intervals(voltage_rules))
+        new_rules += voltage_tree_rules(
+            tree, "way", "way.power_segment_live", voltage_1st, "voltage_tree",
+            lambda rules: "".join(f"    set .voltage_{voltage_range_name(*voltage_rules[i][:2])};\n" for i in rules) + f"    z-index: {20 + max(rules)}\n")
+        new_rules += voltage_tree_rules(
+            tree, "way", "way.power_segment_live", voltage_2nd, "voltage_2nd_tree",
+            lambda rules: "".join(f"    set .voltage_2nd_{voltage_range_name(*voltage_rules[i][:2])};\n" for i in rules))
     
-    if start_section and end_section:
-        # Build new voltage rules
-        new_rules = "/* Power lines voltage-based styles */\n"
-        
-        # Create voltage styles
-        current_zindex = 20
-        for lower, upper, color, halo in voltage_rules:
-            voltage_class = voltage_range_name (lower, upper)
-            selector_1 = selector_2 = "way.power_segment_live"
+    # Create voltage styles
+    current_zindex = 20
+    for lower, upper, color, halo in voltage_rules:
+        voltage_class = voltage_range_name (lower, upper)
+        selector_1 = selector_2 = "way.power_segment_live"
 
-            if lower is None and upper is None:
-                new_rules += f"""way.power_segment_live[!voltage],
+        if voltage_mode == "tree" and (lower is not None or upper is not None):
+            continue
+
+        if lower is None and upper is None:
+            new_rules += f"""way.power_segment_live[!voltage],
 way.power_segment_live[voltage=0] {{
     set .voltage_{voltage_class};
 }}
 """
-            else:
-                if lower is not None:
-                    selector_1 += f'[to_int(get(split(";",tag(voltage)),0))>={lower}]'
-                    selector_2 += f'[(count(split(";",tag(voltage)))>1 ? to_int(get(split(";",tag(voltage)),1)) : tag(voltage))>={lower}]'
-                if upper is not None:
-                    selector_1 += f'[to_int(get(split(";",tag(voltage)),0))<{upper}]'
-                    selector_2 += f'[(count(split(";",tag(voltage)))>1 ? to_int(get(split(";",tag(voltage)),1)) : tag(voltage))<{upper}]'
-
-                new_rules += f"""{selector_1} {{
+        else:
+            if lower is not None:
+                selector_1 += f'[{voltage_1st}>={lower}]'
+                selector_2 += f'[{voltage_2nd}>={lower}]'
+            if upper is not None:
+                selector_1 += f'[{voltage_1st}<{upper}]'
+                selector_2 += f'[{voltage_2nd}<{upper}]'
+
+            new_rules += f"""{selector_1} {{
     set .voltage_{voltage_class};
     z-index: {current_zindex}
 }}
@@ -372,14 +424,305 @@ way.power_segment_live[voltage=0] {{
     set .voltage_2nd_{voltage_class};
 }}
 """
-            current_zindex += 1
+        current_zindex += 1
 
-        # Replace the entire section with our new voltage rules
-        start_pos = start_section.start()
-        end_pos = end_section.start()
-        template_content = template_content[:start_pos] + new_rules + template_content[end_pos:]
-    
-    return template_content
+    return new_rules
+
+class PhaseTimer:
+    """Wall time spent in each named phase of a run, for --profile and --benchmark."""
+
+    def __init__(self):
+        self.phases: Dict[str, float] = {}
+        self._nested: List[float] = []
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        """Time a phase, leaving out the phases nested in it so that phases add up to the total."""
+        start = time.perf_counter()
+        self._nested.append(0.0)
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.phases[name] = self.phases.get(name, 0.0) + elapsed - self._nested.pop()
+            if self._nested:
+                self._nested[-1] += elapsed
+
+    def as_dict(self) -> Dict[str, float]:
+        return {name: round(seconds, 6) for name, seconds in self.phases.items()}
+
+def timed(timer: Optional[PhaseTimer], name: str):
+    """Context measuring a phase when profiling, doing nothing otherwise."""
+    return timer.phase(name) if timer is not None else contextlib.nullcontext()
+
+# Template sections replaced by generated voltage rules, as (name, start marker, end marker, builder)
+TEMPLATE_SECTIONS = [
+    ("voltage_classes", "/* Voltage-based classes */", "/* End of voltage-based classes */", voltage_classes_section),
+    ("switchgear_voltage", "/* Switchgears voltage-based styles */", "/* End of switchgears voltage-based styles */", switchgear_voltage_section),
+    ("line_voltage", "/* Power lines voltage-based styles */", "/* End of power lines voltage-based styles */", line_voltage_section),
+]
+
+# Characters of a template read at a time when it is streamed
+TEMPLATE_BLOCK_SIZE = 1 << 16
+
+def read_template_blocks(template_file: str, block_size: Optional[int] = None) -> Iterator[str]:
+    """Yield a template file in blocks of block_size characters (TEMPLATE_BLOCK_SIZE by default), with its line endings read as newlines."""
+    with open(template_file, 'r', encoding='utf-8') as f:
+        while True:
+            block = f.read(block_size or TEMPLATE_BLOCK_SIZE)
+            if not block:
+                return
+            yield block
+
+def iter_template_pieces(blocks: Iterable[str]) -> Iterator[Tuple[str, str]]:
+    """Split a template given in blocks into ("text", text) and ("section", name) pieces.
+
+    Each section replaces the template from its start marker up to its end marker,
+    which is kept. As when searching the whole template, only the first markers of a
+    section count: a section whose end marker comes first, or whose start marker is
+    inside another section, is left as it is, and so is a section never closed.
+    The text a section replaces is held until its end marker is read, otherwise only
+    the few characters that may begin a marker are held back between blocks.
+    """
+    pending = {name: (start_marker, end_marker) for name, start_marker, end_marker, builder in TEMPLATE_SECTIONS}
+    keep = max(len(marker) for markers in pending.values() for marker in markers) - 1
+    # Section whose start marker was read, as (name, start marker, end marker)
+    inside = None
+    buffer = ""
+    for block in itertools.chain(blocks, [None]):
+        buffer += block or ""
+        while True:
+            if inside is not None:
+                name, start_marker, end_marker = inside
+                end = buffer.find(end_marker)
+                if end < 0:
+                    if block is not None:
+                        break
+                    yield "text", start_marker
+                    inside = None
+                    continue
+                for other, markers in list(pending.items()):
+                    if any(0 <= buffer.find(marker) < end for marker in markers):
+                        del pending[other]
+                yield "section", name
+                buffer, inside = buffer[end:], None
+                continue
+
+            found = None
+            for name, markers in pending.items():
+                for marker in markers:
+                    position = buffer.find(marker)
+                    if position >= 0 and (found is None or position < found[0]):
+                        found = (position, name, marker)
+            if found is None:
+                break
+            position, name, marker = found
+            start_marker, end_marker = pending.pop(name)
+            if marker == start_marker:
+                yield "text", buffer[:position]
+                buffer, inside = buffer[position + len(marker):], (name, start_marker, end_marker)
+            else:
+                yield "text", buffer[:position + len(marker)]
+                buffer = buffer[position + len(marker):]
+
+        if block is None:
+            break
+        if inside is None and len(buffer) > keep:
+            yield "text", buffer[:-keep]
+            buffer = buffer[-keep:]
+    yield "text", buffer
+
+def iter_sections(template_content: str, section_text) -> Iterator[str]:
+    """Yield the template in pieces, each section from its start marker up to its end marker replaced with section_text(name).
+
+    Sections are only built when reached, so that callers writing the pieces out
+    never hold more than one generated section.
+    """
+    for kind, value in iter_template_pieces([template_content]):
+        yield section_text(value) if kind == "section" else value
+
+def splice_sections(template_content: str, section_text) -> str:
+    """Replace each template section, from its start marker up to its end marker, with section_text(name)."""
+    return "".join(iter_sections(template_content, section_text))
+
+def process_template(template_content: str, voltage_rules: List[Tuple[int, int, str, str]], voltage_mode: str = "flat",
+                     timer: Optional[PhaseTimer] = None) -> str:
+    """Process the template to replace voltage rules and fix any syntax issues.
+
+    With voltage_mode "flat" every line range rule parses the voltage tag itself,
+    with "compiled" the voltage tag is parsed once per way into the voltage_1st and
+    voltage_2nd properties which the range rules then compare. "tree" compares the
+    same properties through a binary partition of intermediate classes, so that an
+    object only evaluates about log2(N) range conditions, plus one class condition
+    for every intermediate class.
+    """
+    builders = {name: builder for name, start_marker, end_marker, builder in TEMPLATE_SECTIONS}
+
+    def build(name):
+        with timed(timer, f"section:{name}"):
+            return builders[name](voltage_rules, voltage_mode)
+    return splice_sections(template_content, build)
+
+def voltage_intervals(voltage_rules: List[Tuple[int, int, str, str]]) -> List[Tuple[Optional[int], Optional[int], List[int]]]:
+    """Split the bounded voltage rules into disjoint intervals covering the whole voltage axis.
+
+    Each interval is returned as (lower, upper, rule_indexes), where rule_indexes
+    lists the rules matching every voltage of the interval.
+    """
+    # Sweep the bounds in order, keeping the rules matching the current interval
+    active, starts, ends = set(), {}, {}
+    for i, (lower, upper, color, halo) in enumerate(voltage_rules):
+        if (lower is None and upper is None) or (lower is not None and upper is not None and lower >= upper):
+            continue
+        if lower is None:
+            active.add(i)
+        else:
+            starts.setdefault(lower, []).append(i)
+        if upper is not None:
+            ends.setdefault(upper, []).append(i)
+    edges = [None] + sorted(set(starts) | set(ends)) + [None]
+
+    intervals = []
+    for lower, upper in zip(edges, edges[1:]):
+        if lower is not None:
+            active.update(starts.get(lower, []))
+            active.difference_update(ends.get(lower, []))
+        rules = sorted(active)
+        # Neighbouring intervals matched by the same rules need no split between them
+        if intervals and intervals[-1][2] == rules:
+            intervals[-1] = (intervals[-1][0], upper, rules)
+        else:
+            intervals.append((lower, upper, rules))
+
+    return intervals
+
+def voltage_range_label(lower: Optional[int], upper: Optional[int]) -> str:
+    """Readable voltage range, such as "50 to 132 kV"."""
+    if lower is None and upper is None:
+        return "no voltage"
+    if lower is None:
+        return f"below {upper / 1000:g} kV"
+    if upper is None:
+        return f"{lower / 1000:g} kV and above"
+    return f"{lower / 1000:g} to {upper / 1000:g} kV"
+
+def canonical_voltage_rules(voltage_rules: List[Tuple[int, int, str, str]]) -> Tuple[List[Tuple[int, int, str, str]], List[str]]:
+    """Rewrite voltage rules into sorted, disjoint ranges so that every voltage matches one range selector.
+
+    Where ranges overlap the last rule wins, as its colours are the ones painted when
+    every matching class is set. Neighbouring ranges with the same colour and halo are
+    merged. Returns the rules and a list of the gaps, overlaps and unused rules found.
+    """
+    notes = []
+    unbounded = [rule for rule in voltage_rules if rule[0] is None and rule[1] is None]
+    if len(unbounded) > 1:
+        notes.append(f"{len(unbounded)} rules for lines without voltage, keeping the last one ({unbounded[-1][2]})")
+    canonical = unbounded[-1:]
+
+    bounded = []
+    applied = set()
+    for lower, upper, rules in voltage_intervals(voltage_rules):
+        if not rules:
+            # Voltages are never negative, so nothing is lost below 0 V
+            if upper is None or upper > 0:
+                gap = voltage_range_label(lower, upper) if lower is not None or upper is not None else "any voltage"
+                notes.append(f"no rule for {gap}, these lines get no voltage colour")
+            bounded.append(None)
+            continue
+        applied.add(rules[-1])
+        winner = voltage_rules[rules[-1]]
+        if len(rules) > 1:
+            losers = ", ".join(f"{voltage_range_label(*voltage_rules[i][:2])} in {voltage_rules[i][2]}" for i in rules[:-1])
+            notes.append(f"{voltage_range_label(lower, upper)} is covered by several rules, "
+                         f"{voltage_range_label(*winner[:2])} in {winner[2]} wins over {losers}")
+        previous = bounded[-1] if bounded else None
+        if previous is not None and previous[2:] == winner[2:]:
+            bounded[-1] = (previous[0], upper, winner[2], winner[3])
+        else:
+            bounded.append((lower, upper, winner[2], winner[3]))
+
+    canonical += [rule for rule in bounded if rule is not None]
+    for i, (lower, upper, color, halo) in enumerate(voltage_rules):
+        if (lower is not None or upper is not None) and i not in applied:
+            notes.append(f"rule {voltage_range_label(lower, upper)} in {color} is never applied")
+    return canonical, notes
+
+def build_voltage_tree(intervals: List[Tuple[Optional[int], Optional[int], List[int]]]) -> Dict[str, Any]:
+    """Build a balanced binary partition of voltage intervals."""
+    if len(intervals) == 1:
+        return {"rules": intervals[0][2]}
+
+    middle = len(intervals) // 2
+    return {
+        "threshold": intervals[middle][0],
+        "below": build_voltage_tree(intervals[:middle]),
+        "above": build_voltage_tree(intervals[middle:]),
+    }
+
+def voltage_tree_rules(tree: Dict[str, Any], element: str, root_selector: str, value: str, class_prefix: str, leaf_declarations) -> str:
+    """Emit a voltage decision tree as MapCSS rules, intermediate nodes becoming classes."""
+    # Collected as a list, as += on a closure variable copies the whole text every time
+    rules = []
+    node_count = 0
+
+    def emit(node: Dict[str, Any], selector: str):
+        nonlocal node_count
+        for branch, operator in (("below", "<"), ("above", ">=")):
+            child = node[branch]
+            child_selector = f"{selector}[{value}{operator}{node['threshold']}]"
+            if "threshold" in child:
+                node_count += 1
+                node_class = f"{class_prefix}_{node_count}"
+                rules.append(f"""{child_selector} {{
+    set .{node_class};
+}}
+""")
+                emit(child, f"{element}.{node_class}")
+            elif child["rules"]:
+                rules.append(f"""{child_selector} {{
+{leaf_declarations(child["rules"])}}}
+""")
+
+    if "threshold" in tree:
+        emit(tree, root_selector)
+    return "".join(rules)
+
+def voltage_selector_cost(voltage_rules: List[Tuple[int, int, str, str]], voltage_mode: str = "tree") -> Dict[str, Any]:
+    """Measure the selector conditions a power way evaluates in the power line voltage rules, flat and in voltage_mode.
+
+    The rules are applied with mapcss_engine to one power way per interval of
+    voltage_intervals(), so that every condition counts: range conditions, the
+    voltage parsing rule and the class conditions of the intermediate .voltage_tree_*
+    selectors, which are tested against every power way.
+    """
+    from mapcss_engine import EvaluationStats, apply_stylesheet, parse_stylesheet
+    from osm_extract import OsmElement
+
+    # Sets the class the generated rules select on, its own conditions are left out of the counts
+    seed = "way[power=line] {\n    set .power_segment_live;\n}\n"
+    voltages = [lower if lower is not None else (upper - 1 if upper is not None else 0) for lower, upper, rules in voltage_intervals(voltage_rules)]
+    ways = [OsmElement("way", i + 1, {"power": "line", "voltage": str(voltage)}, nodes=[1, 2]) for i, voltage in enumerate(voltages)]
+
+    def conditions(stylesheet_text: str) -> List[int]:
+        stylesheet = parse_stylesheet(stylesheet_text)
+        counts = []
+        for way in ways:
+            stats = EvaluationStats(len(stylesheet.rules))
+            apply_stylesheet(stylesheet, way, 18, stats=stats)
+            counts.append(stats.conditions_evaluated)
+        return counts
+
+    seed_costs = conditions(seed)
+    costs = {}
+    for mode in ("flat", voltage_mode):
+        measured = [count - seed_cost for count, seed_cost in zip(conditions(seed + line_voltage_section(voltage_rules, mode)), seed_costs)]
+        costs[mode] = {"average": round(sum(measured) / len(measured), 2), "max": max(measured)}
+
+    return {
+        "voltage_bands": sum(1 for lower, upper, color, halo in voltage_rules if lower is not None or upper is not None),
+        "flat": costs["flat"],
+        voltage_mode: costs[voltage_mode],
+    }
 
 def voltage_range_name (lower: int, upper: int) -> str:
     if lower is not None and lower > 1000:
@@ -403,7 +746,975 @@ def voltage_range_name (lower: int, upper: int) -> str:
 
     return result
 
+def render_style(template_content: str, values: Dict[str, Any], voltage_rules: List[Tuple[int, int, str, str]], voltage_mode: str = "flat",
+                 timer: Optional[PhaseTimer] = None) -> str:
+    """Render a complete MapCSS style from a template, variable values and voltage rules."""
+    # Process the template to replace voltage rules and fix syntax issues
+    processed_template = process_template(template_content, voltage_rules, voltage_mode, timer)
+
+    # Apply the user-defined variable values with Jinja2
+    with timed(timer, "jinja_compile"):
+        import jinja2
+        jinja2_env = jinja2.Environment()
+        template = jinja2_env.from_string(processed_template)
+    with timed(timer, "jinja_render"):
+        return template.render(**values)
+
+# Bumped whenever the artifact layout or the generated sections change, invalidating cached artifacts
+ARTIFACT_VERSION = 2
+
+# Characters of text held by each line of a cached artifact
+ARTIFACT_LINE_SIZE = 4096
+
+# Where compiled template artifacts are cached
+DEFAULT_CACHE_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"), "color-my-grid")
+
+# Names Jinja2 reads as constants rather than variables
+JINJA_CONSTANTS = {"true", "false", "none", "True", "False", "None"}
+
+# Template artifacts loaded by this process, by template hash
+_artifacts: Dict[str, Dict[str, Any]] = {}
+
+def template_hash(template_content: str) -> str:
+    return hashlib.sha256(f"{ARTIFACT_VERSION}\0{template_content}".encode('utf-8')).hexdigest()
+
+def template_file_hash(template_file: str) -> str:
+    """template_hash() of a template file, computed as it is read."""
+    digest = hashlib.sha256(f"{ARTIFACT_VERSION}\0".encode('utf-8'))
+    for block in read_template_blocks(template_file):
+        digest.update(block.encode('utf-8'))
+    return digest.hexdigest()
+
+def _normalized_pieces(pieces: Iterable[Tuple[str, str]]) -> Iterator[Tuple[str, str]]:
+    """Template pieces with their line endings normalised and one trailing newline dropped, like Jinja2 does."""
+    held = ""
+    for kind, value in pieces:
+        if kind == "section":
+            if held:
+                yield "text", held.replace("\r\n", "\n").replace("\r", "\n")
+            held = ""
+            yield kind, value
+            continue
+        value = held + value
+        # A "\r" may be followed by a "\n" in the next piece, and a last "\n" may end the template
+        cut = len(value)
+        if value.endswith("\r"):
+            cut -= 1
+        if value.endswith("\r\n", 0, cut):
+            cut -= 2
+        elif value.endswith("\n", 0, cut):
+            cut -= 1
+        held = value[cut:]
+        yield kind, value[:cut].replace("\r\n", "\n").replace("\r", "\n")
+    held = held.replace("\r\n", "\n").replace("\r", "\n")
+    yield "text", held[:-1] if held.endswith("\n") else held
+
+def iter_template_chunks(blocks: Iterable[str], artifact: Dict[str, Any]) -> Iterator[List[str]]:
+    """Compile a template given in blocks into ["text", text], ["var", name] and ["section", name] chunks.
+
+    The variables and whether Jinja2 is needed are recorded in artifact as the chunks
+    are made, so they are only complete once every chunk was taken. Text is held until
+    the placeholder it may begin is closed.
+    """
+    import re
+
+    placeholder = re.compile(r"\{\{(.*?)\}\}", re.DOTALL)
+    variables = set(artifact["variables"])
+    text = ""
+
+    def text_chunks(piece):
+        if "{%" in piece or "{#" in piece:
+            artifact["jinja"] = True
+        if piece:
+            yield ["text", piece]
+
+    for kind, value in _normalized_pieces(iter_template_pieces(blocks)):
+        if kind == "section":
+            yield from text_chunks(text)
+            text = ""
+            yield ["section", value]
+            continue
+
+        text += value
+        position = 0
+        for match in placeholder.finditer(text):
+            yield from text_chunks(text[position:match.start()])
+            name = match.group(1).strip()
+            if not name.isidentifier() or name in JINJA_CONSTANTS:
+                artifact["jinja"] = True
+            yield ["var", name]
+            if name not in variables:
+                variables.add(name)
+                artifact["variables"].append(name)
+            position = match.end()
+        text = text[position:]
+        # Only an unclosed placeholder, or a "{" that may begin one, waits for the next piece
+        opening = text.find("{{")
+        cut = opening if opening >= 0 else len(text) - 1 if text.endswith("{") else len(text)
+        if "{%" in text or "{#" in text:
+            artifact["jinja"] = True
+        if cut:
+            yield ["text", text[:cut]]
+        text = text[cut:]
+    yield from text_chunks(text)
+
+def compile_template(template_content: str) -> Dict[str, Any]:
+    """Split a template into text, variable slots and generated sections, rendering like Jinja2 does.
+
+    Templates using anything but plain {{ variable }} placeholders are marked to be
+    rendered with Jinja2.
+    """
+    artifact = {"version": ARTIFACT_VERSION, "hash": template_hash(template_content), "jinja": False, "variables": [],
+                "source": template_content}
+    artifact["chunks"] = list(iter_template_chunks([template_content], artifact))
+    return artifact
+
+def load_template_artifact(template_file: str, cache_dir: Optional[str] = DEFAULT_CACHE_DIR) -> Dict[str, Any]:
+    """Compiled artifact of a template file, from memory, from the cache directory or compiled on a miss.
+
+    The template is streamed, first to hash it and then to compile it on a miss, its
+    chunks going to a "{hash}.jsonl" cache file: a header line with the variables,
+    then the chunks, in lines of about ARTIFACT_LINE_SIZE characters. Only the
+    header is kept in memory, iter_artifact() reading the chunks back line by line,
+    or compiling them again from the template without a cache.
+    """
+    key = template_file_hash(template_file)
+    artifact = _artifacts.get(key)
+    if artifact is not None and (artifact["chunks_file"] is None or os.path.exists(artifact["chunks_file"])):
+        # Other files with the same content may be edited later on
+        return dict(artifact, template=template_file)
+
+    cache_file = os.path.join(cache_dir, f"{key}.jsonl") if cache_dir else None
+    artifact = None
+    if cache_file and os.path.exists(cache_file):
+        try:
+            with open(cache_file, 'r', encoding='utf-8') as f:
+                header = json.loads(f.readline())
+            if header.get("version") == ARTIFACT_VERSION and header.get("hash") == key:
+                artifact = dict(header, template=template_file, chunks_file=cache_file)
+        except (OSError, ValueError, AttributeError):
+            artifact = None
+
+    if artifact is None:
+        artifact = {"version": ARTIFACT_VERSION, "hash": key, "jinja": False, "variables": [], "template": template_file, "chunks_file": None}
+        chunks = iter_template_chunks(read_template_blocks(template_file), artifact)
+        if cache_file:
+            # Written under temporary names first, as batch workers may compile the same template
+            chunks_file = f"{cache_file}.{os.getpid()}.chunks.tmp"
+            temporary_file = f"{cache_file}.{os.getpid()}.tmp"
+            try:
+                os.makedirs(cache_dir, exist_ok=True)
+                with open(chunks_file, 'w', encoding='utf-8') as f:
+                    # Chunks are written a few thousand characters per line, much faster to read back than one line per chunk
+                    line, size = [], 0
+                    for chunk in chunks:
+                        line.append(chunk)
+                        size += len(chunk[1])
+                        if size >= ARTIFACT_LINE_SIZE:
+                            f.write(json.dumps(line) + "\n")
+                            line, size = [], 0
+                    f.write(json.dumps(line) + "\n")
+                # The header is only complete once every chunk was compiled
+                with open(temporary_file, 'w', encoding='utf-8') as f, open(chunks_file, 'r', encoding='utf-8') as chunks_in:
+                    f.write(json.dumps({name: artifact[name] for name in ("version", "hash", "jinja", "variables")}) + "\n")
+                    shutil.copyfileobj(chunks_in, f)
+                os.replace(temporary_file, cache_file)
+                artifact["chunks_file"] = cache_file
+            except OSError as e:
+                # The cache only saves time, the chunks are then compiled again from the template when rendering
+                print(f"⚠️ Cannot cache the compiled template in '{cache_dir}': {e}")
+                if os.path.exists(temporary_file):
+                    os.remove(temporary_file)
+            finally:
+                if os.path.exists(chunks_file):
+                    os.remove(chunks_file)
+        # Without a cache file, the template is only compiled here for its variables
+        for chunk in chunks:
+            pass
+
+    _artifacts[key] = artifact
+    return artifact
+
+def iter_artifact_chunks(artifact: Dict[str, Any]) -> Iterator[List[str]]:
+    """Chunks of an artifact, from memory, read one at a time from its cache file, or compiled again from its template."""
+    if artifact.get("chunks") is not None:
+        yield from artifact["chunks"]
+    elif artifact["chunks_file"]:
+        with open(artifact["chunks_file"], 'r', encoding='utf-8') as f:
+            f.readline()
+            for line in f:
+                yield from json.loads(line)
+    else:
+        yield from iter_template_chunks(read_template_blocks(artifact["template"]), {"jinja": False, "variables": []})
+
+def artifact_source(artifact: Dict[str, Any]) -> str:
+    """Whole template of an artifact, which Jinja2 needs to compile it."""
+    if artifact.get("source") is not None:
+        return artifact["source"]
+    with open(artifact["template"], 'r', encoding='utf-8') as f:
+        return f.read()
+
+def render_artifact(artifact: Dict[str, Any], values: Dict[str, Any], voltage_rules: List[Tuple[int, int, str, str]],
+                    voltage_mode: str = "flat", timer: Optional[PhaseTimer] = None) -> str:
+    """Render a style by filling the slots of a compiled template, same output as render_style()."""
+    if artifact["jinja"]:
+        return render_style(artifact_source(artifact), values, voltage_rules, voltage_mode, timer)
+
+    builders = {name: builder for name, start_marker, end_marker, builder in TEMPLATE_SECTIONS}
+    sections = {}
+
+    def build(name):
+        if name not in sections:
+            with timed(timer, f"section:{name}"):
+                sections[name] = builders[name](voltage_rules, voltage_mode)
+        return sections[name]
+
+    with timed(timer, "fill"):
+        return "".join(iter_artifact(artifact, values, build))
+
+def iter_artifact(artifact: Dict[str, Any], values: Dict[str, Any], section_text) -> Iterator[str]:
+    """Yield the pieces of a style by filling the slots of a compiled template, sections coming from section_text(name)."""
+    for kind, value in iter_artifact_chunks(artifact):
+        if kind == "text":
+            yield value
+        elif kind == "var":
+            # Undefined variables render as an empty string, like in Jinja2
+            yield str(values[value]) if value in values else ""
+        else:
+            yield section_text(value)
+
+def write_style(output_file: str, artifact: Dict[str, Any], values: Dict[str, Any], voltage_rules: List[Tuple[int, int, str, str]],
+                voltage_mode: str = "flat", timer: Optional[PhaseTimer] = None) -> int:
+    """Render a style straight to a file, same output as render_artifact(), returning its size in bytes.
+
+    The chunks of the artifact are read and written one at a time and each section
+    is built when reached, so memory is bounded by the largest generated section,
+    whatever the size of the template. Templates rendered with Jinja2 are the
+    exception, Jinja2 needing the whole template to compile it.
+    """
+    builders = {name: builder for name, start_marker, end_marker, builder in TEMPLATE_SECTIONS}
+
+    def build(name):
+        with timed(timer, f"section:{name}"):
+            return builders[name](voltage_rules, voltage_mode)
+
+    with timed(timer, "write"):
+        os.makedirs(os.path.dirname(output_file) or ".", exist_ok=True)
+        # Written under a temporary name first, so that a failing render leaves the previous style in place
+        temporary_file = f"{output_file}.{os.getpid()}.tmp"
+        try:
+            with open(temporary_file, 'w', encoding='utf-8') as f:
+                if artifact["jinja"]:
+                    with timed(timer, "jinja_compile"):
+                        import jinja2
+                        template = jinja2.Environment().from_string(process_template(artifact_source(artifact), voltage_rules, voltage_mode, timer))
+                    f.writelines(template.generate(**values))
+                else:
+                    f.writelines(iter_artifact(artifact, values, build))
+            os.replace(temporary_file, output_file)
+        except BaseException:
+            if os.path.exists(temporary_file):
+                os.remove(temporary_file)
+            raise
+    return os.path.getsize(output_file)
+
+def streamable(optimizations: List[str], inventory: Any = None, split_layers: bool = False) -> bool:
+    """Whether a style can be written as it is rendered, no pass needing the whole of it."""
+    return not optimizations and inventory is None and not split_layers
+
+def density_values(density_score: float) -> Dict[str, Any]:
+    """Style values between the default (score 0) and dense (score 1) presets for a grid density score."""
+    values = DEFAULT_VALUES.copy()
+    for var, default_value in DEFAULT_VALUES.items():
+        dense_value = DENSE_VALUES.get(var, default_value)
+        if var in DENSITY_ZOOM_GATES:
+            sparse_zoom, dense_zoom = DENSITY_ZOOM_GATES[var]
+            values[var] = round(sparse_zoom + (dense_zoom - sparse_zoom) * density_score)
+        elif isinstance(default_value, (int, float)) and default_value != dense_value:
+            # Widths and sizes move in half pixel steps
+            value = round((default_value + (dense_value - default_value) * density_score) * 2) / 2
+            values[var] = int(value) if value.is_integer() else value
+    return values
+
+def quantize_zoom_variables(values: Dict[str, Any], tolerance: float) -> Tuple[Dict[str, Any], List[str]]:
+    """Snap nearly equal _low/_mid/_high values to a shared value, so that their zoom bands can share one rule.
+
+    Consecutive zoom bands whose values all lie within the tolerance take the most
+    common of their values (the largest one on a tie).
+    """
+    values = values.copy()
+    changes = []
+    for var in list(values):
+        if not var.endswith("_low"):
+            continue
+        band_vars = [var, var[:-4] + "_mid", var[:-4] + "_high"]
+        if not all(isinstance(values.get(band_var), (int, float)) for band_var in band_vars):
+            continue
+
+        clusters = [[band_vars[0]]]
+        for band_var in band_vars[1:]:
+            cluster_values = [values[v] for v in clusters[-1]] + [values[band_var]]
+            if max(cluster_values) - min(cluster_values) <= tolerance:
+                clusters[-1].append(band_var)
+            else:
+                clusters.append([band_var])
+
+        for cluster in clusters:
+            cluster_values = [values[v] for v in cluster]
+            shared = max(cluster_values, key=lambda value: (cluster_values.count(value), value))
+            for band_var in cluster:
+                if values[band_var] != shared:
+                    changes.append(f"{band_var}: {values[band_var]} -> {shared}")
+                    values[band_var] = shared
+    return values, changes
+
+def density_report_file(output_file: str) -> str:
+    """Where the density statistics of a style are saved."""
+    return os.path.splitext(output_file)[0] + ".density.json"
+
+def finish_style(result: str, optimizations: List[str], inventory: Any = None, split_layers: bool = False,
+                 timer: Optional[PhaseTimer] = None) -> Tuple[str, List[Dict[str, Any]], Optional[List[Dict[str, Any]]]]:
+    """Run the optimisation passes over a rendered style and cut it into layers when asked.
+
+    The layers are cut before minifying, which drops the comments marking them, and
+    each layer is then minified on its own.
+    """
+    reports = []
+    if optimizations or inventory is not None:
+        with timed(timer, "optimize"):
+            from mapcss_optimize import optimize_style
+            result, reports = optimize_style(result, [name for name in optimizations if name != "minify"], inventory)
+
+    layers = None
+    if split_layers:
+        with timed(timer, "split_layers"):
+            from mapcss_layers import split_layers as split
+            layers = split(result)
+
+    if "minify" in optimizations:
+        with timed(timer, "minify"):
+            from mapcss_layers import annotate_layer
+            from mapcss_optimize import minify_stylesheet
+            result, report = minify_stylesheet(result)
+            reports.append(report)
+            for layer in layers or []:
+                text, layer_report = minify_stylesheet(layer["text"])
+                layer["rules"] = layer_report["rules_after"]
+                layer["text"] = annotate_layer(layer["layer"], layer["rules"], text)
+    return result, reports, layers
+
+def style_statistics(text: Optional[str], output_file: Optional[str] = None) -> Dict[str, int]:
+    """Rules, selectors and bytes of a rendered style, as reported by --profile, read back from output_file when streamed."""
+    from mapcss_engine import parse_stylesheet
+    if text is None:
+        with open(output_file, 'r', encoding='utf-8') as f:
+            text = f.read()
+    stylesheet = parse_stylesheet(text)
+    return {
+        "rules": len(stylesheet.object_rules),
+        "selectors": sum(len(rule.selectors) for rule in stylesheet.object_rules),
+        "bytes": len(text.encode('utf-8')),
+    }
+
+def name_layers(name: str, output_file: str, layers: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Give layers the variant name and file each one is served and written as."""
+    from mapcss_layers import layer_file
+    for layer in layers:
+        layer["name"] = f"{name}-{layer['layer']}"
+        layer["output"] = layer_file(output_file, layer["layer"])
+    return layers
+
+def parse_voltage_rules(rules: Any) -> List[Tuple[int, int, str, str]]:
+    """Read voltage rules from a batch configuration (preset name or list of rules)."""
+    if isinstance(rules, str):
+        if rules not in PRESETS:
+            raise ValueError(f"unknown voltage rules preset '{rules}'")
+        return PRESETS[rules][1]
+
+    voltage_rules = []
+    for rule in rules:
+        if len(rule) != 3 and len(rule) != 4:
+            raise ValueError(f"voltage rule {rule} must be [lower, upper, color, halo]")
+        lower = rule[0] if rule[0] is None or rule[0] >= 0 else None
+        upper = rule[1] if rule[1] is None or rule[1] >= 0 else None
+        halo = rule[3] if len(rule) == 4 else "#FFFFFF"
+        voltage_rules.append((lower, upper, rule[2], halo))
+    return voltage_rules
+
+def parse_optimizations(optimizations: Any) -> List[str]:
+    """Read optimisation pass names from a comma separated string or a list."""
+    if isinstance(optimizations, str):
+        optimizations = [name.strip() for name in optimizations.split(",") if name.strip()]
+    if not optimizations:
+        return []
+
+    from mapcss_optimize import OPTIMIZATIONS
+    unknown = [name for name in optimizations if name not in OPTIMIZATIONS]
+    if unknown:
+        raise ValueError(f"unknown optimization '{unknown[0]}' (use one of {', '.join(OPTIMIZATIONS)})")
+    return list(optimizations)
+
+def resolve_variant(variant: Dict[str, Any], config: Dict[str, Any], config_dir: str) -> Dict[str, Any]:
+    """Turn one batch variant entry into a self-contained render job."""
+    name = variant.get("name")
+    if not name:
+        raise ValueError("every variant needs a 'name'")
+
+    # With density_from, the sizes are derived from the extract and the base preset only gives the voltage rules
+    density_from = variant.get("density_from", config.get("density_from"))
+    base = variant.get("base", config.get("base", "default"))
+    if base not in PRESETS:
+        raise ValueError(f"variant '{name}': unknown base preset '{base}' (use one of {', '.join(PRESETS)})")
+    if density_from:
+        density_from = os.path.join(config_dir, density_from)
+    base_values, base_voltage_rules = PRESETS[base]
+
+    overrides = dict(config.get("variables", {}))
+    overrides.update(variant.get("variables", {}))
+    values = base_values.copy()
+    values.update(overrides)
+
+    if "voltage_rules" in variant:
+        voltage_rules = parse_voltage_rules(variant["voltage_rules"])
+    elif "voltage_rules" in config:
+        voltage_rules = parse_voltage_rules(config["voltage_rules"])
+    else:
+        voltage_rules = base_voltage_rules
+    voltage_rules, notes = canonical_voltage_rules(voltage_rules)
+    for note in notes:
+        print(f"⚠️ Variant '{name}': {note}")
+
+    voltage_mode = variant.get("voltage_mode", config.get("voltage_mode", "flat"))
+    if voltage_mode not in VOLTAGE_MODES:
+        raise ValueError(f"variant '{name}': unknown voltage mode '{voltage_mode}' (use one of {', '.join(VOLTAGE_MODES)})")
+
+    quantize_widths = variant.get("quantize_widths", config.get("quantize_widths"))
+    if quantize_widths is not None and (isinstance(quantize_widths, bool) or not isinstance(quantize_widths, (int, float)) or quantize_widths < 0):
+        raise ValueError(f"variant '{name}': quantize_widths must be a number of 0 or more, not {quantize_widths!r}")
+    split_layers = variant.get("split_layers", config.get("split_layers", False))
+
+    try:
+        optimizations = parse_optimizations(variant.get("optimize", config.get("optimize", [])))
+    except ValueError as e:
+        raise ValueError(f"variant '{name}': {e}")
+
+    tree_shake = variant.get("tree_shake", config.get("tree_shake"))
+    if tree_shake:
+        tree_shake = os.path.join(config_dir, tree_shake)
+
+    template_file = os.path.join(config_dir, variant.get("template", config.get("template", "map_your_grid_template.mapcss")))
+    output_dir = os.path.join(config_dir, config.get("output_dir", "."))
+    output_file = os.path.join(output_dir, variant.get("output", f"{name}.mapcss"))
+
+    return {
+        "name": name,
+        "base": base,
+        "template": template_file,
+        "output": output_file,
+        "values": values,
+        "voltage_rules": voltage_rules,
+        "voltage_mode": voltage_mode,
+        "optimize": optimizations,
+        "quantize_widths": quantize_widths,
+        "split_layers": split_layers,
+        "tree_shake": tree_shake,
+        "inventory": None,
+        "density_from": density_from,
+        "density": None,
+        "overrides": overrides,
+        "cache_dir": None,
+        "profile": False,
+    }
+
+def prepare_job(job: Dict[str, Any], timer: Optional[PhaseTimer] = None) -> Tuple[Dict[str, Any], Dict[str, Any], List[str]]:
+    """Compiled template artifact and variable values of a batch variant, with the widths changed by quantize_widths."""
+    with timed(timer, "load_artifact"):
+        artifact = load_template_artifact(job["template"], job["cache_dir"])
+    unknown_vars = sorted(set(job["values"]) - set(artifact["variables"]) - set(DEFAULT_VALUES))
+    if unknown_vars:
+        raise ValueError(f"unknown variables: {', '.join(unknown_vars)}")
+
+    values, changes = job["values"], []
+    if job["quantize_widths"] is not None:
+        values, changes = quantize_zoom_variables(values, job["quantize_widths"])
+    return artifact, values, changes
+
+def render_job(job: Dict[str, Any], timer: Optional[PhaseTimer] = None) -> Tuple[str, List[Dict[str, Any]], Optional[List[Dict[str, Any]]], List[str]]:
+    """Render the style of a batch variant, returning it with the reports of its optimisation passes, its layers and its quantised widths."""
+    artifact, values, changes = prepare_job(job, timer)
+    result = render_artifact(artifact, values, job["voltage_rules"], job["voltage_mode"], timer)
+    result, optimization_reports, layers = finish_style(result, job["optimize"], job["inventory"], job["split_layers"], timer)
+    if layers is not None:
+        name_layers(job["name"], job["output"], layers)
+    return result, optimization_reports, layers, changes
+
+def render_variant(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Render and write one batch variant, returning its summary entry."""
+    start = time.perf_counter()
+    summary = {"name": job["name"], "base": job["base"], "template": job["template"], "output": job["output"]}
+    timer = PhaseTimer() if job["profile"] else None
+    try:
+        if streamable(job["optimize"], job["inventory"], job["split_layers"]):
+            artifact, values, changes = prepare_job(job, timer)
+            size = write_style(job["output"], artifact, values, job["voltage_rules"], job["voltage_mode"], timer)
+            result, optimization_reports = None, []
+        else:
+            result, optimization_reports, layers, changes = render_job(job, timer)
+            size = len(result.encode('utf-8'))
+
+            with timed(timer, "write"):
+                os.makedirs(os.path.dirname(job["output"]) or ".", exist_ok=True)
+                with open(job["output"], 'w', encoding='utf-8') as f:
+                    f.write(result)
+
+                if layers is not None:
+                    summary["layers"] = []
+                    for layer in layers:
+                        with open(layer["output"], 'w', encoding='utf-8') as f:
+                            f.write(layer["text"])
+                        summary["layers"].append({"layer": layer["layer"], "output": layer["output"], "rules": layer["rules"], "needs": layer["needs"]})
+
+        summary["status"] = "ok"
+        summary["bytes"] = size
+        summary["voltage_rules"] = len(job["voltage_rules"])
+        if job["voltage_mode"] == "tree":
+            summary["voltage_conditions_per_way"] = voltage_selector_cost(job["voltage_rules"])
+        if optimization_reports:
+            summary["optimizations"] = optimization_reports
+        if changes:
+            summary["quantized"] = changes
+        if job["density"] is not None:
+            with open(density_report_file(job["output"]), 'w', encoding='utf-8') as f:
+                json.dump(job["density"], f, indent=2)
+            summary["density_score"] = job["density"]["density_score"]
+        if timer is not None:
+            summary["profile"] = {"phases": timer.as_dict(), "seconds": round(sum(timer.phases.values()), 6), "output": style_statistics(result, job["output"])}
+    except Exception as e:
+        summary["status"] = "error"
+        summary["error"] = str(e)
+    summary["seconds"] = round(time.perf_counter() - start, 4)
+    return summary
+
+def load_batch_jobs(config_file: str, cache_dir: Optional[str] = DEFAULT_CACHE_DIR,
+                    extracts: Optional[Dict[Tuple[str, str, int], Any]] = None) -> Tuple[Dict[str, Any], str, List[Dict[str, Any]]]:
+    """Read a batch configuration into render jobs, with their templates compiled and their extracts scanned.
+
+    Extract scans are kept in extracts, by kind, path and modification time, so that
+    callers rebuilding the same configuration again do not scan them twice.
+    """
+    with open(config_file, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    config_dir = os.path.dirname(os.path.abspath(config_file))
+    extracts = extracts if extracts is not None else {}
+
+    render_jobs = [resolve_variant(variant, config, config_dir) for variant in config.get("variants", [])]
+    names = [job["name"] for job in render_jobs]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(f"duplicate variant names: {', '.join(duplicates)}")
+
+    # Templates are compiled once here, the workers then load the cached artifacts
+    for template_file in sorted({job["template"] for job in render_jobs}):
+        if os.path.exists(template_file):
+            load_template_artifact(template_file, cache_dir)
+    for job in render_jobs:
+        job["cache_dir"] = cache_dir
+
+    # Every extract is only scanned once, whatever the number of variants using it
+    for job in render_jobs:
+        if job["tree_shake"]:
+            key = ("inventory", job["tree_shake"], os.stat(job["tree_shake"]).st_mtime_ns)
+            if key not in extracts:
+                from mapcss_optimize import collect_tag_inventory
+                print(f"📥 Scanning '{job['tree_shake']}' for tree-shaking...")
+                extracts[key] = collect_tag_inventory(job["tree_shake"])
+            job["inventory"] = extracts[key]
+
+        if job["density_from"]:
+            key = ("density", job["density_from"], os.stat(job["density_from"]).st_mtime_ns)
+            if key not in extracts:
+                from osm_density import collect_density_statistics
+                print(f"📥 Measuring the grid density of '{job['density_from']}'...")
+                extracts[key] = collect_density_statistics(job["density_from"])
+            job["density"] = extracts[key]
+            job["values"] = density_values(job["density"]["density_score"])
+            job["values"].update(job["overrides"])
+
+    return config, config_dir, render_jobs
+
+def run_batch(config_file: str, jobs: Optional[int] = None, cache_dir: Optional[str] = DEFAULT_CACHE_DIR, profile_file: Optional[str] = None) -> int:
+    """Render every variant of a batch configuration in a process pool and write a summary report."""
+    start = time.perf_counter()
+    config, config_dir, render_jobs = load_batch_jobs(config_file, cache_dir)
+    for job in render_jobs:
+        job["profile"] = profile_file is not None
+
+    print(f"⚙️ Rendering {len(render_jobs)} style variants...")
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        results = list(executor.map(render_variant, render_jobs))
+
+    failed = [result for result in results if result["status"] != "ok"]
+    report = {
+        "config": os.path.abspath(config_file),
+        "variants": len(results),
+        "succeeded": len(results) - len(failed),
+        "failed": len(failed),
+        "seconds": round(time.perf_counter() - start, 4),
+        "results": results,
+    }
+
+    report_file = os.path.join(config_dir, config.get("report", os.path.join(config.get("output_dir", "."), "build-report.json")))
+    os.makedirs(os.path.dirname(report_file) or ".", exist_ok=True)
+    with open(report_file, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+
+    for result in results:
+        if result["status"] == "ok":
+            print(f"✅ {result['name']}: {result['output']} ({result['bytes']} bytes)")
+            for layer in result.get("layers", []):
+                print(f"   {layer['layer']}: {layer['output']} ({layer['rules']} rules)")
+            for change in result.get("quantized", []):
+                print(f"   📏 {change}")
+        else:
+            print(f"❌ {result['name']}: {result['error']}")
+    print(f"\n📊 {report['succeeded']}/{report['variants']} variants built in {report['seconds']}s, report saved as '{report_file}'")
+
+    if profile_file:
+        profile = {"config": os.path.abspath(config_file), "variants": [dict(name=result["name"], **result["profile"]) for result in results if "profile" in result]}
+        with open(profile_file, 'w', encoding='utf-8') as f:
+            json.dump(profile, f, indent=2)
+        print(f"⏱️ Phase timings saved as '{profile_file}'")
+
+    return 1 if failed else 0
+
+def make_style_handler(styles: Dict[str, Dict[str, Any]]):
+    """HTTP handler serving the styles of a watched batch, answering conditional requests with 304."""
+    import email.utils
+    import http.server
+
+    class StyleRequestHandler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.respond(send_body=True)
+
+        def do_HEAD(self):
+            self.respond(send_body=False)
+
+        def respond(self, send_body: bool):
+            path = self.path.split("?", 1)[0].strip("/")
+            if not path:
+                body = "".join(f"/{name}.mapcss\n" for name in sorted(styles)).encode('utf-8')
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if send_body:
+                    self.wfile.write(body)
+                return
+
+            style = styles.get(path[:-len(".mapcss")] if path.endswith(".mapcss") else path)
+            if style is None:
+                self.send_error(404, f"no style named '{path}'")
+                return
+
+            if_none_match = self.headers.get("If-None-Match")
+            if_modified_since = self.headers.get("If-Modified-Since")
+            if if_none_match is not None:
+                not_modified = if_none_match.strip() == "*" or style["etag"] in [tag.strip() for tag in if_none_match.split(",")]
+            elif if_modified_since is not None:
+                try:
+                    not_modified = email.utils.parsedate_to_datetime(if_modified_since).timestamp() >= style["last_modified"]
+                except (TypeError, ValueError):
+                    not_modified = False
+            else:
+                not_modified = False
+
+            self.send_response(304 if not_modified else 200)
+            self.send_header("ETag", style["etag"])
+            self.send_header("Last-Modified", email.utils.formatdate(style["last_modified"], usegmt=True))
+            self.send_header("Cache-Control", "no-cache")
+            if not not_modified:
+                self.send_header("Content-Type", "text/css; charset=utf-8")
+                self.send_header("Content-Length", str(len(style["body"])))
+            self.end_headers()
+            if send_body and not not_modified:
+                self.wfile.write(style["body"])
+
+        def log_message(self, format, *args):
+            pass
+
+    return StyleRequestHandler
+
+def job_fingerprint(job: Dict[str, Any]) -> str:
+    """Hash of everything a variant's style depends on."""
+    extract_stamps = [os.stat(path).st_mtime_ns for path in (job["tree_shake"], job["density_from"]) if path]
+    inputs = [template_file_hash(job["template"]), job["output"], job["values"], job["voltage_rules"], job["voltage_mode"], job["optimize"], job["quantize_widths"],
+              job["split_layers"], job["tree_shake"], extract_stamps]
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+def watch_batch(config_file: str, host: str = "127.0.0.1", port: int = 8765, cache_dir: Optional[str] = DEFAULT_CACHE_DIR, interval: float = 0.05) -> int:
+    """Serve the variants of a batch configuration over HTTP, regenerating the affected ones whenever an input file changes."""
+    import http.server
+    import threading
+
+    styles: Dict[str, Dict[str, Any]] = {}
+    fingerprints: Dict[str, str] = {}
+    extracts: Dict[Tuple[str, str, int], Any] = {}
+
+    server = http.server.ThreadingHTTPServer((host, port), make_style_handler(styles))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"🌐 Serving styles on http://{host}:{port}/ - add http://{host}:{port}/<variant>.mapcss as a style source in JOSM")
+    print("👀 Watching the configuration, templates and extracts for changes (Ctrl+C to stop)...")
+
+    def stamps(paths: List[str]) -> Dict[str, Tuple[int, int]]:
+        result = {}
+        for path in paths:
+            try:
+                stat = os.stat(path)
+                result[path] = (stat.st_mtime_ns, stat.st_size)
+            except OSError:
+                result[path] = None
+        return result
+
+    watched = {}
+    try:
+        while True:
+            if stamps(list(watched)) == watched and watched:
+                time.sleep(interval)
+                continue
+
+            start = time.perf_counter()
+            paths = [config_file]
+            try:
+                render_jobs = load_batch_jobs(config_file, cache_dir, extracts)[2]
+            except (OSError, ValueError) as e:
+                print(f"❌ {config_file}: {e}")
+                watched = stamps(paths)
+                continue
+
+            for job in render_jobs:
+                paths.extend(path for path in (job["template"], job["tree_shake"], job["density_from"]) if path)
+                try:
+                    fingerprint = job_fingerprint(job)
+                    if fingerprints.get(job["name"]) == fingerprint:
+                        continue
+                    result, optimization_reports, layers, changes = render_job(job)
+                    outputs = [{"name": job["name"], "output": job["output"], "text": result}] + (layers or [])
+                except Exception as e:
+                    print(f"❌ {job['name']}: {e}")
+                    continue
+
+                for output in outputs:
+                    body = output["text"].encode('utf-8')
+                    etag = '"' + hashlib.sha256(body).hexdigest()[:20] + '"'
+                    previous = styles.get(output["name"])
+                    if previous is None or previous["etag"] != etag:
+                        os.makedirs(os.path.dirname(output["output"]) or ".", exist_ok=True)
+                        with open(output["output"], 'w', encoding='utf-8') as f:
+                            f.write(output["text"])
+                        # Last-Modified has a one second resolution, keep it increasing for quick successive saves
+                        last_modified = int(time.time()) if previous is None else max(int(time.time()), previous["last_modified"] + 1)
+                        styles[output["name"]] = {"body": body, "etag": etag, "last_modified": last_modified, "variant": job["name"]}
+                        print(f"🔄 {output['name']}: regenerated in {(time.perf_counter() - start) * 1000:.0f} ms")
+                        if output["name"] == job["name"]:
+                            for report in optimization_reports:
+                                print(f"   🔧 {report['optimization']}: {report['summary']}")
+                            for change in changes:
+                                print(f"   📏 {change}")
+                for name in [name for name, style in styles.items() if style["variant"] == job["name"]]:
+                    if name not in {output["name"] for output in outputs}:
+                        del styles[name]
+                fingerprints[job["name"]] = fingerprint
+
+            variants = {job["name"] for job in render_jobs}
+            for name in [name for name, style in styles.items() if style["variant"] not in variants]:
+                del styles[name]
+            for name in set(fingerprints) - variants:
+                del fingerprints[name]
+            watched = stamps(paths)
+    except KeyboardInterrupt:
+        print("\n👋 Stopped watching.")
+    finally:
+        server.shutdown()
+    return 0
+
+# Template and voltage table sizes, in rules, run by --benchmark
+BENCHMARK_SIZES = [10, 100, 1000]
+
+# Renderers timed by --benchmark, as separate cases: the compiled template artifact and Jinja2
+BENCHMARK_RENDERERS = ["artifact", "jinja"]
+
+# Slowdowns of a case smaller than this many seconds are within the noise of a shared machine and never count as regressions
+BENCHMARK_NOISE_SECONDS = 0.02
+
+def benchmark_voltage_rules(count: int) -> List[Tuple[int, int, str, str]]:
+    """Voltage table of count rules: the unknown voltage rule and contiguous ranges spread from 1 kV to 1000 kV."""
+    bounds = []
+    for i in range(max(count - 2, 1)):
+        bounds.append(max(round(1000 * 1000 ** (i / max(count - 3, 1))), bounds[-1] + 1 if bounds else 0))
+    ranges = list(zip([None] + bounds, bounds + [None]))
+    rules = [(None, None, "#FFFFFF", "#000000")]
+    for i, (lower, upper) in enumerate(ranges):
+        rules.append((lower, upper, f"#{(i * 2654435761) % 0xFFFFFF:06X}", "#FFFFFF"))
+    return rules
+
+def benchmark_template(template_content: str, rules: int) -> str:
+    """Template with rules extra rules using its variables, to measure how rendering scales with template size."""
+    variables = [var for var in extract_vars_from_template(template_content) if var in DEFAULT_VALUES] or ["line_color"]
+    bases = ["node|z{{icon_hidden_max_zoom}}-[power=tower]", "way|z{{casing_min_zoom}}-19.power_segment_current", "area[power=substation]"]
+    extra = ["\n/* Benchmark rules */\n"]
+    for i in range(rules):
+        var = variables[i % len(variables)]
+        extra.append(f"{bases[i % len(bases)]}[benchmark={i}] {{ {'color' if 'color' in var else 'width'}: {{{{{var}}}}}; }}\n")
+    return template_content + "".join(extra)
+
+def benchmark_case(template_content: str, voltage_rules: List[Tuple[int, int, str, str]], voltage_mode: str, repeat: int,
+                   renderer: str = "artifact") -> Dict[str, Any]:
+    """Median time of a style generation with one renderer over repeat runs, with the statistics of the rendered style.
+
+    Like timeit, garbage collection is off while timing and a first untimed run warms
+    up imports and caches. The median of the run totals is the time compared to
+    baselines, the phases being reported to tell where the time goes.
+    """
+    import gc
+    import statistics
+    import tempfile
+
+    runs = []
+    for _ in range(repeat + 1):
+        gc.collect()
+        gc.disable()
+        timer = PhaseTimer()
+        if renderer == "artifact":
+            with timed(timer, "compile_template"):
+                artifact = compile_template(template_content)
+            result = render_artifact(artifact, DEFAULT_VALUES, voltage_rules, voltage_mode, timer)
+        else:
+            result = render_style(template_content, DEFAULT_VALUES, voltage_rules, voltage_mode, timer)
+        with timed(timer, "write"):
+            with tempfile.TemporaryFile("w", encoding="utf-8") as f:
+                f.write(result)
+        gc.enable()
+        runs.append(timer.phases)
+
+    runs = runs[1:]
+    phases = {name: round(statistics.median(run.get(name, 0.0) for run in runs), 6) for name in runs[0]}
+    totals = [round(sum(run.values()), 6) for run in runs]
+    return {"renderer": renderer, "phases": phases, "seconds": round(statistics.median(totals), 6), "runs": totals,
+            "output": style_statistics(result)}
+
+def compare_benchmark(cases: Dict[str, Dict[str, Any]], baseline: Dict[str, Any], threshold: float) -> List[Dict[str, Any]]:
+    """Cases whose median time is slower than in the baseline by more than threshold (0.25 = 25%) and by more than the noise floor."""
+    regressions = []
+    for name, case in cases.items():
+        previous = baseline.get("cases", {}).get(name, {}).get("seconds")
+        if previous is None:
+            continue
+        seconds = case["seconds"]
+        if seconds - previous > max(previous * threshold, BENCHMARK_NOISE_SECONDS):
+            regressions.append({"case": name, "seconds": seconds, "baseline": previous,
+                                "change": round(seconds / previous - 1, 3) if previous else None})
+    return regressions
+
+def run_benchmark(template_file: str, sizes: List[int], voltage_modes: List[str], repeat: int = 5, baseline_file: Optional[str] = None,
+                  save_baseline: Optional[str] = None, threshold: float = 0.25, report_file: Optional[str] = None) -> int:
+    """Time the generator phases on scaled templates and voltage tables, comparing them to a stored baseline."""
+    with open(template_file, 'r', encoding='utf-8') as f:
+        template_content = f.read()
+
+    cases = {}
+    print(f"⏱️ Benchmarking '{template_file}' with {', '.join(map(str, sizes))} extra rules and voltage rules ({repeat} runs each)...")
+    print(f"\n{'Case':40} {'Seconds':>9} {'Rules':>7} {'Selectors':>10} {'Bytes':>10}  Slowest phase")
+    for voltage_mode in voltage_modes:
+        for kind in ("template", "voltage"):
+            for size in sizes:
+                for renderer in BENCHMARK_RENDERERS:
+                    name = f"{kind}-{size}/{voltage_mode}/{renderer}"
+                    if kind == "template":
+                        case = benchmark_case(benchmark_template(template_content, size), DEFAULT_VOLTAGE_RULES, voltage_mode, repeat, renderer)
+                    else:
+                        case = benchmark_case(template_content, benchmark_voltage_rules(size), voltage_mode, repeat, renderer)
+                    cases[name] = case
+                    slowest = max(case["phases"], key=case["phases"].get)
+                    output = case["output"]
+                    print(f"{name:40} {case['seconds']:>9.4f} {output['rules']:>7} {output['selectors']:>10} {output['bytes']:>10}  {slowest} ({case['phases'][slowest]:.4f}s)")
+
+    report = {"template": os.path.abspath(template_file), "repeat": repeat, "cases": cases}
+    status = 0
+    if baseline_file:
+        with open(baseline_file, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare_benchmark(cases, baseline, threshold)
+        report["baseline"] = os.path.abspath(baseline_file)
+        report["regressions"] = regressions
+        if regressions:
+            status = 1
+            print(f"\n❌ {len(regressions)} cases are more than {threshold:.0%} and {BENCHMARK_NOISE_SECONDS * 1000:.0f} ms slower than in '{baseline_file}':")
+            for regression in regressions:
+                print(f"   {regression['case']}: {regression['baseline']:.4f}s → {regression['seconds']:.4f}s")
+        else:
+            print(f"\n✅ No case is more than {threshold:.0%} and {BENCHMARK_NOISE_SECONDS * 1000:.0f} ms slower than in '{baseline_file}'")
+
+    if save_baseline:
+        with open(save_baseline, 'w', encoding='utf-8') as f:
+            json.dump({"template": report["template"], "repeat": repeat, "cases": cases}, f, indent=2)
+        print(f"💾 Baseline saved as '{save_baseline}'")
+    if report_file:
+        with open(report_file, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Benchmark report saved as '{report_file}'")
+    return status
+
 def main():
+    parser = argparse.ArgumentParser(description="Generate customized MapCSS styles for power grid mapping in JOSM.")
+    parser.add_argument("template", nargs="?", help="MapCSS template to use (asked interactively when omitted)")
+    parser.add_argument("--batch", metavar="CONFIG", help="render every variant listed in a JSON batch configuration, without prompts")
+    parser.add_argument("--watch", metavar="CONFIG", help="serve the variants of a batch configuration over HTTP and regenerate them whenever an input changes")
+    parser.add_argument("--host", default="127.0.0.1", help="address to serve the styles on with --watch (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8765, help="port to serve the styles on with --watch (default: 8765)")
+    parser.add_argument("--voltage-mode", choices=VOLTAGE_MODES, default=None, help="how power line voltage selectors are emitted (default: flat, every mode with --benchmark)")
+    parser.add_argument("--optimize", default="", metavar="PASSES", help="comma separated optimisation passes to run on the rendered style, e.g. expand-regex")
+    parser.add_argument("--quantize-widths", type=float, metavar="TOLERANCE", help="give _low/_mid/_high sizes and widths differing by at most TOLERANCE the same value, so that --optimize merge-zoom-bands can merge their rules (it merges none of the preset rules otherwise)")
+    parser.add_argument("--split-layers", action="store_true", help="also write one style per layer (nodes, areas, lines, circuits, overlays) next to the output")
+    parser.add_argument("--tree-shake", metavar="EXTRACT", help="drop the rules which cannot match anything in this OSM extract (.osm, .osm.gz, .osm.bz2 or .pbf)")
+    parser.add_argument("--density-from", metavar="EXTRACT", help="derive the base style from the power grid density of this OSM extract instead of asking")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help=f"where compiled templates are cached (default: {DEFAULT_CACHE_DIR})")
+    parser.add_argument("--no-cache", action="store_true", help="compile the template on every run instead of caching it")
+    parser.add_argument("--jobs", type=int, default=None, help="number of worker processes for --batch (default: CPU count)")
+    parser.add_argument("--profile", metavar="FILE", help="save the time spent in each phase and the rule, selector and byte counts of the output as JSON")
+    parser.add_argument("--benchmark", action="store_true", help="time the generator phases on the template scaled up with extra rules and voltage rules")
+    parser.add_argument("--benchmark-sizes", default=",".join(map(str, BENCHMARK_SIZES)), metavar="SIZES", help="comma separated numbers of extra rules and voltage rules to benchmark (default: 10,100,1000)")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per benchmark case, the median time is kept (default: 5)")
+    parser.add_argument("--baseline", metavar="FILE", help="benchmark results to compare to, failing on regressions")
+    parser.add_argument("--save-baseline", metavar="FILE", help="save the benchmark results as a baseline for later runs")
+    parser.add_argument("--threshold", type=float, default=0.25, help="slowdown of a case over the baseline counted as a regression (default: 0.25 for 25%%)")
+    args = parser.parse_args()
+
+    try:
+        optimizations = parse_optimizations(args.optimize)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.quantize_widths is not None and args.quantize_widths < 0:
+        parser.error(f"--quantize-widths must be 0 or more, not {args.quantize_widths:g}")
+    if args.repeat < 1:
+        parser.error(f"--repeat must be 1 or more, not {args.repeat}")
+
+    if args.watch:
+        sys.exit(watch_batch(args.watch, args.host, args.port, None if args.no_cache else args.cache_dir))
+
+    if args.benchmark:
+        try:
+            sizes = [int(size) for size in args.benchmark_sizes.split(",") if size.strip()]
+        except ValueError:
+            parser.error(f"invalid --benchmark-sizes '{args.benchmark_sizes}', use numbers such as 10,100,1000")
+        voltage_modes = [args.voltage_mode] if args.voltage_mode else VOLTAGE_MODES
+        sys.exit(run_benchmark(args.template or "map_your_grid_template.mapcss", sizes, voltage_modes, args.repeat,
+                               args.baseline, args.save_baseline, args.threshold, args.profile))
+
+    args.voltage_mode = args.voltage_mode or "flat"
+
+    if args.batch:
+        sys.exit(run_batch(args.batch, args.jobs, None if args.no_cache else args.cache_dir, args.profile))
+
     print("╔════════════════════════════════════════════════════════════╗")
     print("║ 🎨 Welcome to ColorMyMap! -  Power Grid Style Generator 🎨 ║")
     print("╚════════════════════════════════════════════════════════════╝")
@@ -411,8 +1722,8 @@ def main():
     print("mapping electrical transmission networks in JOSM.\n")
     
     # Check if template file exists
-    if len(sys.argv) > 1:
-        template_file = sys.argv[1]
+    if args.template:
+        template_file = args.template
     else:
         template_file = input("📄 Which template should we use? (default: map_your_grid_template.mapcss): ").strip() or "map_your_grid_template.mapcss"
     
@@ -420,33 +1731,52 @@ def main():
         print(f"❌ Hmm, I can't find the file '{template_file}'. Please check the path and try again.")
         return
     
-    # Read template file
-    with open(template_file, 'r', encoding='utf-8') as f:
-        template_content = f.read()
-    
-    # Extract variables from template
-    template_vars = extract_vars_from_template(template_content)
+    timer = PhaseTimer() if args.profile else None
+
+    # Compile the template, or load it from the cache, streaming it rather than reading it whole
+    with timed(timer, "load_artifact"):
+        artifact = load_template_artifact(template_file, None if args.no_cache else args.cache_dir)
+    template_vars = [var for var in artifact["variables"] if var not in VOLTAGE_VARIABLES]
     print(f"\n🔍 I found {len(template_vars)} style variables in your template that we can customize!")
     
     # Ask user to choose between Default case, Dense case, or custom values
-    print("\n🎨 First, let's choose a base style for your map:")
-    print("  1️⃣  Default style - Optimized for normal grid density")
-    print("  2️⃣  Dense network style - Better for areas with many power features")
-    print("  3️⃣  Custom style - Customize each setting yourself")
+    choice = 4 if args.density_from else None
+    if choice is None:
+        print("\n🎨 First, let's choose a base style for your map:")
+        print("  1️⃣  Default style - Optimized for normal grid density")
+        print("  2️⃣  Dense network style - Better for areas with many power features")
+        print("  3️⃣  Custom style - Customize each setting yourself")
+        print("  4️⃣  Automatic style - Derived from the grid density of an OSM extract of your region")
     
-    while True:
+    while choice is None:
         try:
-            choice = input("\n👉 Your choice (1-3): ").strip()
-            if choice in ["1", "2", "3"]:
+            choice = input("\n👉 Your choice (1-4): ").strip()
+            if choice in ["1", "2", "3", "4"]:
                 choice = int(choice)
                 break
             else:
-                print("❌ Please enter 1, 2, or 3 to select a style.")
+                print("❌ Please enter 1, 2, 3 or 4 to select a style.")
+                choice = None
         except ValueError:
-            print("❌ Please enter 1, 2, or 3 to select a style.")
+            print("❌ Please enter 1, 2, 3 or 4 to select a style.")
+            choice = None
     
     # Set values based on user choice
-    if choice == 1:  
+    density = None
+    if choice == 4:
+        extract_file = args.density_from or input("📥 Which OSM extract covers your region? (.osm, .osm.gz, .osm.bz2 or .pbf): ").strip()
+        if not os.path.exists(extract_file):
+            print(f"❌ Hmm, I can't find the file '{extract_file}'. Please check the path and try again.")
+            return
+        print(f"\n📥 Measuring the grid density of '{extract_file}'...")
+        from osm_density import collect_density_statistics
+        density = collect_density_statistics(extract_file)
+        values = density_values(density["density_score"])
+        voltage_rules = DEFAULT_VOLTAGE_RULES
+        totals = density["totals"]
+        print(f"📊 {totals['towers']} towers, {totals['poles']} poles, {totals['line_km']} km of lines and {totals['substations']} substations over {density['grid_tiles']} tiles")
+        print(f"✅ Density score {density['density_score']} (0 = default style, 1 = dense network style)")
+    elif choice == 1:  
         values = DEFAULT_VALUES.copy()
         voltage_rules = DEFAULT_VOLTAGE_RULES
         print("\n✅ Great! Using the default style as a base.")
@@ -482,24 +1812,68 @@ def main():
         else:
             print("ℹ️ No voltage rules provided. I'll use the default voltage rules.")
             voltage_rules = DEFAULT_VOLTAGE_RULES
+
+    voltage_rules, notes = canonical_voltage_rules(voltage_rules)
+    for note in notes:
+        print(f"⚠️ Voltage rules: {note}")
     
+    if args.quantize_widths is not None:
+        values, changes = quantize_zoom_variables(values, args.quantize_widths)
+        for change in changes:
+            print(f"📏 {change}")
+
     print("\n⚙️ Processing your template and adding the colors...")
+
+    if args.voltage_mode == "tree":
+        cost = voltage_selector_cost(voltage_rules)
+        print(f"🌳 Voltage conditions evaluated per power way ({cost['voltage_bands']} bands): "
+              f"{cost['tree']['average']} on average, {cost['tree']['max']} at most "
+              f"(flat layout: {cost['flat']['average']} on average, {cost['flat']['max']} at most)")
+
+    inventory = None
+    if args.tree_shake:
+        from mapcss_optimize import collect_tag_inventory
+        print(f"📥 Scanning '{args.tree_shake}' for the tags present in your region...")
+        inventory = collect_tag_inventory(args.tree_shake)
+
+    # Without passes over the whole style, it is rendered as it is written out
+    result, layers = None, None
+    if not streamable(optimizations, inventory, args.split_layers):
+        result = render_artifact(artifact, values, voltage_rules, args.voltage_mode, timer)
+        result, optimization_reports, layers = finish_style(result, optimizations, inventory, args.split_layers, timer)
+        for report in optimization_reports:
+            print(f"🔧 {report['optimization']}: {report['summary']}")
     
-    # Process the template to replace voltage rules and fix syntax issues
-    processed_template = process_template(template_content, voltage_rules)
-    
-    # Apply the user-defined variable values with Jinja2
-    jinja2_env = jinja2.Environment()
-    template = jinja2_env.from_string(processed_template)
-    result = template.render(**values)
-    
-    print("✅ Template processed successfully!")
+        print("✅ Template processed successfully!")
     
     output_file = input(f"\n💾 What should I name your MapCSS file? (default: output_{os.path.basename(template_file)}): ").strip() or f"output_{os.path.basename(template_file)}"
-    with open(output_file, 'w', encoding='utf-8') as f:
-        f.write(result)
+    if result is None:
+        write_style(output_file, artifact, values, voltage_rules, args.voltage_mode, timer)
+        print("✅ Template processed successfully!")
+    else:
+        with timed(timer, "write"):
+            with open(output_file, 'w', encoding='utf-8') as f:
+                f.write(result)
+            if layers is not None:
+                for layer in name_layers(os.path.basename(output_file), output_file, layers):
+                    with open(layer["output"], 'w', encoding='utf-8') as f:
+                        f.write(layer["text"])
     
     print(f"\n🎉 Success! Your custom MapCSS file has been saved as '{output_file}'")
+    if layers is not None:
+        print("🗂️ Each layer is also saved on its own, to switch the costly ones off in JOSM:")
+        for layer in layers:
+            print(f"   {layer['layer']}: '{layer['output']}' ({layer['rules']} rules)")
+    if density is not None:
+        with open(density_report_file(output_file), 'w', encoding='utf-8') as f:
+            json.dump(density, f, indent=2)
+        print(f"📊 The density statistics behind it are saved as '{density_report_file(output_file)}'")
+    if timer is not None:
+        profile = {"template": os.path.abspath(template_file), "voltage_rules": len(voltage_rules), "voltage_mode": args.voltage_mode,
+                   "phases": timer.as_dict(), "seconds": round(sum(timer.phases.values()), 6), "output": style_statistics(result, output_file)}
+        with open(args.profile, 'w', encoding='utf-8') as f:
+            json.dump(profile, f, indent=2)
+        print(f"⏱️ Phase timings saved as '{args.profile}'")
     print("You can now load this style in JOSM to enjoy your beautifully colored power grid map!")
     print("Thanks for using ColorMyMap! Happy mapping! 🗺️")
 
@@ -0,0 +1,176 @@
+import argparse
+import json
+import os
+import sys
+from typing import Any, Dict, List
+
+from mapcss_engine import (ClassCondition, ExpressionCondition, KeyRegexpCondition, KeyValueCondition, PseudoClassCondition,
+                           RegexpCondition, Rule, Selector, Stylesheet, estimate_selector_cost, load_stylesheet)
+
+# Functions whose chains re-parse tag values every time they are evaluated
+EVAL_CHAIN_FUNCTIONS = {"split", "get", "count", "to_int", "to_long", "to_float", "to_double"}
+
+# Descriptions of the performance checks
+CHECKS = {
+    "regex-key": "regex key selector, every tag of every candidate object is scanned",
+    "unanchored": "no tag value or class condition, the rule is tested against every object of its type or key",
+    "parent-lookup": "parent/child lookup, the parents of every candidate object are fetched and tested",
+    "repeated-eval": "the same split/to_int eval chain is evaluated several times",
+}
+
+def expression_text(node) -> str:
+    """MapCSS text of an expression tree, used to recognise repeated eval chains."""
+    kind = node[0]
+    if kind == "literal":
+        return json.dumps(node[1]) if isinstance(node[1], str) else f"{node[1]:g}"
+    if kind == "call":
+        return f"{node[1]}({','.join(expression_text(arg) for arg in node[2])})"
+    if kind == "operator":
+        return f"{expression_text(node[2])}{node[1]}{expression_text(node[3])}"
+    if kind == "not":
+        return f"!{expression_text(node[1])}"
+    if kind == "negate":
+        return f"-{expression_text(node[1])}"
+    return f"({expression_text(node[1])} ? {expression_text(node[2])} : {expression_text(node[3])})"
+
+def eval_chains(node, chains: List[str]):
+    """Collect the outermost split/to_int style call chains of an expression tree."""
+    if node[0] == "call" and node[1] in EVAL_CHAIN_FUNCTIONS:
+        chains.append(expression_text(node))
+        return
+    for child in node[1:]:
+        if isinstance(child, tuple):
+            eval_chains(child, chains)
+        elif isinstance(child, list):
+            for item in child:
+                eval_chains(item, chains)
+
+def selector_chains(selector: Selector) -> List[str]:
+    chains = []
+    for part in selector.parts:
+        for condition in part.conditions:
+            if isinstance(condition, ExpressionCondition):
+                eval_chains(condition.expression.tree, chains)
+    return chains
+
+def lint_selector(selector: Selector) -> List[str]:
+    """Names of the performance checks a selector fails."""
+    flags = []
+    conditions = [condition for part in selector.parts for condition in part.conditions]
+    if any(isinstance(condition, KeyRegexpCondition) for condition in conditions):
+        flags.append("regex-key")
+
+    anchors = (KeyValueCondition, RegexpCondition, KeyRegexpCondition, ClassCondition)
+    if not any(isinstance(condition, anchors) and not getattr(condition, "negated", False) for condition in selector.subject.conditions):
+        flags.append("unanchored")
+
+    if len(selector.parts) > 1 or any(isinstance(condition, PseudoClassCondition) and condition.name in ("unconnected", "connection") for condition in conditions):
+        flags.append("parent-lookup")
+
+    chains = selector_chains(selector)
+    if len(chains) != len(set(chains)):
+        flags.append("repeated-eval")
+    return flags
+
+def analyze_rule(rule: Rule) -> Dict[str, Any]:
+    selectors = []
+    for selector in rule.selectors:
+        if selector.parts[0].base in ("meta", "canvas", "setting"):
+            continue
+        entry = {"selector": selector.to_mapcss()}
+        entry.update(estimate_selector_cost(selector))
+        entry["flags"] = lint_selector(selector)
+        selectors.append(entry)
+
+    flags = []
+    for entry in selectors:
+        flags.extend(flag for flag in entry["flags"] if flag not in flags)
+    return {
+        "line": rule.line,
+        "rule": ", ".join(entry["selector"] for entry in selectors),
+        "cost": round(sum(entry["cost"] for entry in selectors), 3),
+        "flags": flags,
+        "selectors": selectors,
+    }
+
+def analyze_stylesheet(stylesheet: Stylesheet) -> Dict[str, Any]:
+    """Rank the rules of a stylesheet by estimated cost and count performance issues."""
+    rules = [analyze_rule(rule) for rule in stylesheet.rules if rule.is_object_rule]
+
+    chain_selectors: Dict[str, int] = {}
+    for rule, selector in stylesheet.selectors():
+        for chain in set(selector_chains(selector)):
+            chain_selectors[chain] = chain_selectors.get(chain, 0) + 1
+
+    return {
+        "rules": len(rules),
+        "selectors": sum(len(rule["selectors"]) for rule in rules),
+        "estimated_cost": round(sum(rule["cost"] for rule in rules), 3),
+        "flags": {check: sum(1 for rule in rules for entry in rule["selectors"] if check in entry["flags"]) for check in CHECKS},
+        "repeated_eval_chains": {chain: count for chain, count in sorted(chain_selectors.items(), key=lambda item: -item[1]) if count > 1},
+        "ranking": sorted(rules, key=lambda rule: -rule["cost"]),
+    }
+
+def budget_violations(report: Dict[str, Any], max_rule_cost: float, baseline: Dict[str, Any] = None) -> List[Dict[str, Any]]:
+    """Rules above the cost budget; with a baseline, only those which are new or got costlier."""
+    baseline_costs = {rule["rule"]: rule["cost"] for rule in baseline["ranking"]} if baseline else {}
+    violations = []
+    for rule in report["ranking"]:
+        if rule["cost"] <= max_rule_cost:
+            continue
+        if baseline is not None and rule["rule"] in baseline_costs and rule["cost"] <= baseline_costs[rule["rule"]]:
+            continue
+        violations.append(rule)
+    return violations
+
+def main():
+    parser = argparse.ArgumentParser(description="Rank the rules of a generated MapCSS style by estimated evaluation cost and flag patterns known to slow JOSM down.")
+    parser.add_argument("style", help="generated MapCSS style to analyze")
+    parser.add_argument("--json", metavar="FILE", help="save the report as JSON")
+    parser.add_argument("--top", type=int, default=15, help="number of most expensive rules to print (default: 15)")
+    parser.add_argument("--max-rule-cost", type=float, help="fail when a rule has a higher estimated cost")
+    parser.add_argument("--max-total-cost", type=float, help="fail when the whole style has a higher estimated cost")
+    parser.add_argument("--baseline", metavar="FILE", help="previous JSON report; --max-rule-cost then only fails on new or costlier rules")
+    args = parser.parse_args()
+
+    report = {"style": os.path.abspath(args.style)}
+    report.update(analyze_stylesheet(load_stylesheet(args.style)))
+
+    print(f"🔍 {report['rules']} rules, {report['selectors']} selectors, estimated cost {report['estimated_cost']}")
+    print(f"\n{'Line':>5} {'Cost':>8}  {'Flags':30} Rule")
+    for rule in report["ranking"][:args.top]:
+        print(f"{rule['line']:>5} {rule['cost']:>8.2f}  {','.join(rule['flags']):30} {rule['rule'][:100]}")
+
+    print()
+    for check, count in report["flags"].items():
+        if count:
+            print(f"⚠️ {count} selectors with {check}: {CHECKS[check]}")
+    for chain, count in report["repeated_eval_chains"].items():
+        print(f"⚠️ {chain} is evaluated by {count} selectors")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\n💾 Report saved as '{args.json}'")
+
+    failed = False
+    if args.max_rule_cost is not None:
+        baseline = None
+        if args.baseline:
+            with open(args.baseline, "r", encoding="utf-8") as f:
+                baseline = json.load(f)
+        for rule in budget_violations(report, args.max_rule_cost, baseline):
+            print(f"❌ Line {rule['line']}: cost {rule['cost']} is above the budget of {args.max_rule_cost}: {rule['rule'][:100]}")
+            failed = True
+    if args.max_total_cost is not None and report["estimated_cost"] > args.max_total_cost:
+        print(f"❌ Estimated cost {report['estimated_cost']} is above the budget of {args.max_total_cost}")
+        failed = True
+
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    try:
+        main()
+    except (OSError, ValueError) as e:
+        print(f"❌ {e}")
+        sys.exit(1)
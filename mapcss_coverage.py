@@ -0,0 +1,129 @@
+"""Count how often each rule of a MapCSS style fires on an OSM extract, per zoom band.
+
+Every object of the extract is styled at the lowest zoom of each zoom band of the
+style, the ranges within which no selector starts or stops applying, and every
+selector records how many objects it was tested against and how many it matched.
+Rules matching nothing are dead weight, the hottest ones are where optimisation
+pays off. Objects are split into shards evaluated by worker processes, each shard
+still seeing the whole extract for child selectors and parent lookups.
+"""
+import concurrent.futures
+import itertools
+import multiprocessing
+from typing import Any, Dict, List, Optional, Tuple
+
+from mapcss_engine import EvaluationStats, Stylesheet, apply_stylesheet, format_zoom, parse_stylesheet, zoom_bands
+from osm_extract import OsmDataset, load_dataset
+
+# Shards per worker process, so that workers finishing early pick up more
+SHARDS_PER_JOB = 4
+
+#########
+# Bands #
+#########
+
+def band_label(min_zoom: int, max_zoom: int) -> str:
+    """Zoom band name such as z10-14, also used as CSV column."""
+    return format_zoom(min_zoom, max_zoom).lstrip("|") or "z0-"
+
+def coverage_bands(stylesheet: Stylesheet, zooms: Optional[List[int]] = None) -> List[Tuple[int, int]]:
+    """Zoom bands of the style, or single zoom levels when given."""
+    if zooms:
+        return [(zoom, zoom) for zoom in sorted(set(zooms))]
+    return zoom_bands(stylesheet)
+
+##############
+# Evaluation #
+##############
+
+# Extracts and stylesheets of each worker process, by path and by text
+_DATASETS: Dict[str, OsmDataset] = {}
+_STYLESHEETS: Dict[str, Stylesheet] = {}
+
+def _dataset(path: str) -> OsmDataset:
+    if path not in _DATASETS:
+        _DATASETS[path] = load_dataset(path)
+    return _DATASETS[path]
+
+def _stylesheet(text: str) -> Stylesheet:
+    if text not in _STYLESHEETS:
+        _STYLESHEETS[text] = parse_stylesheet(text)
+    return _STYLESHEETS[text]
+
+def count_shard(task: Tuple[str, str, List[int], Optional[Dict[str, Any]], bool, int, int]) -> List[Dict[str, Any]]:
+    """Style every shards-th object of the extract, from the shard-th one, at each zoom, returning the counts per zoom."""
+    extract, text, zooms, settings, use_index, shard, shards = task
+    dataset = _dataset(extract)
+    stylesheet = _stylesheet(text)
+    effective_settings = dict(stylesheet.settings)
+    effective_settings.update(settings or {})
+
+    counts = [EvaluationStats(len(stylesheet.rules), len(stylesheet.object_selectors)) for zoom in zooms]
+    for element in itertools.islice(dataset, shard, None, shards):
+        for zoom, stats in zip(zooms, counts):
+            apply_stylesheet(stylesheet, element, zoom, dataset, effective_settings, stats, use_index)
+    return [{"objects": stats.objects, "rule_hits": stats.rule_hits, "selector_tests": stats.selector_tests,
+             "selector_hits": stats.selector_hits} for stats in counts]
+
+def rule_coverage(extract: str, text: str, zooms: Optional[List[int]] = None, settings: Optional[Dict[str, Any]] = None,
+                  jobs: Optional[int] = None, use_index: bool = True, dataset: Optional[OsmDataset] = None) -> Dict[str, Any]:
+    """Count the tests and hits of every selector and rule of a style over an extract, per zoom band, in parallel.
+
+    The returned rules are in stylesheet order, each with its hits per band, and its
+    selectors with their tests and hits per band.
+    """
+    stylesheet = parse_stylesheet(text)
+    bands = coverage_bands(stylesheet, zooms)
+    band_zooms = [min_zoom for min_zoom, max_zoom in bands]
+    if dataset is not None:
+        _DATASETS[extract] = dataset
+
+    shards = 1 if jobs == 1 else (jobs or multiprocessing.cpu_count()) * SHARDS_PER_JOB
+    tasks = [(extract, text, band_zooms, settings, use_index, shard, shards) for shard in range(shards)]
+    if shards == 1:
+        results = [count_shard(task) for task in tasks]
+    else:
+        # Forked workers share the extract loaded here instead of reading it again
+        context = multiprocessing.get_context("fork") if "fork" in multiprocessing.get_all_start_methods() else None
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs, mp_context=context) as executor:
+            results = list(executor.map(count_shard, tasks))
+
+    totals = [EvaluationStats(len(stylesheet.rules), len(stylesheet.object_selectors)) for band in bands]
+    for result in results:
+        for stats, counts in zip(totals, result):
+            stats.objects += counts["objects"]
+            for name in ("rule_hits", "selector_tests", "selector_hits"):
+                merged = getattr(stats, name)
+                for i, count in enumerate(counts[name]):
+                    merged[i] += count
+
+    labels = [band_label(*band) for band in bands]
+    rules: Dict[int, Dict[str, Any]] = {}
+    for order, (selector, rule) in enumerate(stylesheet.object_selectors):
+        if rule.index not in rules:
+            hits = {label: stats.rule_hits[rule.index] for label, stats in zip(labels, totals)}
+            rules[rule.index] = {"line": rule.line, "hits": sum(hits.values()), "bands": hits, "tests": 0, "selectors": []}
+        entry = rules[rule.index]
+        hits = {label: stats.selector_hits[order] for label, stats in zip(labels, totals)}
+        tests = sum(stats.selector_tests[order] for stats in totals)
+        entry["tests"] += tests
+        entry["selectors"].append({"selector": selector.to_mapcss(), "line": selector.line, "layer": selector.layer,
+                                   "tests": tests, "hits": sum(hits.values()), "bands": hits})
+
+    rule_list = list(rules.values())
+    return {
+        "objects": totals[0].objects if totals else 0,
+        "bands": labels,
+        "rules": rule_list,
+        "dead_rules": sum(1 for rule in rule_list if not rule["hits"]),
+        "dead_selectors": sum(1 for rule in rule_list for selector in rule["selectors"] if not selector["hits"]),
+    }
+
+def coverage_rows(report: Dict[str, Any]) -> List[List[Any]]:
+    """Heat table of a coverage report, one row per selector, with a header row."""
+    rows = [["line", "selector", "layer", "tests", "hits", "rule_hits"] + report["bands"]]
+    for rule in report["rules"]:
+        for selector in rule["selectors"]:
+            rows.append([selector["line"], selector["selector"], selector["layer"] or "default", selector["tests"], selector["hits"], rule["hits"]]
+                        + [selector["bands"][label] for label in report["bands"]])
+    return rows
@@ -0,0 +1,1372 @@
+"""Offline MapCSS engine for the JOSM MapCSS subset used by ColorMyGrid styles.
+
+The engine parses stylesheets (zoom ranges, classes, key/value and regular
+expression conditions, child selectors, eval expressions and settings), applies
+them to OSM data per zoom level like JOSM does, and counts the selector tests,
+condition evaluations and expression function calls it needed on the way.
+"""
+import math
+import re
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from osm_extract import OsmDataset, OsmElement
+
+class MapCSSSyntaxError(ValueError):
+    """Raised when a stylesheet cannot be parsed."""
+
+    def __init__(self, message: str, line: Optional[int] = None):
+        super().__init__(f"line {line}: {message}" if line is not None else message)
+        self.line = line
+
+# Keys that do not make an object "tagged" for the :tagged pseudo class
+UNINTERESTING_KEYS = {"source", "source_ref", "source:date", "created_by", "converted_by", "note", "fixme", "FIXME", "comment", "odbl", "odbl:note"}
+
+# Pseudo classes whose state only exists in a running editor
+EDITOR_PSEUDO_CLASSES = {
+    "selected": False, "hover": False, "highlighted": False, "modified": False, "disabled": False,
+    "area-style": True, "completely_downloaded": True, "in-downloaded-area": True, "righthandtraffic": True,
+    "unclosed_multipolygon": False, "open_end": False, "anticlockwise": False, "clockwise": False,
+}
+
+# Selector bases which never apply to OSM objects
+NON_OBJECT_BASES = {"meta", "canvas", "setting"}
+
+# Selector bases each kind of object can match
+ELEMENT_BASES = {
+    "node": ("node", "*"),
+    "way": ("way", "line", "*"),
+    "closed_way": ("way", "area", "*"),
+    "relation": ("relation", "*"),
+    "multipolygon": ("relation", "area", "*"),
+}
+
+def element_kind(element: OsmElement) -> str:
+    """Classify an element into one of the ELEMENT_BASES kinds."""
+    if element.type == "way":
+        return "closed_way" if element.is_closed() else "way"
+    if element.type == "relation":
+        return "multipolygon" if element.is_multipolygon() else "relation"
+    return "node"
+
+##############
+# Evaluation #
+##############
+
+class EvaluationStats:
+    """Counters collected while applying a stylesheet."""
+
+    def __init__(self, rule_count: int = 0, selector_count: int = 0):
+        self.objects = 0
+        self.selectors_tested = 0
+        self.conditions_evaluated = 0
+        self.function_calls = 0
+        self.selector_matches = 0
+        self.rule_hits = [0] * rule_count
+        # Tests and matches of each selector of Stylesheet.object_selectors, only counted when sized
+        self.selector_tests = [0] * selector_count
+        self.selector_hits = [0] * selector_count
+
+    def merge(self, other: "EvaluationStats"):
+        self.objects += other.objects
+        self.selectors_tested += other.selectors_tested
+        self.conditions_evaluated += other.conditions_evaluated
+        self.function_calls += other.function_calls
+        self.selector_matches += other.selector_matches
+        for i, hits in enumerate(other.rule_hits):
+            self.rule_hits[i] += hits
+        for i, tests in enumerate(other.selector_tests):
+            self.selector_tests[i] += tests
+        for i, hits in enumerate(other.selector_hits):
+            self.selector_hits[i] += hits
+
+    def as_dict(self) -> Dict[str, int]:
+        return {
+            "objects": self.objects,
+            "selectors_tested": self.selectors_tested,
+            "conditions_evaluated": self.conditions_evaluated,
+            "function_calls": self.function_calls,
+            "selector_matches": self.selector_matches,
+        }
+
+class Environment:
+    """State of the evaluation of one object at one zoom level."""
+    __slots__ = ("element", "dataset", "zoom", "layers", "layer", "parent", "settings", "stats")
+
+    def __init__(self, element: OsmElement, dataset: Optional[OsmDataset], zoom: int, settings: Dict[str, Any], stats: EvaluationStats):
+        self.element = element
+        self.dataset = dataset
+        self.zoom = zoom
+        self.layers: Dict[str, Dict[str, Any]] = {}
+        self.layer = "default"
+        self.parent: Optional[OsmElement] = None
+        self.settings = settings
+        self.stats = stats
+
+    def cascade(self, layer: Optional[str] = None) -> Dict[str, Any]:
+        return self.layers.setdefault(layer or self.layer, {})
+
+    def has_class(self, name: str) -> bool:
+        """Classes are looked up in the current layer, then in the default layer."""
+        key = "." + name
+        layer = self.layers.get(self.layer)
+        if layer is not None and key in layer:
+            return True
+        default = self.layers.get("default")
+        return default is not None and key in default
+
+##########################
+# Expression conversions #
+##########################
+
+def to_float(value: Any) -> Optional[float]:
+    """Convert a value to a number like JOSM does, None when impossible."""
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return 1.0 if value else 0.0
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(str(value))
+    except ValueError:
+        return None
+
+def to_bool(value: Any) -> bool:
+    """Convert a value to a boolean like JOSM does."""
+    if value is None:
+        return False
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)):
+        return value != 0
+    if isinstance(value, list):
+        return True
+    return str(value) not in ("", "false", "no", "0", "off")
+
+def parse_settings(settings: List[str]) -> Dict[str, Any]:
+    """Turn name=value command line settings into setting() values."""
+    values = {}
+    for setting in settings:
+        if "=" not in setting:
+            raise ValueError(f"setting '{setting}' must look like name=value")
+        name, value = setting.split("=", 1)
+        values[name.strip()] = to_bool(value.strip()) if value.strip() in ("true", "false", "yes", "no") else value.strip()
+    return values
+
+def to_string(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if isinstance(value, list):
+        return ";".join(to_string(item) or "" for item in value)
+    return str(value)
+
+def values_equal(a: Any, b: Any) -> Optional[bool]:
+    if a is None or b is None:
+        return a is None and b is None
+    number_a, number_b = to_float(a), to_float(b)
+    if number_a is not None and number_b is not None:
+        return number_a == number_b
+    return to_string(a) == to_string(b)
+
+def _to_int(value: Any) -> Optional[int]:
+    if value is None or isinstance(value, list):
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    try:
+        return int(str(value).strip())
+    except ValueError:
+        return None
+
+def _numeric(function: Callable[..., Any]) -> Callable[..., Any]:
+    def wrapper(*args):
+        numbers = [to_float(arg) for arg in args]
+        if any(number is None for number in numbers):
+            return None
+        return function(*numbers)
+    return wrapper
+
+def _split(separator: Any, value: Any) -> Optional[List[str]]:
+    if separator is None or value is None:
+        return None
+    return to_string(value).split(to_string(separator))
+
+def _get(values: Any, index: Any) -> Any:
+    position = _to_int(index)
+    if not isinstance(values, list) or position is None or not 0 <= position < len(values):
+        return None
+    return values[position]
+
+def _count(values: Any) -> Optional[int]:
+    return len(values) if isinstance(values, list) else None
+
+def _tr(text: Any, *args) -> Optional[str]:
+    if text is None:
+        return None
+    result = to_string(text)
+    for i, arg in enumerate(args):
+        result = result.replace("{" + str(i) + "}", to_string(arg) or "")
+    return result
+
+def _concat(*args) -> str:
+    return "".join(to_string(arg) or "" for arg in args)
+
+def _join(separator: Any, *args) -> str:
+    values = args[0] if len(args) == 1 and isinstance(args[0], list) else args
+    return (to_string(separator) or "").join(to_string(value) or "" for value in values)
+
+def _regexp_test(pattern: Any, value: Any) -> Optional[bool]:
+    if pattern is None or value is None:
+        return None
+    return re.search(to_string(pattern), to_string(value)) is not None
+
+def _any(*args) -> Any:
+    for arg in args:
+        if arg is not None:
+            return arg
+    return None
+
+# Functions without access to the evaluated object
+PURE_FUNCTIONS: Dict[str, Callable[..., Any]] = {
+    "eval": lambda value=None: value,
+    "split": _split,
+    "get": _get,
+    "count": _count,
+    "list": lambda *args: list(args),
+    "to_int": _to_int,
+    "to_long": _to_int,
+    "to_float": lambda value=None: to_float(value) if not isinstance(value, list) else None,
+    "to_double": lambda value=None: to_float(value) if not isinstance(value, list) else None,
+    "to_boolean": to_bool,
+    "tr": _tr,
+    "concat": _concat,
+    "join": _join,
+    "any": _any,
+    "length": lambda value=None: len(to_string(value)) if value is not None else None,
+    "lower": lambda value=None: to_string(value).lower() if value is not None else None,
+    "upper": lambda value=None: to_string(value).upper() if value is not None else None,
+    "trim": lambda value=None: to_string(value).strip() if value is not None else None,
+    "title": lambda value=None: to_string(value).title() if value is not None else None,
+    "regexp_test": _regexp_test,
+    "equal": values_equal,
+    "not": lambda value=None: not to_bool(value),
+    "cond": lambda condition, a=None, b=None: a if to_bool(condition) else b,
+    "min": _numeric(lambda *args: min(args) if args else None),
+    "max": _numeric(lambda *args: max(args) if args else None),
+    "abs": _numeric(abs),
+    "sqrt": _numeric(lambda value: math.sqrt(value) if value >= 0 else None),
+    "round": _numeric(lambda value: float(round(value))),
+    "replace": lambda value, old, new: to_string(value).replace(to_string(old), to_string(new)) if None not in (value, old, new) else None,
+    "startswith": lambda value, prefix: to_string(value).startswith(to_string(prefix)) if None not in (value, prefix) else None,
+    "endswith": lambda value, suffix: to_string(value).endswith(to_string(suffix)) if None not in (value, suffix) else None,
+    "JOSM_pref": lambda key, default=None: default,
+    "JOSM_search": lambda query: False,
+    "is_right_hand_traffic": lambda: True,
+}
+
+def _tag(env: Environment, element: OsmElement, key: Any) -> Optional[str]:
+    return element.tags.get(to_string(key)) if key is not None else None
+
+def _parent_tag(env: Environment, element: OsmElement, key: Any) -> Optional[str]:
+    return env.parent.tags.get(to_string(key)) if env.parent is not None and key is not None else None
+
+def _prop(env: Environment, element: OsmElement, key: Any, layer: Any = None) -> Any:
+    cascade = env.layers.get(to_string(layer) if layer is not None else env.layer)
+    return cascade.get(to_string(key)) if cascade is not None else None
+
+def _is_prop_set(env: Environment, element: OsmElement, key: Any, layer: Any = None) -> bool:
+    cascade = env.layers.get(to_string(layer) if layer is not None else env.layer)
+    return cascade is not None and to_string(key) in cascade
+
+# Functions reading the evaluated object or its environment
+CONTEXT_FUNCTIONS: Dict[str, Callable[..., Any]] = {
+    "tag": _tag,
+    "parent_tag": _parent_tag,
+    "prop": _prop,
+    "is_prop_set": _is_prop_set,
+    "setting": lambda env, element, name: env.settings.get(to_string(name)),
+    "has_tag_key": lambda env, element, key: to_string(key) in element.tags,
+    "osm_id": lambda env, element: element.id,
+    "number_of_tags": lambda env, element: len(element.tags),
+    "is_anticlockwise": lambda env, element: None,
+    "is_clockwise": lambda env, element: None,
+}
+
+###############
+# Expressions #
+###############
+
+_EXPRESSION_TOKEN = re.compile(r"""
+    \s*(?:
+        (?P<number>\d+(?:\.\d+)?|\.\d+)
+      | (?P<string>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')
+      | (?P<name>[A-Za-z_][\w]*(?::[A-Za-z_][\w]*)*)
+      | (?P<operator>\|\||&&|==|!=|<=|>=|[-+*/%<>=!?:(),])
+    )""", re.VERBOSE)
+
+def _unquote(text: str) -> str:
+    if len(text) >= 2 and text[0] == text[-1] and text[0] in "\"'":
+        return re.sub(r"\\(.)", r"\1", text[1:-1])
+    return text
+
+def tokenize_expression(text: str) -> List[Tuple[str, str]]:
+    tokens = []
+    position = 0
+    text = text.rstrip()
+    while position < len(text):
+        match = _EXPRESSION_TOKEN.match(text, position)
+        if not match or match.end() == position:
+            raise MapCSSSyntaxError(f"unexpected character in expression {text!r} at {position}")
+        kind = match.lastgroup
+        tokens.append((kind, match.group(kind)))
+        position = match.end()
+    return tokens
+
+class Expression:
+    """A parsed eval() expression, as a tree of ("literal" | "call" | "operator" | "not" | "negate" | "conditional") tuples."""
+
+    def __init__(self, text: str):
+        self.text = text
+        self._tokens = tokenize_expression(text)
+        self._position = 0
+        self.tree = self._ternary()
+        if self._position != len(self._tokens):
+            raise MapCSSSyntaxError(f"unexpected {self._tokens[self._position][1]!r} in expression {text!r}")
+        del self._tokens
+        self.evaluate = _compile(self.tree)
+
+    def _peek(self) -> Optional[str]:
+        if self._position < len(self._tokens):
+            kind, value = self._tokens[self._position]
+            return value if kind == "operator" else None
+        return None
+
+    def _take(self) -> Tuple[str, str]:
+        if self._position >= len(self._tokens):
+            raise MapCSSSyntaxError(f"unexpected end of expression {self.text!r}")
+        token = self._tokens[self._position]
+        self._position += 1
+        return token
+
+    def _expect(self, operator: str):
+        kind, value = self._take()
+        if kind != "operator" or value != operator:
+            raise MapCSSSyntaxError(f"expected {operator!r} in expression {self.text!r}, got {value!r}")
+
+    def _ternary(self):
+        condition = self._binary(0)
+        if self._peek() == "?":
+            self._take()
+            when_true = self._ternary()
+            self._expect(":")
+            when_false = self._ternary()
+            return ("conditional", condition, when_true, when_false)
+        return condition
+
+    _PRECEDENCE = [("||",), ("&&",), ("==", "!=", "=", "<", ">", "<=", ">="), ("+", "-"), ("*", "/", "%")]
+
+    def _binary(self, level: int):
+        if level == len(self._PRECEDENCE):
+            return self._unary()
+        left = self._binary(level + 1)
+        while self._peek() in self._PRECEDENCE[level]:
+            operator = self._take()[1]
+            right = self._binary(level + 1)
+            left = ("operator", operator, left, right)
+        return left
+
+    def _unary(self):
+        if self._peek() == "!":
+            self._take()
+            return ("not", self._unary())
+        if self._peek() == "-":
+            self._take()
+            return ("negate", self._unary())
+        return self._primary()
+
+    def _primary(self):
+        kind, value = self._take()
+        if kind == "number":
+            return ("literal", float(value))
+        if kind == "string":
+            return ("literal", _unquote(value))
+        if kind == "name":
+            if self._peek() == "(":
+                self._take()
+                args = []
+                if self._peek() != ")":
+                    args.append(self._ternary())
+                    while self._peek() == ",":
+                        self._take()
+                        args.append(self._ternary())
+                self._expect(")")
+                return ("call", value, args)
+            # Bare words are string literals in MapCSS expressions
+            return ("literal", value)
+        if value == "(":
+            inner = self._ternary()
+            self._expect(")")
+            return inner
+        raise MapCSSSyntaxError(f"unexpected {value!r} in expression {self.text!r}")
+
+    def function_names(self) -> List[str]:
+        """Names of every function called by the expression, repeats included."""
+        names = []
+
+        def walk(node):
+            if node[0] == "call":
+                names.append(node[1])
+                for arg in node[2]:
+                    walk(arg)
+            elif node[0] == "operator":
+                walk(node[2])
+                walk(node[3])
+            elif node[0] in ("not", "negate"):
+                walk(node[1])
+            elif node[0] == "conditional":
+                walk(node[1])
+                walk(node[2])
+                walk(node[3])
+
+        walk(self.tree)
+        return names
+
+def _compare(operator: str, a: Any, b: Any) -> Optional[bool]:
+    if operator in ("==", "="):
+        return values_equal(a, b)
+    if operator == "!=":
+        return not values_equal(a, b)
+    number_a, number_b = to_float(a), to_float(b)
+    if number_a is None or number_b is None:
+        return None
+    if operator == "<":
+        return number_a < number_b
+    if operator == ">":
+        return number_a > number_b
+    if operator == "<=":
+        return number_a <= number_b
+    return number_a >= number_b
+
+def _arithmetic(operator: str, a: Any, b: Any) -> Optional[float]:
+    number_a, number_b = to_float(a), to_float(b)
+    if number_a is None or number_b is None:
+        return None
+    if operator == "+":
+        return number_a + number_b
+    if operator == "-":
+        return number_a - number_b
+    if operator == "*":
+        return number_a * number_b
+    if number_b == 0:
+        return None
+    return number_a / number_b if operator == "/" else math.fmod(number_a, number_b)
+
+def _compile(node) -> Callable[[Environment, OsmElement], Any]:
+    """Turn an expression tree into a closure taking (environment, element)."""
+    kind = node[0]
+    if kind == "literal":
+        value = node[1]
+        return lambda env, element: value
+    if kind == "not":
+        operand = _compile(node[1])
+        return lambda env, element: not to_bool(operand(env, element))
+    if kind == "negate":
+        operand = _compile(node[1])
+        return lambda env, element: _arithmetic("-", 0, operand(env, element))
+    if kind == "conditional":
+        condition, when_true, when_false = (_compile(part) for part in node[1:])
+        return lambda env, element: when_true(env, element) if to_bool(condition(env, element)) else when_false(env, element)
+    if kind == "operator":
+        operator = node[1]
+        left, right = _compile(node[2]), _compile(node[3])
+        if operator == "&&":
+            return lambda env, element: to_bool(left(env, element)) and to_bool(right(env, element))
+        if operator == "||":
+            return lambda env, element: to_bool(left(env, element)) or to_bool(right(env, element))
+        if operator in ("+", "-", "*", "/", "%"):
+            return lambda env, element: _arithmetic(operator, left(env, element), right(env, element))
+        return lambda env, element: _compare(operator, left(env, element), right(env, element))
+
+    name = node[1]
+    args = [_compile(arg) for arg in node[2]]
+    if name in CONTEXT_FUNCTIONS:
+        function = CONTEXT_FUNCTIONS[name]
+
+        def call_context(env, element):
+            env.stats.function_calls += 1
+            return function(env, element, *(arg(env, element) for arg in args))
+        return call_context
+
+    function = PURE_FUNCTIONS.get(name)
+
+    def call(env, element):
+        env.stats.function_calls += 1
+        if function is None:
+            return None
+        try:
+            return function(*(arg(env, element) for arg in args))
+        except (TypeError, ValueError, re.error):
+            return None
+    return call
+
+##############
+# Conditions #
+##############
+
+class Condition:
+    """A selector condition; text is its MapCSS source, e.g. "[power=line]" or ".power_node"."""
+    text = ""
+
+    def applies(self, element: OsmElement, env: Environment) -> bool:
+        raise NotImplementedError
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.text})"
+
+class KeyCondition(Condition):
+    """[key], [!key], [key?] and [key?!] conditions."""
+
+    def __init__(self, text: str, key: str, negated: bool = False, truth: Optional[bool] = None):
+        self.text = text
+        self.key = key
+        self.negated = negated
+        self.truth = truth
+
+    def applies(self, element, env):
+        value = element.tags.get(self.key)
+        if self.truth is None:
+            result = value is not None
+        else:
+            result = value is not None and (value in ("yes", "true", "1") if self.truth else value in ("no", "false", "0"))
+        return result != self.negated
+
+class KeyValueCondition(Condition):
+    """[key=value], [key!=value], numeric comparisons and string matches."""
+
+    NUMERIC_OPERATORS = ("<", ">", "<=", ">=")
+
+    def __init__(self, text: str, key: str, operator: str, value: str):
+        self.text = text
+        self.key = key
+        self.operator = operator
+        self.value = value
+        self.number = to_float(value) if operator in self.NUMERIC_OPERATORS else None
+
+    def applies(self, element, env):
+        tag_value = element.tags.get(self.key)
+        operator = self.operator
+        if operator == "=":
+            return tag_value == self.value
+        if operator == "!=":
+            return tag_value != self.value
+        if tag_value is None:
+            return False
+        if operator in self.NUMERIC_OPERATORS:
+            number = to_float(tag_value)
+            if number is None or self.number is None:
+                return False
+            return _compare(operator, number, self.number)
+        if operator == "^=":
+            return tag_value.startswith(self.value)
+        if operator == "$=":
+            return tag_value.endswith(self.value)
+        if operator == "*=":
+            return self.value in tag_value
+        if operator == "~=":
+            return self.value in tag_value.split(";")
+        return False
+
+class RegexpCondition(Condition):
+    """[key=~/regex/] and [key!~/regex/]; like JOSM the regex only has to match part of the value."""
+
+    def __init__(self, text: str, key: str, pattern: str, negated: bool = False, flags: str = ""):
+        self.text = text
+        self.key = key
+        self.pattern = pattern
+        self.negated = negated
+        self.flags = flags
+        self.regex = re.compile(pattern, re.IGNORECASE if "i" in flags else 0)
+
+    def applies(self, element, env):
+        value = element.tags.get(self.key)
+        if value is None:
+            return self.negated
+        return (self.regex.search(value) is not None) != self.negated
+
+class KeyRegexpCondition(Condition):
+    """[/key regex/] and [/key regex/=~/value regex/], scanning every tag of the object."""
+
+    def __init__(self, text: str, key_pattern: str, value_pattern: Optional[str] = None, negated: bool = False):
+        self.text = text
+        self.key_pattern = key_pattern
+        self.value_pattern = value_pattern
+        self.negated = negated
+        self.key_regex = re.compile(key_pattern)
+        self.value_regex = re.compile(value_pattern) if value_pattern is not None else None
+
+    def applies(self, element, env):
+        result = False
+        for key, value in element.tags.items():
+            if self.key_regex.search(key) and (self.value_regex is None or self.value_regex.search(value)):
+                result = True
+                break
+        return result != self.negated
+
+class ExpressionCondition(Condition):
+    """[eval expression], true when the expression evaluates to a true value."""
+
+    def __init__(self, text: str, expression: Expression):
+        self.text = text
+        self.expression = expression
+
+    def applies(self, element, env):
+        return to_bool(self.expression.evaluate(env, element))
+
+class ClassCondition(Condition):
+    """.class and !.class, only testable on the evaluated object itself."""
+
+    def __init__(self, text: str, name: str, negated: bool = False):
+        self.text = text
+        self.name = name
+        self.negated = negated
+
+    def applies(self, element, env):
+        if element is not env.element:
+            return self.negated
+        return env.has_class(self.name) != self.negated
+
+class PseudoClassCondition(Condition):
+    """:closed, :tagged, :unconnected and the other pseudo classes, optionally negated."""
+
+    def __init__(self, text: str, name: str, negated: bool = False):
+        self.text = text
+        self.name = name
+        self.negated = negated
+
+    def applies(self, element, env):
+        name = self.name
+        if name in ("closed", "closed2"):
+            result = element.is_closed() or element.is_multipolygon()
+        elif name == "tagged":
+            result = any(key not in UNINTERESTING_KEYS and not key.startswith("source:") for key in element.tags)
+        elif name == "new":
+            result = element.id < 0
+        elif name == "unconnected":
+            result = element.type == "node" and env.dataset is not None and env.dataset.parent_ways(element) == 0
+        elif name == "connection":
+            result = element.type == "node" and env.dataset is not None and env.dataset.parent_ways(element) > 1
+        else:
+            result = EDITOR_PSEUDO_CLASSES.get(name, False)
+        return result != self.negated
+
+#############
+# Selectors #
+#############
+
+class SimpleSelector:
+    """One object test such as node|z10-[power=tower].icon:tagged."""
+
+    def __init__(self, base: str, zoom_text: str = "", conditions: Optional[List[Condition]] = None):
+        self.base = base
+        self.zoom_text = zoom_text
+        self.conditions = conditions if conditions is not None else []
+        self.min_zoom, self.max_zoom = parse_zoom(zoom_text)
+
+    def matches(self, element: OsmElement, env: Environment, kind: Optional[str] = None) -> bool:
+        if kind is not None and self.base not in ELEMENT_BASES[kind]:
+            return False
+        if not self.min_zoom <= env.zoom <= self.max_zoom:
+            return False
+        stats = env.stats
+        for condition in self.conditions:
+            stats.conditions_evaluated += 1
+            if not condition.applies(element, env):
+                return False
+        return True
+
+    def to_mapcss(self) -> str:
+        return self.base + self.zoom_text + "".join(condition.text for condition in self.conditions)
+
+class Selector:
+    """A full selector: simple selectors joined by child combinators, plus an optional ::layer."""
+
+    def __init__(self, parts: List[SimpleSelector], links: Optional[List[Tuple[str, List[Condition]]]] = None, layer: Optional[str] = None, line: int = 0):
+        self.parts = parts
+        # One (combinator, link conditions) tuple between each pair of parts
+        self.links = links if links is not None else []
+        self.layer = layer
+        self.line = line
+        self.index_key = _index_key(parts[-1].conditions)
+
+    @property
+    def subject(self) -> SimpleSelector:
+        return self.parts[-1]
+
+    def matches(self, element: OsmElement, env: Environment, kind: Optional[str] = None) -> bool:
+        env.stats.selectors_tested += 1
+        if not self.parts[-1].matches(element, env, kind):
+            return False
+        if len(self.parts) > 1 and not self._matches_parent(len(self.parts) - 2, element, env):
+            return False
+        env.stats.selector_matches += 1
+        return True
+
+    def _matches_parent(self, position: int, child: OsmElement, env: Environment) -> bool:
+        if env.dataset is None:
+            return False
+        part = self.parts[position]
+        combinator, link_conditions = self.links[position]
+        for parent, role, index in env.dataset.parents_of(child):
+            if not part.matches(parent, env, element_kind(parent)):
+                continue
+            if not all(_link_applies(condition, role, index) for condition in link_conditions):
+                continue
+            if position == 0 or self._matches_parent(position - 1, parent, env):
+                env.parent = parent
+                return True
+        return False
+
+    def to_mapcss(self) -> str:
+        text = self.parts[0].to_mapcss()
+        for (combinator, link_conditions), part in zip(self.links, self.parts[1:]):
+            link = "".join(condition.text for condition in link_conditions)
+            text += f" {combinator}{link} " if combinator == ">" else " "
+            text += part.to_mapcss()
+        if self.layer:
+            text += "::" + self.layer
+        return text
+
+def _link_applies(condition: Condition, role: str, index: int) -> bool:
+    if isinstance(condition, KeyValueCondition) and condition.key == "role":
+        return KeyValueCondition.applies(condition, OsmElement("node", 0, {"role": role}), None)
+    if isinstance(condition, KeyValueCondition) and condition.key == "index":
+        return KeyValueCondition.applies(condition, OsmElement("node", 0, {"index": str(index + 1)}), None)
+    return True
+
+def _index_key(conditions: List[Condition]) -> Optional[str]:
+    """Key an object must carry for the selector to apply, as used by JOSM's rule index."""
+    for condition in conditions:
+        if isinstance(condition, KeyCondition) and not condition.negated:
+            return condition.key
+        if isinstance(condition, KeyValueCondition) and condition.operator not in ("!=",):
+            return condition.key
+        if isinstance(condition, RegexpCondition) and not condition.negated:
+            return condition.key
+    return None
+
+def parse_zoom(zoom_text: str) -> Tuple[int, int]:
+    """Turn "|z10-", "|z-15", "|z15-19" or "|z12" into an inclusive (min, max) range."""
+    if not zoom_text:
+        return 0, 99
+    match = re.fullmatch(r"\|z(\d*)(-?)(\d*)", zoom_text)
+    if not match:
+        raise MapCSSSyntaxError(f"invalid zoom range {zoom_text!r}")
+    low, dash, high = match.groups()
+    if not dash:
+        return int(low), int(low)
+    return int(low) if low else 0, int(high) if high else 99
+
+###########
+# Parsing #
+###########
+
+class Declaration:
+    """One "property: value" or "set .class" declaration."""
+
+    def __init__(self, property: str, value_text: str):
+        self.property = property
+        self.value_text = value_text
+        self.value = None
+        self.expression: Optional[Expression] = None
+        if property != "set":
+            self.expression, self.value = parse_value(value_text)
+
+    @property
+    def class_name(self) -> Optional[str]:
+        if self.property != "set":
+            return None
+        return self.value_text.strip().lstrip(".")
+
+    def evaluate(self, env: Environment, element: OsmElement) -> Any:
+        if self.expression is not None:
+            return self.expression.evaluate(env, element)
+        return self.value
+
+    def to_mapcss(self) -> str:
+        if self.property == "set":
+            return f"set .{self.class_name};"
+        return f"{self.property}: {self.value_text};"
+
+class Rule:
+    """A selector list with its declaration block, and its position in the source."""
+
+    def __init__(self, selectors: List[Selector], declarations: List[Declaration], start: int, end: int, line: int, block_start: Optional[int] = None):
+        self.selectors = selectors
+        self.declarations = declarations
+        # Source offsets of the rule, and of the "{" opening its declaration block
+        self.start = start
+        self.end = end
+        self.block_start = block_start if block_start is not None else start
+        self.line = line
+        self.index = 0
+
+    @property
+    def is_object_rule(self) -> bool:
+        return any(selector.parts[0].base not in NON_OBJECT_BASES for selector in self.selectors)
+
+    def execute(self, env: Environment, element: OsmElement, layer: Optional[str]):
+        layer = layer or "default"
+        layers = list(env.layers) if layer == "*" else [layer]
+        for layer_name in layers or ["default"]:
+            env.layer = layer_name
+            cascade = env.cascade()
+            for declaration in self.declarations:
+                if declaration.property == "set":
+                    cascade["." + declaration.class_name] = True
+                else:
+                    cascade[declaration.property] = declaration.evaluate(env, element)
+        env.layer = "default"
+
+    def selector_text(self) -> str:
+        return ",\n".join(selector.to_mapcss() for selector in self.selectors)
+
+    def to_mapcss(self) -> str:
+        declarations = "".join(f"    {declaration.to_mapcss()}\n" for declaration in self.declarations)
+        return f"{self.selector_text()} {{\n{declarations}}}\n"
+
+    def __repr__(self) -> str:
+        return f"Rule(line {self.line}: {self.selector_text()!r})"
+
+_NUMBER = re.compile(r"[+-]?(\d+(\.\d*)?|\.\d+)")
+
+def parse_value(text: str) -> Tuple[Optional[Expression], Any]:
+    """Parse a declaration value into an expression or a literal value."""
+    text = text.strip()
+    if re.match(r"[A-Za-z_][\w]*\s*\(", text):
+        return Expression(text), None
+    if _NUMBER.fullmatch(text) and not text.startswith("+"):
+        return None, float(text)
+    if text.startswith("#") and re.fullmatch(r"#[0-9A-Fa-f]{3,8}", text):
+        return None, text.lower()
+    return None, _unquote(text)
+
+_KEY = r'(?:"(?:[^"\\]|\\.)*"|\'(?:[^\'\\]|\\.)*\'|[\w:\-.]+)'
+_KEY_CONDITION = re.compile(rf"\s*(?P<negated>!)?\s*(?P<key>{_KEY})\s*(?P<truth>\?!?)?\s*")
+_REGEXP_CONDITION = re.compile(rf"\s*(?P<key>{_KEY})\s*(?P<operator>=~|!~)\s*/(?P<pattern>(?:[^/\\]|\\.)*)/(?P<flags>i?)\s*")
+_KEY_REGEXP_CONDITION = re.compile(r"\s*(?P<negated>!)?\s*/(?P<key>(?:[^/\\]|\\.)*)/\s*(?:=~\s*/(?P<value>(?:[^/\\]|\\.)*)/)?\s*")
+_KEY_VALUE_CONDITION = re.compile(rf"\s*(?P<key>{_KEY})\s*(?P<operator>!=|>=|<=|\^=|\$=|\*=|~=|=|<|>)\s*(?P<value>\"(?:[^\"\\]|\\.)*\"|'(?:[^'\\]|\\.)*'|[^\s\"'()]+)\s*")
+
+def parse_condition(body: str) -> Condition:
+    """Parse the inside of a [...] condition."""
+    text = f"[{body}]"
+    match = _KEY_CONDITION.fullmatch(body)
+    if match:
+        truth = None if not match.group("truth") else match.group("truth") == "?"
+        return KeyCondition(text, _unquote(match.group("key")), bool(match.group("negated")), truth)
+    match = _KEY_REGEXP_CONDITION.fullmatch(body)
+    if match:
+        return KeyRegexpCondition(text, match.group("key"), match.group("value"), bool(match.group("negated")))
+    match = _REGEXP_CONDITION.fullmatch(body)
+    if match:
+        return RegexpCondition(text, _unquote(match.group("key")), match.group("pattern"), match.group("operator") == "!~", match.group("flags"))
+    match = _KEY_VALUE_CONDITION.fullmatch(body)
+    if match:
+        return KeyValueCondition(text, _unquote(match.group("key")), match.group("operator"), _unquote(match.group("value")))
+    return ExpressionCondition(text, Expression(body))
+
+class _Scanner:
+    """Character scanner over a stylesheet which knows about strings and comments."""
+
+    def __init__(self, text: str):
+        self.text = text
+        self.position = 0
+
+    def line(self, position: Optional[int] = None) -> int:
+        return self.text.count("\n", 0, self.position if position is None else position) + 1
+
+    def skip_blanks(self):
+        text = self.text
+        while self.position < len(text):
+            if text[self.position].isspace():
+                self.position += 1
+            elif text.startswith("/*", self.position):
+                end = text.find("*/", self.position + 2)
+                if end < 0:
+                    raise MapCSSSyntaxError("unterminated comment", self.line())
+                self.position = end + 2
+            elif text.startswith("//", self.position):
+                end = text.find("\n", self.position)
+                self.position = len(text) if end < 0 else end
+            else:
+                break
+
+    def read_until(self, stop: str) -> str:
+        """Read up to (not including) stop, skipping over strings, brackets and parentheses."""
+        text = self.text
+        start = self.position
+        depth = 0
+        in_regex = False
+        while self.position < len(text):
+            char = text[self.position]
+            if char in "\"'":
+                end = self.position + 1
+                while end < len(text) and text[end] != char:
+                    end += 2 if text[end] == "\\" else 1
+                self.position = end + 1
+                continue
+            if in_regex:
+                if char == "\\":
+                    self.position += 1
+                elif char == "/":
+                    in_regex = False
+            elif char == stop and depth == 0:
+                return text[start:self.position]
+            elif char == "/" and (depth > 0 or stop == "]") and self._regex_starts(start):
+                in_regex = True
+            elif char == "/" and depth == 0 and text.startswith("/*", self.position):
+                # Comments between the parts of a selector list
+                end = text.find("*/", self.position + 2)
+                self.position = (len(text) if end < 0 else end + 2)
+                continue
+            elif char in "[(":
+                depth += 1
+            elif char in "])":
+                depth -= 1
+            self.position += 1
+        raise MapCSSSyntaxError(f"missing {stop!r}", self.line(start))
+
+    def _regex_starts(self, start: int) -> bool:
+        previous = self.text[start:self.position].rstrip()
+        return not previous or previous.endswith(("~", "[", "!"))
+
+def _strip_comments(text: str) -> str:
+    return re.sub(r"/\*.*?\*/", "", text, flags=re.DOTALL)
+
+def _split_top_level(text: str, separator: str) -> List[str]:
+    parts = []
+    depth = 0
+    quote = None
+    in_regex = False
+    current = ""
+    for i, char in enumerate(text):
+        if quote:
+            if char == quote and text[i - 1] != "\\":
+                quote = None
+        elif in_regex:
+            if char == "/" and text[i - 1] != "\\":
+                in_regex = False
+        elif char in "\"'":
+            quote = char
+        elif char == "/" and depth > 0 and current.rstrip().endswith(("~", "[", "!")):
+            in_regex = True
+        elif char in "[(":
+            depth += 1
+        elif char in "])":
+            depth -= 1
+        elif char == separator and depth == 0:
+            parts.append(current)
+            current = ""
+            continue
+        current += char
+    parts.append(current)
+    return parts
+
+_SELECTOR_BASE = re.compile(r"(\*|[A-Za-z_][\w\-]*)")
+_ZOOM = re.compile(r"\|z\d*-?\d*")
+_IDENTIFIER = re.compile(r"[\w\-]+")
+
+def _read_brackets(text: str, position: int) -> int:
+    """Position right after the ] closing the [ at position."""
+    scanner = _Scanner(text)
+    scanner.position = position + 1
+    scanner.read_until("]")
+    return scanner.position + 1
+
+def parse_selector(text: str, line: int = 0) -> Selector:
+    """Parse one selector such as relation[power=circuit] > way::casing."""
+    text = _strip_comments(text).strip()
+    parts: List[SimpleSelector] = []
+    links: List[Tuple[str, List[Condition]]] = []
+    layer = None
+    position = 0
+    pending_link: Optional[Tuple[str, List[Condition]]] = None
+
+    while position < len(text):
+        match = _SELECTOR_BASE.match(text, position)
+        if not match:
+            raise MapCSSSyntaxError(f"invalid selector {text!r}", line)
+        base = match.group(1)
+        position = match.end()
+
+        zoom_text = ""
+        match = _ZOOM.match(text, position)
+        if match:
+            zoom_text = match.group(0)
+            position = match.end()
+
+        conditions: List[Condition] = []
+        while position < len(text):
+            char = text[position]
+            if char == "[":
+                end = _read_brackets(text, position)
+                conditions.append(parse_condition(text[position + 1:end - 1]))
+                position = end
+            elif text.startswith("!.", position) or char == ".":
+                negated = char == "!"
+                start = position + (2 if negated else 1)
+                match = _IDENTIFIER.match(text, start)
+                if not match:
+                    raise MapCSSSyntaxError(f"invalid class in selector {text!r}", line)
+                conditions.append(ClassCondition(text[position:match.end()], match.group(0), negated))
+                position = match.end()
+            elif text.startswith("::", position):
+                match = _IDENTIFIER.match(text, position + 2) or re.compile(r"\*").match(text, position + 2)
+                if not match:
+                    raise MapCSSSyntaxError(f"invalid layer in selector {text!r}", line)
+                layer = match.group(0)
+                position = match.end()
+            elif text.startswith("!:", position) or char == ":":
+                negated = char == "!"
+                start = position + (2 if negated else 1)
+                match = _IDENTIFIER.match(text, start)
+                if not match:
+                    raise MapCSSSyntaxError(f"invalid pseudo class in selector {text!r}", line)
+                conditions.append(PseudoClassCondition(text[position:match.end()], match.group(0), negated))
+                position = match.end()
+            else:
+                break
+
+        if pending_link is not None:
+            links.append(pending_link)
+            pending_link = None
+        parts.append(SimpleSelector(base, zoom_text, conditions))
+
+        # Combinator to the next simple selector
+        rest = text[position:]
+        stripped = rest.lstrip()
+        if not stripped:
+            break
+        position += len(rest) - len(stripped)
+        if stripped.startswith(">"):
+            position += 1
+            link_conditions = []
+            while True:
+                while position < len(text) and text[position].isspace():
+                    position += 1
+                if position < len(text) and text[position] == "[":
+                    end = _read_brackets(text, position)
+                    link_conditions.append(parse_condition(text[position + 1:end - 1]))
+                    position = end
+                else:
+                    break
+            pending_link = (">", link_conditions)
+        elif len(stripped) < len(rest):
+            pending_link = (" ", [])
+        else:
+            raise MapCSSSyntaxError(f"unexpected {stripped[0]!r} in selector {text!r}", line)
+        while position < len(text) and text[position].isspace():
+            position += 1
+
+    if not parts:
+        raise MapCSSSyntaxError("empty selector", line)
+    return Selector(parts, links, layer, line)
+
+def parse_declarations(text: str, line: int = 0) -> List[Declaration]:
+    """Parse the inside of a declaration block."""
+    declarations = []
+    for item in _split_top_level(_strip_comments(text), ";"):
+        item = item.strip()
+        if not item:
+            continue
+        if re.match(r"set\s", item):
+            for name in item[3:].split(","):
+                declarations.append(Declaration("set", name.strip()))
+            continue
+        if ":" not in item:
+            raise MapCSSSyntaxError(f"invalid declaration {item!r}", line)
+        name, value = item.split(":", 1)
+        declarations.append(Declaration(name.strip(), value.strip()))
+    return declarations
+
+class Stylesheet:
+    """A parsed MapCSS stylesheet."""
+
+    def __init__(self, text: str, rules: List[Rule]):
+        self.text = text
+        self.rules = rules
+        for i, rule in enumerate(rules):
+            rule.index = i
+        self.settings = {}
+        for rule in rules:
+            for selector in rule.selectors:
+                if selector.parts[0].base == "setting" and selector.layer:
+                    default = next((d.value for d in rule.declarations if d.property == "default"), None)
+                    self.settings[selector.layer] = to_bool(default) if isinstance(default, str) and default in ("true", "false") else default
+        self._candidates: Dict[str, Tuple[List[Tuple[int, Selector, Rule]], Dict[str, List[Tuple[int, Selector, Rule]]]]] = {}
+        self._build_index()
+
+    def _build_index(self):
+        """Group selectors per object kind and by required key, like JOSM's rule index."""
+        order = 0
+        entries = []
+        for rule in self.rules:
+            for selector in rule.selectors:
+                if selector.parts[0].base in NON_OBJECT_BASES:
+                    continue
+                entries.append((order, selector, rule))
+                order += 1
+        self.object_selectors = [(selector, rule) for order, selector, rule in entries]
+        for kind, bases in ELEMENT_BASES.items():
+            unindexed = []
+            by_key: Dict[str, List[Tuple[int, Selector, Rule]]] = {}
+            for entry in entries:
+                if entry[1].subject.base not in bases:
+                    continue
+                if entry[1].index_key is None:
+                    unindexed.append(entry)
+                else:
+                    by_key.setdefault(entry[1].index_key, []).append(entry)
+            self._candidates[kind] = (unindexed, by_key)
+
+    def candidates(self, element: OsmElement, kind: str, use_index: bool = True) -> List[Tuple[int, Selector, Rule]]:
+        """Selectors to test against an element, in stylesheet order."""
+        unindexed, by_key = self._candidates[kind]
+        if not use_index:
+            entries = list(unindexed)
+            for key_entries in by_key.values():
+                entries.extend(key_entries)
+            entries.sort(key=lambda entry: entry[0])
+            return entries
+        entries = list(unindexed)
+        for key in element.tags:
+            key_entries = by_key.get(key)
+            if key_entries:
+                entries.extend(key_entries)
+        if len(entries) != len(unindexed):
+            entries.sort(key=lambda entry: entry[0])
+        return entries
+
+    @property
+    def object_rules(self) -> List[Rule]:
+        return [rule for rule in self.rules if rule.is_object_rule]
+
+    def selectors(self) -> Iterable[Tuple[Rule, Selector]]:
+        for rule in self.rules:
+            for selector in rule.selectors:
+                yield rule, selector
+
+def parse_stylesheet(text: str) -> Stylesheet:
+    """Parse MapCSS source text."""
+    scanner = _Scanner(text)
+    rules = []
+    while True:
+        scanner.skip_blanks()
+        if scanner.position >= len(text):
+            break
+        start = scanner.position
+        line = scanner.line()
+        selector_text = scanner.read_until("{")
+        block_start = scanner.position
+        scanner.position += 1
+        block_line = scanner.line()
+        block = scanner.read_until("}")
+        scanner.position += 1
+
+        selectors = [parse_selector(part, line) for part in _split_top_level(selector_text, ",") if _strip_comments(part).strip()]
+        rules.append(Rule(selectors, parse_declarations(block, block_line), start, scanner.position, line, block_start))
+    return Stylesheet(text, rules)
+
+def load_stylesheet(path: str) -> Stylesheet:
+    with open(path, "r", encoding="utf-8") as f:
+        return parse_stylesheet(f.read())
+
+#########################
+# Applying a stylesheet #
+#########################
+
+def apply_stylesheet(stylesheet: Stylesheet, element: OsmElement, zoom: int, dataset: Optional[OsmDataset] = None,
+                     settings: Optional[Dict[str, Any]] = None, stats: Optional[EvaluationStats] = None,
+                     use_index: bool = True) -> Dict[str, Dict[str, Any]]:
+    """Compute the style of an element at a zoom level, as properties per layer."""
+    if stats is None:
+        stats = EvaluationStats(len(stylesheet.rules))
+    env = Environment(element, dataset, zoom, settings if settings is not None else stylesheet.settings, stats)
+    kind = element_kind(element)
+    stats.objects += 1
+    last_rule = -1
+    per_selector = bool(stats.selector_tests)
+    for order, selector, rule in stylesheet.candidates(element, kind, use_index):
+        env.parent = None
+        if per_selector:
+            stats.selector_tests[order] += 1
+        if not selector.matches(element, env, kind):
+            continue
+        if per_selector:
+            stats.selector_hits[order] += 1
+        if rule.index != last_rule:
+            stats.rule_hits[rule.index] += 1
+            last_rule = rule.index
+        rule.execute(env, element, selector.layer)
+    return env.layers
+
+def resolved_style(layers: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Visible properties per layer, without classes."""
+    style = {}
+    for layer, cascade in layers.items():
+        properties = {key: value for key, value in cascade.items() if not key.startswith(".")}
+        if properties:
+            style[layer] = properties
+    return style
+
+def style_signature(style: Dict[str, Dict[str, Any]]) -> str:
+    """Hashable representation of a resolved style, equal for equal styles."""
+    return repr(sorted((layer, sorted(properties.items(), key=repr)) for layer, properties in style.items()))
+
+def evaluate_dataset(stylesheet: Stylesheet, dataset: OsmDataset, zooms: List[int], settings: Optional[Dict[str, Any]] = None,
+                     use_index: bool = True, on_style: Optional[Callable[[int, OsmElement, Dict[str, Dict[str, Any]]], None]] = None) -> Dict[str, Any]:
+    """Apply a stylesheet to every object of a dataset at each zoom level and report counts and timings."""
+    effective_settings = dict(stylesheet.settings)
+    effective_settings.update(settings or {})
+    report = {"rules": len(stylesheet.object_rules), "selectors": sum(1 for rule, selector in stylesheet.selectors() if rule.is_object_rule), "zooms": {}}
+    total = EvaluationStats(len(stylesheet.rules))
+
+    for zoom in zooms:
+        stats = EvaluationStats(len(stylesheet.rules))
+        distinct_styles = set()
+        styled_objects = 0
+        start = time.perf_counter()
+        for element in dataset:
+            style = resolved_style(apply_stylesheet(stylesheet, element, zoom, dataset, effective_settings, stats, use_index))
+            if style:
+                styled_objects += 1
+                distinct_styles.add(style_signature(style))
+                if on_style is not None:
+                    on_style(zoom, element, style)
+        seconds = time.perf_counter() - start
+
+        zoom_report = stats.as_dict()
+        zoom_report["styled_objects"] = styled_objects
+        zoom_report["distinct_styles"] = len(distinct_styles)
+        zoom_report["seconds"] = round(seconds, 4)
+        report["zooms"][str(zoom)] = zoom_report
+        total.merge(stats)
+
+    report["total"] = total.as_dict()
+    report["total"]["seconds"] = round(sum(zoom["seconds"] for zoom in report["zooms"].values()), 4)
+    report["rule_hits"] = total.rule_hits
+    return report
+
+#####################
+# Style cardinality #
+#####################
+
+def format_zoom(min_zoom: int, max_zoom: int) -> str:
+    """Zoom range text of a simple selector, the reverse of parse_zoom()."""
+    if min_zoom <= 0 and max_zoom >= 99:
+        return ""
+    if max_zoom >= 99:
+        return f"|z{min_zoom}-"
+    if min_zoom <= 0:
+        return f"|z-{max_zoom}"
+    if min_zoom == max_zoom:
+        return f"|z{min_zoom}"
+    return f"|z{min_zoom}-{max_zoom}"
+
+def zoom_bands(stylesheet: Stylesheet) -> List[Tuple[int, int]]:
+    """Zoom ranges within which no selector starts or stops applying."""
+    cuts = {0}
+    for rule, selector in stylesheet.selectors():
+        for part in selector.parts:
+            cuts.add(part.min_zoom)
+            if part.max_zoom < 99:
+                cuts.add(part.max_zoom + 1)
+    cuts = sorted(cut for cut in cuts if cut <= 99)
+    return [(low, high - 1) for low, high in zip(cuts, cuts[1:])] + [(cuts[-1], 99)]
+
+def style_cardinality(stylesheet: Stylesheet, dataset: OsmDataset, settings: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Count the distinct styles a stylesheet produces on a dataset per zoom band, and which properties split them most."""
+    effective_settings = dict(stylesheet.settings)
+    effective_settings.update(settings or {})
+    report = {"bands": [], "distinct_styles": 0, "properties": {}}
+    split_counts: Dict[str, int] = {}
+    property_values: Dict[str, set] = {}
+
+    for min_zoom, max_zoom in zoom_bands(stylesheet):
+        styles = {}
+        for element in dataset:
+            style = resolved_style(apply_stylesheet(stylesheet, element, min_zoom, dataset, effective_settings))
+            if style:
+                styles[style_signature(style)] = style
+
+        # Distinct styles left when a property is ignored tell how many styles it alone creates
+        names = {f"{layer}/{name}" for style in styles.values() for layer, properties in style.items() for name in properties}
+        for qualified in names:
+            layer_name, name = qualified.split("/", 1)
+            without = set()
+            for style in styles.values():
+                reduced = {layer: {key: value for key, value in properties.items() if layer != layer_name or key != name} for layer, properties in style.items()}
+                without.add(style_signature(reduced))
+                if name in style.get(layer_name, {}):
+                    property_values.setdefault(qualified, set()).add(repr(style[layer_name][name]))
+            split_counts[qualified] = split_counts.get(qualified, 0) + len(styles) - len(without)
+
+        label = f"{min_zoom}-" if max_zoom >= 99 else f"{min_zoom}-{max_zoom}" if max_zoom > min_zoom else str(min_zoom)
+        report["bands"].append({"zooms": label, "distinct_styles": len(styles)})
+        report["distinct_styles"] += len(styles)
+
+    # Properties only splitting styles together with others still show up through their number of values
+    report["properties"] = {
+        name: {"values": len(property_values.get(name, ())), "styles_created": count}
+        for name, count in sorted(split_counts.items(), key=lambda item: (-item[1], -len(property_values.get(item[0], ())), item[0]))
+        if count or len(property_values.get(name, ())) > 1
+    }
+    return report
+
+###############
+# Static cost #
+###############
+
+# Relative cost of evaluating one condition of each kind
+CONDITION_COSTS = {
+    KeyCondition: 1.0,
+    KeyValueCondition: 1.0,
+    RegexpCondition: 4.0,
+    KeyRegexpCondition: 20.0,
+    ExpressionCondition: 2.0,
+    ClassCondition: 0.5,
+    PseudoClassCondition: 1.0,
+}
+
+# Extra cost of each function call inside an expression
+FUNCTION_CALL_COST = 3.0
+
+# Cost of looking up the parents of an object, for child selectors and :unconnected/:connection
+PARENT_LOOKUP_COST = 10.0
+
+# Share of objects a selector indexed by a key is tested against, unindexed selectors are tested against all
+INDEXED_REACH = 0.1
+
+def condition_cost(condition: Condition) -> float:
+    cost = CONDITION_COSTS.get(type(condition), 1.0)
+    if isinstance(condition, ExpressionCondition):
+        cost += FUNCTION_CALL_COST * len(condition.expression.function_names())
+    if isinstance(condition, PseudoClassCondition) and condition.name in ("unconnected", "connection"):
+        cost += PARENT_LOOKUP_COST
+    return cost
+
+def estimate_selector_cost(selector: Selector) -> Dict[str, float]:
+    """Estimate the cost of testing a selector against the objects of a dataset.
+
+    The cost of one test (all conditions evaluated, parent lookups included) is
+    weighted by the share of objects the selector reaches through the rule index.
+    """
+    test_cost = 1.0 + sum(condition_cost(condition) for condition in selector.subject.conditions)
+    for part, (combinator, link_conditions) in zip(selector.parts[:-1], selector.links):
+        test_cost += PARENT_LOOKUP_COST + sum(condition_cost(condition) for condition in part.conditions + link_conditions)
+    reach = 1.0 if selector.index_key is None else INDEXED_REACH
+    return {"test_cost": test_cost, "reach": reach, "cost": round(test_cost * reach, 3)}
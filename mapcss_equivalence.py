@@ -0,0 +1,375 @@
+"""Check that two MapCSS styles paint the same objects the same way.
+
+Cases are random objects, built from the keys and values the selectors of both
+styles test: values at either side of numeric thresholds such as voltage bounds,
+multi-valued voltages, construction:/disused:/removed: lifecycle prefixes and parent
+ways or relations for child selectors, evaluated at the zoom levels where selectors
+start or stop applying. Each case is seeded from its number, so a run gives the same
+cases whatever the number of worker processes, and failing cases are shrunk to a
+minimal counterexample. Properties only read back by other rules with prop() are
+not compared, as JOSM does not paint them.
+"""
+import concurrent.futures
+import random
+import re
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from mapcss_engine import (ClassCondition, ExpressionCondition, KeyCondition, KeyRegexpCondition, KeyValueCondition, RegexpCondition,
+                           Stylesheet, apply_stylesheet, parse_stylesheet, resolved_style, zoom_bands)
+from mapcss_optimize import regex_alternatives
+from osm_extract import OsmDataset, OsmElement
+
+LIFECYCLE_PREFIXES = ["construction:", "disused:", "removed:"]
+
+# Share of the cases per kind of object, the subject of the case
+CASE_KINDS = [("node", 35), ("way", 35), ("area", 15), ("relation", 15)]
+
+# Highest zoom level tested
+MAX_ZOOM = 24
+
+# Cases given to a worker process at once
+CHUNK_SIZE = 250
+
+def _number_text(number: float) -> str:
+    return str(int(number)) if number == int(number) else str(number)
+
+def _pattern_strings(pattern: Optional[str]) -> List[str]:
+    """Strings matched by a regex: all of them for simple anchored regexes, its literal words otherwise."""
+    if pattern is None:
+        return []
+    return regex_alternatives(pattern) or re.findall(r"[\w:.-]+", re.sub(r"\\.", " ", pattern))
+
+def tag_pool(stylesheets: List[Stylesheet]) -> Dict[str, List[str]]:
+    """Values worth testing for each key the styles test.
+
+    Numeric comparisons, in conditions or eval expressions, give the bound itself and
+    the values just below and above it.
+    """
+    values: Dict[str, set] = {}
+    bounds: Dict[str, set] = {}
+    for stylesheet in stylesheets:
+        for rule, selector in stylesheet.selectors():
+            for part in selector.parts:
+                for condition in part.conditions:
+                    if isinstance(condition, KeyCondition):
+                        values.setdefault(condition.key, set()).update(["yes", "no"] if condition.truth is not None else ["yes"])
+                    elif isinstance(condition, KeyValueCondition):
+                        if condition.number is not None:
+                            bounds.setdefault(condition.key, set()).add(condition.number)
+                        else:
+                            values.setdefault(condition.key, set()).add(condition.value)
+                    elif isinstance(condition, RegexpCondition):
+                        values.setdefault(condition.key, set()).update(_pattern_strings(condition.pattern) or ["yes"])
+                    elif isinstance(condition, KeyRegexpCondition):
+                        for key in _pattern_strings(condition.key_pattern):
+                            values.setdefault(key, set()).update(_pattern_strings(condition.value_pattern) or ["yes"])
+                    elif isinstance(condition, ExpressionCondition):
+                        numbers = [float(number) for number in re.findall(r"(?<![\w.])\d+(?:\.\d+)?", condition.text)]
+                        for key in re.findall(r'tag\(\s*"?([^")]+?)"?\s*\)', condition.text):
+                            values.setdefault(key, set()).add("yes")
+                            bounds.setdefault(key, set()).update(number for number in numbers if number >= 1)
+
+    for key, numbers in bounds.items():
+        values.setdefault(key, set()).update(_number_text(value) for number in numbers for value in (number - 1, number, number + 1) if value >= 0)
+    return {key: sorted(key_values) for key, key_values in sorted(values.items())}
+
+def test_zooms(stylesheets: List[Stylesheet]) -> List[int]:
+    """Zoom levels at which a selector of either style starts or stops applying."""
+    zooms = {0, MAX_ZOOM}
+    for stylesheet in stylesheets:
+        for low, high in zoom_bands(stylesheet):
+            zooms.update(zoom for zoom in (low, high) if zoom <= MAX_ZOOM)
+    return sorted(zooms)
+
+#########
+# Cases #
+#########
+
+def random_tags(rnd: random.Random, pool: Dict[str, List[str]]) -> Dict[str, str]:
+    """Random tags, most often with power and voltage tags, sometimes multi-valued or behind a lifecycle prefix."""
+    keys = list(pool)
+    tags = {}
+    for key, chance in (("power", 0.6), ("voltage", 0.5)):
+        if key in pool and rnd.random() < chance:
+            tags[key] = rnd.choice(pool[key])
+    for _ in range(rnd.randint(0 if tags else 1, 3)):
+        key = rnd.choice(keys)
+        tags[key] = rnd.choice(pool[key])
+    if "voltage" in tags and rnd.random() < 0.3:
+        tags["voltage"] += ";" + rnd.choice(pool["voltage"])
+    if "power" in tags and rnd.random() < 0.15:
+        tags[rnd.choice(LIFECYCLE_PREFIXES) + "power"] = tags.pop("power")
+    return tags
+
+# Kinds of case subject matching each selector base
+BASE_KINDS = {"node": ["node"], "way": ["way", "area"], "line": ["way"], "area": ["area"], "relation": ["relation"],
+              "*": ["node", "way", "area", "relation"]}
+
+def case_targets(stylesheets: List[Stylesheet]) -> List[Dict[str, Any]]:
+    """Object selectors of both styles, which cases are built from."""
+    targets = []
+    for stylesheet in stylesheets:
+        for rule, selector in stylesheet.selectors():
+            subject = selector.subject
+            if not rule.is_object_rule or subject.base not in BASE_KINDS:
+                continue
+            parent = selector.parts[-2] if len(selector.parts) > 1 else None
+            zooms = [zoom for zoom in (subject.min_zoom - 1, subject.min_zoom, subject.max_zoom, subject.max_zoom + 1) if 0 <= zoom <= MAX_ZOOM]
+            targets.append({"kinds": BASE_KINDS[subject.base], "conditions": subject.conditions,
+                            "parent": parent.conditions if parent is not None else None, "zooms": zooms or [MAX_ZOOM]})
+    return targets
+
+def class_setters(stylesheets: List[Stylesheet]) -> Dict[str, List[List[Any]]]:
+    """Conditions of the selectors setting each class, to build objects which get the class."""
+    setters: Dict[str, List[List[Any]]] = {}
+    for stylesheet in stylesheets:
+        for rule in stylesheet.object_rules:
+            for declaration in rule.declarations:
+                if declaration.class_name:
+                    setters.setdefault(declaration.class_name, []).extend(selector.subject.conditions for selector in rule.selectors)
+    return setters
+
+def _bound_values(rnd: random.Random, numbers: List[float]) -> str:
+    number = rnd.choice(numbers)
+    return _number_text(max(number + rnd.choice([-1, 0, 1]), 0))
+
+def matching_tags(rnd: random.Random, conditions: List[Any], pool: Dict[str, List[str]],
+                  setters: Optional[Dict[str, List[List[Any]]]] = None, depth: int = 0) -> Dict[str, str]:
+    """Tags meeting the conditions of a selector, or just missing them for numeric bounds.
+
+    Keys compared to several bounds, such as [voltage>=132000][voltage<200000], get a
+    value next to one of them. Keys split on ";" by eval expressions often get two
+    values, with the bound as first or second one. Class conditions take the tags of
+    a selector setting the class.
+    """
+    tags = {}
+    bounds: Dict[str, List[float]] = {}
+    split_keys = set()
+    for condition in conditions:
+        if isinstance(condition, ClassCondition):
+            if not condition.negated and setters and condition.name in setters and depth < 3:
+                tags.update(matching_tags(rnd, rnd.choice(setters[condition.name]), pool, setters, depth + 1))
+        elif isinstance(condition, KeyCondition):
+            if condition.negated:
+                tags.pop(condition.key, None)
+            else:
+                tags[condition.key] = "no" if condition.truth is False else "yes"
+        elif isinstance(condition, KeyValueCondition):
+            if condition.number is not None:
+                bounds.setdefault(condition.key, []).append(condition.number)
+            elif condition.operator == "!=":
+                if rnd.random() < 0.5:
+                    tags[condition.key] = rnd.choice(pool.get(condition.key, ["yes"]))
+            else:
+                tags[condition.key] = condition.value
+        elif isinstance(condition, RegexpCondition):
+            if not condition.negated:
+                tags[condition.key] = rnd.choice(_pattern_strings(condition.pattern) or ["yes"])
+        elif isinstance(condition, KeyRegexpCondition):
+            if not condition.negated:
+                tags[rnd.choice(_pattern_strings(condition.key_pattern) or ["yes"])] = rnd.choice(_pattern_strings(condition.value_pattern) or ["yes"])
+        elif isinstance(condition, ExpressionCondition):
+            numbers = [float(number) for number in re.findall(r"(?<![\w.])\d+(?:\.\d+)?", condition.text) if float(number) >= 1]
+            for key in re.findall(r'tag\(\s*"?([^")]+?)"?\s*\)', condition.text):
+                if numbers:
+                    bounds.setdefault(key, []).extend(numbers)
+                    if 'split(";"' in condition.text:
+                        split_keys.add(key)
+                else:
+                    tags[key] = rnd.choice(pool.get(key, ["yes"]))
+    for key, numbers in bounds.items():
+        tags[key] = _bound_values(rnd, numbers)
+        if key in split_keys and rnd.random() < 0.5:
+            values = [tags[key], rnd.choice(pool.get(key, [tags[key]]))]
+            rnd.shuffle(values)
+            tags[key] = ";".join(values)
+    return tags
+
+def mutate_tags(rnd: random.Random, tags: Dict[str, str], pool: Dict[str, List[str]]) -> Dict[str, str]:
+    """Tags with an extra random tag, a second voltage or a lifecycle prefix, now and then."""
+    tags = dict(tags)
+    if rnd.random() < 0.3:
+        key = rnd.choice(list(pool))
+        tags[key] = rnd.choice(pool[key])
+    if "voltage" in tags and "voltage" in pool and rnd.random() < 0.3:
+        tags["voltage"] += ";" + rnd.choice(pool["voltage"])
+    if "power" in tags and rnd.random() < 0.1:
+        tags[rnd.choice(LIFECYCLE_PREFIXES) + "power"] = tags.pop("power")
+    return tags
+
+def random_case(rnd: random.Random, pool: Dict[str, List[str]], zooms: List[int], targets: List[Dict[str, Any]],
+                setters: Optional[Dict[str, List[List[Any]]]] = None) -> Dict[str, Any]:
+    """A random object with its tags, the tags of a parent way or relation and the zoom level to test.
+
+    Most cases are built to match a random selector of either style, at the edges of
+    its zoom range; the others get random tags at a random zoom level.
+    """
+    if targets and rnd.random() < 0.8:
+        target = rnd.choice(targets)
+        kind = rnd.choice(target["kinds"])
+        parent = None
+        if target["parent"] is not None and kind != "relation":
+            parent = mutate_tags(rnd, matching_tags(rnd, target["parent"], pool, setters), pool)
+        elif kind != "relation" and rnd.random() < 0.1:
+            parent = random_tags(rnd, pool)
+        return {"kind": kind, "tags": mutate_tags(rnd, matching_tags(rnd, target["conditions"], pool, setters), pool),
+                "parent": parent, "zoom": rnd.choice(target["zooms"])}
+
+    kind = rnd.choices([kind for kind, weight in CASE_KINDS], [weight for kind, weight in CASE_KINDS])[0]
+    return {
+        "kind": kind,
+        "tags": random_tags(rnd, pool),
+        "parent": random_tags(rnd, pool) if kind != "relation" and rnd.random() < 0.3 else None,
+        "zoom": rnd.choice(zooms) if rnd.random() < 0.7 else rnd.randint(0, MAX_ZOOM),
+    }
+
+def case_dataset(case: Dict[str, Any]) -> Tuple[OsmDataset, OsmElement]:
+    """Objects of a case and its subject: a node on a way, a way or area in a relation, or a relation of one way."""
+    elements = [OsmElement("node", node_id, {}, 0.0, node_id * 0.001) for node_id in (2, 3, 4)]
+    kind, tags, parent = case["kind"], dict(case["tags"]), case["parent"]
+    if kind == "node":
+        subject = OsmElement("node", 1, tags, 0.0, 0.0)
+        elements.append(subject)
+        if parent is not None:
+            elements.append(OsmElement("way", 10, dict(parent), nodes=[1, 2, 3]))
+    elif kind == "relation":
+        subject = OsmElement("relation", 20, tags, members=[("way", 10, "")])
+        elements += [OsmElement("way", 10, {}, nodes=[2, 3, 4, 2]), subject]
+    else:
+        subject = OsmElement("way", 10, tags, nodes=[2, 3, 4, 2] if kind == "area" else [2, 3, 4])
+        elements.append(subject)
+        if parent is not None:
+            elements.append(OsmElement("relation", 20, dict(parent), members=[("way", 10, "")]))
+    return OsmDataset(iter(elements)), subject
+
+def helper_properties(stylesheets: List[Stylesheet]) -> Set[str]:
+    """Properties read back with prop(), such as voltage_1st, which hold values for other rules rather than paint."""
+    return {name for stylesheet in stylesheets for name in re.findall(r'\bprop\(\s*"?([\w:-]+)', stylesheet.text)}
+
+def case_styles(stylesheets: List[Stylesheet], case: Dict[str, Any], settings: Optional[Dict[str, Any]] = None,
+                ignored: Set[str] = frozenset()) -> List[Dict[str, Dict[str, Any]]]:
+    """Resolved style of the subject of a case with each stylesheet, without the ignored properties."""
+    dataset, subject = case_dataset(case)
+    styles = []
+    for stylesheet in stylesheets:
+        effective_settings = dict(stylesheet.settings)
+        effective_settings.update(settings or {})
+        style = resolved_style(apply_stylesheet(stylesheet, subject, case["zoom"], dataset, effective_settings))
+        styles.append({layer: {name: value for name, value in properties.items() if name not in ignored} for layer, properties in style.items()})
+    return styles
+
+def style_differences(style_a: Dict[str, Dict[str, Any]], style_b: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, List[Any]]]:
+    """Properties with different values, per layer, as [value in a, value in b]."""
+    differences = {}
+    for layer in sorted(set(style_a) | set(style_b)):
+        properties_a, properties_b = style_a.get(layer, {}), style_b.get(layer, {})
+        layer_differences = {name: [properties_a.get(name), properties_b.get(name)]
+                             for name in sorted(set(properties_a) | set(properties_b)) if properties_a.get(name) != properties_b.get(name)}
+        if layer_differences:
+            differences[layer] = layer_differences
+    return differences
+
+def case_differences(stylesheets: List[Stylesheet], case: Dict[str, Any], settings: Optional[Dict[str, Any]] = None,
+                     ignored: Set[str] = frozenset()) -> Dict[str, Dict[str, List[Any]]]:
+    return style_differences(*case_styles(stylesheets, case, settings, ignored))
+
+def shrink_case(stylesheets: List[Stylesheet], case: Dict[str, Any], settings: Optional[Dict[str, Any]] = None,
+                ignored: Set[str] = frozenset()) -> Dict[str, Any]:
+    """Smallest case still telling the styles apart: no parent if possible, fewest tags, single voltages."""
+    def fails(candidate):
+        return bool(case_differences(stylesheets, candidate, settings, ignored))
+
+    case = dict(case, tags=dict(case["tags"]), parent=dict(case["parent"]) if case["parent"] is not None else None)
+    if case["parent"] is not None and fails(dict(case, parent=None)):
+        case["parent"] = None
+
+    changed = True
+    while changed:
+        changed = False
+        for field in ("tags", "parent"):
+            tags = case[field]
+            if tags is None:
+                continue
+            for key in list(tags):
+                smaller = {k: v for k, v in tags.items() if k != key}
+                if fails(dict(case, **{field: smaller})):
+                    case[field] = tags = smaller
+                    changed = True
+                    continue
+                for value in tags[key].split(";") if ";" in tags[key] else []:
+                    simpler = dict(tags, **{key: value})
+                    if fails(dict(case, **{field: simpler})):
+                        case[field] = tags = simpler
+                        changed = True
+                        break
+    return case
+
+def example_signature(example: Dict[str, Any]) -> str:
+    """Same signature for counterexamples of the same kind, keys and differing properties, whatever their values and zoom."""
+    case = example["object"]
+    return repr((case["kind"], sorted(case["tags"]), sorted(case["parent"]) if case["parent"] is not None else None,
+                 sorted((layer, sorted(properties)) for layer, properties in example["differences"].items())))
+
+############
+# Checking #
+############
+
+# Stylesheets, case targets, class setters and helper properties of each worker process, by style texts
+_PARSED: Dict[Tuple[str, str], Tuple[List[Stylesheet], List[Dict[str, Any]], Dict[str, List[List[Any]]], Set[str]]] = {}
+
+def _parsed(text_a: str, text_b: str) -> Tuple[List[Stylesheet], List[Dict[str, Any]], Dict[str, List[List[Any]]], Set[str]]:
+    if (text_a, text_b) not in _PARSED:
+        stylesheets = [parse_stylesheet(text_a), parse_stylesheet(text_b)]
+        _PARSED[(text_a, text_b)] = stylesheets, case_targets(stylesheets), class_setters(stylesheets), helper_properties(stylesheets)
+    return _PARSED[(text_a, text_b)]
+
+def check_cases(task: Tuple[str, str, Dict[str, List[str]], List[int], int, int, int, Optional[Dict[str, Any]], int]) -> Dict[str, Any]:
+    """Run a range of cases, returning the number of failing cases and up to max_examples minimal counterexamples."""
+    text_a, text_b, pool, zooms, seed, first, count, settings, max_examples = task
+    stylesheets, targets, setters, ignored = _parsed(text_a, text_b)
+    failures = shrunk = 0
+    examples: Dict[str, Dict[str, Any]] = {}
+    for index in range(first, first + count):
+        case = random_case(random.Random(f"{seed}:{index}"), pool, zooms, targets, setters)
+        if not case_differences(stylesheets, case, settings, ignored):
+            continue
+        failures += 1
+        # Shrinking is costly, stop once failures keep giving known counterexamples
+        if len(examples) < max_examples and shrunk < 5 * max_examples:
+            shrunk += 1
+            minimal = shrink_case(stylesheets, case, settings, ignored)
+            example = {"case": index, "object": minimal, "differences": case_differences(stylesheets, minimal, settings, ignored)}
+            examples.setdefault(example_signature(example), example)
+    return {"cases": count, "failures": failures, "examples": list(examples.values())}
+
+def check_equivalence(text_a: str, text_b: str, cases: int = 2000, seed: int = 0, jobs: Optional[int] = None,
+                      settings: Optional[Dict[str, Any]] = None, max_examples: int = 10) -> Dict[str, Any]:
+    """Compare the styles two stylesheets give to random cases, in parallel, and report the minimal counterexamples."""
+    stylesheets = [parse_stylesheet(text_a), parse_stylesheet(text_b)]
+    pool = tag_pool(stylesheets)
+    if not pool:
+        raise ValueError("the styles test no tags to generate cases from")
+    zooms = test_zooms(stylesheets)
+    tasks = [(text_a, text_b, pool, zooms, seed, first, min(CHUNK_SIZE, cases - first), settings, max_examples)
+             for first in range(0, cases, CHUNK_SIZE)]
+
+    if jobs == 1 or len(tasks) <= 1:
+        results = [check_cases(task) for task in tasks]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+            results = list(executor.map(check_cases, tasks))
+
+    examples: Dict[str, Dict[str, Any]] = {}
+    for result in results:
+        for example in result["examples"]:
+            examples.setdefault(example_signature(example), example)
+    examples_list = sorted(examples.values(), key=lambda example: (len(example["object"]["tags"]), example["case"]))[:max_examples]
+    return {
+        "cases": cases,
+        "seed": seed,
+        "keys": len(pool),
+        "zooms": zooms,
+        "failures": sum(result["failures"] for result in results),
+        "equivalent": all(result["failures"] == 0 for result in results),
+        "examples": examples_list,
+    }
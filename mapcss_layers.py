@@ -0,0 +1,110 @@
+"""Split generated MapCSS styles into one stylesheet per layer.
+
+JOSM applies every active style source in turn to the same objects, so a style cut
+into nodes, areas, lines, circuits and overlays files paints the same map when all
+of them are loaded, while mappers can switch the costly ones off on dense grids.
+"""
+import os
+import re
+from typing import Any, Dict, List, Set
+
+from mapcss_engine import ClassCondition, Stylesheet, parse_stylesheet
+
+# Layers in the order they appear in generated styles, with the comment starting each of them.
+# Rules after the shared marker define the .voltage_* colour classes used by several layers.
+LAYER_MARKERS = [
+    ("nodes", "/* Power nodes and supports */"),
+    ("areas", "/* Area styling */"),
+    ("lines", "/* Line styling */"),
+    ("circuits", "/* Power circuits relations */"),
+    ("overlays", "/* Osmose issue styling */"),
+]
+SHARED_MARKER = "/* Common colours classes */"
+
+def _section_start(text: str, position: int) -> int:
+    """Start of the line holding a marker, including the comment box drawn around it."""
+    start = text.rfind("\n", 0, position) + 1
+    while start > 0:
+        previous = text.rfind("\n", 0, start - 1) + 1
+        if not re.fullmatch(r"/\*+\*/", text[previous:start - 1].strip()):
+            break
+        start = previous
+    return start
+
+def _set_classes(stylesheet: Stylesheet) -> Set[str]:
+    return {declaration.class_name for rule in stylesheet.rules for declaration in rule.declarations if declaration.class_name}
+
+def _tested_classes(stylesheet: Stylesheet) -> Set[str]:
+    return {condition.name for rule, selector in stylesheet.selectors() for part in selector.parts
+            for condition in part.conditions if isinstance(condition, ClassCondition)}
+
+def _remove(text: str, start: int, end: int) -> str:
+    """Text without a rule, its line break and the blank line after it."""
+    rest = text[end:]
+    return text[:start] + (rest[2:] if rest.startswith("\n\n") else rest[1:] if rest.startswith("\n") else rest)
+
+def _layer_header(header: str, layer: str, settings: Set[str], object_rules: bool) -> str:
+    """Header of a layer file: meta block with the layer in its title, canvas defaults and the settings it uses.
+
+    Object rules of the header, such as node { text: auto; }, are only kept in the
+    first layer, as repeating them in later files would override the rules between.
+    """
+    for rule in reversed(parse_stylesheet(header).rules):
+        selector = rule.selectors[0]
+        if selector.parts[0].base == "setting" and selector.layer not in settings or rule.is_object_rule and not object_rules:
+            header = _remove(header, rule.start, rule.end)
+    if not settings:
+        header = header.replace("/* Settings */\n", "")
+    return re.sub(r'(\btitle:\s*")([^"]*)(")', lambda match: f"{match.group(1)}{match.group(2)} ({layer}){match.group(3)}", header, count=1)
+
+def annotate_layer(layer: str, rules: int, text: str) -> str:
+    """Layer stylesheet starting with a comment giving its name and number of rules."""
+    return f"/* Layer '{layer}': {rules} rules. Load it alone or with the other layers of this style. */\n\n" + text
+
+def split_layers(text: str) -> List[Dict[str, Any]]:
+    """Cut a generated style into one stylesheet per layer.
+
+    Each file gets the meta and canvas header, the settings its rules read and, when
+    it sets .voltage_* classes, the shared colour classes, so that it works alone as
+    well as together with the others. Returns the layers with rules in the style, each
+    with its name, text, number of rules and the classes it needs from other layers.
+    """
+    positions = [(text.find(marker), layer) for layer, marker in LAYER_MARKERS if text.find(marker) >= 0]
+    if not positions:
+        raise ValueError(f"the style has none of the layer markers ({', '.join(marker for layer, marker in LAYER_MARKERS)})")
+    shared_position = text.find(SHARED_MARKER)
+    end = _section_start(text, shared_position) if shared_position >= 0 else len(text)
+
+    starts = [(_section_start(text, position), layer) for position, layer in sorted(positions)]
+    header = text[:starts[0][0]]
+    shared = text[end:].strip("\n") + "\n" if shared_position >= 0 else ""
+    shared_tested = _tested_classes(parse_stylesheet(shared))
+
+    layers = []
+    for i, (start, layer) in enumerate(starts):
+        body = text[start:starts[i + 1][0] if i + 1 < len(starts) else end].strip("\n") + "\n"
+        body_stylesheet = parse_stylesheet(body)
+        if not body_stylesheet.object_rules:
+            continue
+        parts = [body]
+        if _set_classes(body_stylesheet) & shared_tested:
+            parts.append(shared)
+        settings = set(re.findall(r'setting\("([^"]+)"\)', "\n".join(parts)))
+        content = "\n".join([_layer_header(header, layer, settings, not layers).strip("\n") + "\n"] + parts)
+        rules = len(parse_stylesheet(content).object_rules)
+        layer_text = annotate_layer(layer, rules, content)
+        layers.append({"layer": layer, "text": layer_text, "rules": rules,
+                       "sets": _set_classes(body_stylesheet), "tests": _tested_classes(body_stylesheet)})
+
+    # Classes only set by other layers, whose rules then only match when those layers are loaded too
+    for layer in layers:
+        others = {name for other in layers if other is not layer for name in other["sets"]}
+        layer["needs"] = sorted((layer.pop("tests") - layer["sets"]) & others)
+    for layer in layers:
+        del layer["sets"]
+    return layers
+
+def layer_file(output_file: str, layer: str) -> str:
+    """Name of the file of a layer, next to the combined style."""
+    stem, extension = os.path.splitext(output_file)
+    return f"{stem}-{layer}{extension or '.mapcss'}"
@@ -0,0 +1,671 @@
+"""Optimisation passes over rendered MapCSS styles.
+
+Each pass takes the text of a generated style and returns the rewritten text with
+a report of what it changed. Passes must keep the style selecting and painting
+exactly the same objects.
+"""
+import itertools
+import re
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from mapcss_engine import (ELEMENT_BASES, ClassCondition, Condition, Declaration, ExpressionCondition, KeyCondition,
+                           KeyRegexpCondition, KeyValueCondition, RegexpCondition, Rule, Selector, SimpleSelector, element_kind,
+                           format_zoom, parse_selector, parse_stylesheet)
+from osm_extract import OsmElement, iter_elements
+
+# Maximum number of selectors a single selector may be expanded into
+MAX_EXPANDED_SELECTORS = 16
+
+# Distinct values remembered per key and kind of object, beyond which any value is assumed to be present
+MAX_INVENTORY_VALUES = 1000
+
+#######################
+# Regular expressions #
+#######################
+
+class _Unbounded(Exception):
+    """The regex matches strings which cannot be listed."""
+
+def _split_alternatives(pattern: str) -> List[str]:
+    pieces = []
+    depth = 0
+    current = ""
+    position = 0
+    while position < len(pattern):
+        char = pattern[position]
+        if char == "\\":
+            current += pattern[position:position + 2]
+            position += 2
+            continue
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "|" and depth == 0:
+            pieces.append(current)
+            current = ""
+            position += 1
+            continue
+        current += char
+        position += 1
+    pieces.append(current)
+    return pieces
+
+def _expand(body: str, limit: int) -> List[str]:
+    position = 0
+
+    def alternation() -> List[str]:
+        nonlocal position
+        options = sequence()
+        while position < len(body) and body[position] == "|":
+            position += 1
+            options = options + sequence()
+        return options
+
+    def sequence() -> List[str]:
+        nonlocal position
+        results = [""]
+        while position < len(body) and body[position] not in "|)":
+            options = atom()
+            if position < len(body) and body[position] == "?":
+                position += 1
+                options = [""] + options
+            elif position < len(body) and body[position] in "*+{":
+                raise _Unbounded()
+            results = [result + option for result in results for option in options]
+            if len(results) > limit:
+                raise _Unbounded()
+        return results
+
+    def atom() -> List[str]:
+        nonlocal position
+        char = body[position]
+        if char == "(":
+            position += 1
+            if body.startswith("?:", position):
+                position += 2
+            elif body.startswith("?", position):
+                raise _Unbounded()
+            options = alternation()
+            if position >= len(body) or body[position] != ")":
+                raise _Unbounded()
+            position += 1
+            return options
+        if char == "\\":
+            if position + 1 >= len(body) or body[position + 1].isalnum():
+                raise _Unbounded()
+            position += 2
+            return [body[position - 1]]
+        if char in ".[]{}*+^$?":
+            raise _Unbounded()
+        position += 1
+        return [char]
+
+    results = alternation()
+    if position != len(body):
+        raise _Unbounded()
+    return results
+
+def regex_alternatives(pattern: str, limit: int = MAX_EXPANDED_SELECTORS) -> Optional[List[str]]:
+    """Every string matched by a fully anchored regex made of literals, groups, alternation and "?".
+
+    Returns None for any other regex: JOSM only needs part of a value to match an
+    unanchored regex, so its matches cannot be listed exactly.
+    """
+    strings = []
+    try:
+        for piece in _split_alternatives(pattern):
+            if not piece.startswith("^") or not piece.endswith("$") or piece.endswith("\\$"):
+                return None
+            strings.extend(_expand(piece[1:-1], limit))
+    except _Unbounded:
+        return None
+
+    unique = list(dict.fromkeys(strings))
+    if not unique or "" in unique or len(unique) > limit:
+        return None
+    return unique
+
+###################
+# Regex expansion #
+###################
+
+def _remove_rule(text: str, rule: Rule) -> str:
+    """Text without a rule and the line break ending it."""
+    rest = text[rule.end:]
+    return text[:rule.start] + (rest[1:] if rest.startswith("\n") else rest)
+
+def _key_text(key: str) -> str:
+    return key if re.fullmatch(r"[\w\-:.]+", key) else '"' + key.replace('"', '\\"') + '"'
+
+def _value_text(value: str) -> str:
+    return value if re.fullmatch(r"[\w\-:.]+", value) else '"' + value.replace('"', '\\"') + '"'
+
+def condition_alternatives(condition: Condition) -> Optional[List[List[str]]]:
+    """Plain conditions equivalent to a regex condition, as alternatives of condition lists.
+
+    Returns None when the condition has no exact plain equivalent.
+    """
+    if isinstance(condition, KeyRegexpCondition) and not condition.negated:
+        keys = regex_alternatives(condition.key_pattern)
+        if keys is None:
+            return None
+        if condition.value_pattern is None:
+            return [[f"[{_key_text(key)}]"] for key in keys]
+        values = regex_alternatives(condition.value_pattern)
+        if values is None:
+            return [[f"[{_key_text(key)}=~/{condition.value_pattern}/]"] for key in keys]
+        return [[f"[{_key_text(key)}={_value_text(value)}]"] for key in keys for value in values]
+
+    if isinstance(condition, RegexpCondition) and not condition.flags:
+        values = regex_alternatives(condition.pattern)
+        if values is None:
+            return None
+        if condition.negated:
+            return [[f"[{_key_text(condition.key)}!={_value_text(value)}]" for value in values]]
+        return [[f"[{_key_text(condition.key)}={_value_text(value)}]"] for value in values]
+
+    return None
+
+def selector_is_impossible(selector: Selector) -> bool:
+    """Whether some part of the selector requires contradictory tags, e.g. [power=line][!power]."""
+    for part in selector.parts:
+        required: Dict[str, Optional[str]] = {}
+        forbidden = set()
+        for condition in part.conditions:
+            if isinstance(condition, KeyCondition) and condition.truth is None:
+                if condition.negated:
+                    forbidden.add(condition.key)
+                else:
+                    required.setdefault(condition.key, None)
+            elif isinstance(condition, KeyValueCondition) and condition.operator == "=":
+                if required.get(condition.key) not in (None, condition.value):
+                    return True
+                required[condition.key] = condition.value
+            elif isinstance(condition, KeyValueCondition) and condition.operator != "!=":
+                required.setdefault(condition.key, None)
+            elif isinstance(condition, RegexpCondition) and not condition.negated:
+                required.setdefault(condition.key, None)
+        if forbidden & set(required):
+            return True
+    return False
+
+def expand_selector(selector: Selector) -> Optional[List[str]]:
+    """Selectors without regex conditions matching the same objects, None when nothing can be expanded."""
+    part_options = []
+    expanded = False
+    for part in selector.parts:
+        condition_options = []
+        for condition in part.conditions:
+            alternatives = condition_alternatives(condition)
+            if alternatives is None:
+                condition_options.append([[condition.text]])
+            else:
+                condition_options.append(alternatives)
+                expanded = True
+        part_options.append([
+            part.base + part.zoom_text + "".join(text for choice in combination for text in choice)
+            for combination in itertools.product(*condition_options)
+        ])
+    if not expanded:
+        return None
+
+    selectors = []
+    for parts in itertools.product(*part_options):
+        text = parts[0]
+        for (combinator, link_conditions), part in zip(selector.links, parts[1:]):
+            link = "".join(condition.text for condition in link_conditions)
+            text += (f" {combinator}{link} " if combinator == ">" else " ") + part
+        if selector.layer:
+            text += "::" + selector.layer
+        selectors.append(text)
+        if len(selectors) > MAX_EXPANDED_SELECTORS:
+            return None
+    return selectors
+
+def expand_regex_selectors(text: str) -> Tuple[str, Dict[str, Any]]:
+    """Rewrite bounded regex conditions into unions of plain [key=value] selectors."""
+    stylesheet = parse_stylesheet(text)
+    report = {"optimization": "expand-regex", "selectors_expanded": 0, "selectors_added": 0, "duplicates_merged": 0, "impossible_dropped": 0}
+
+    for rule in reversed(stylesheet.rules):
+        if not rule.is_object_rule:
+            continue
+        selectors = []
+        changed = False
+        for selector in rule.selectors:
+            expanded = expand_selector(selector)
+            if expanded is None:
+                selectors.append(selector.to_mapcss())
+                continue
+            changed = True
+            report["selectors_expanded"] += 1
+            report["selectors_added"] += len(expanded)
+            for expanded_text in expanded:
+                if selector_is_impossible(parse_selector(expanded_text)):
+                    report["impossible_dropped"] += 1
+                else:
+                    selectors.append(expanded_text)
+        if not changed:
+            continue
+
+        unique = list(dict.fromkeys(selectors))
+        report["duplicates_merged"] += len(selectors) - len(unique)
+        if not unique:
+            # Nothing can ever match, the whole rule goes
+            text = _remove_rule(text, rule)
+            continue
+        text = text[:rule.start] + ",\n".join(unique) + " " + text[rule.block_start:]
+
+    report["summary"] = (f"{report['selectors_expanded']} regex selectors rewritten into {report['selectors_added']} plain tag selectors, "
+                         f"{report['duplicates_merged']} duplicates merged, {report['impossible_dropped']} impossible selectors dropped")
+    return text, report
+
+################
+# Tree-shaking #
+################
+
+class TagInventory:
+    """Tag keys and values present in an extract, per kind of object (see ELEMENT_BASES)."""
+
+    def __init__(self, source: str = ""):
+        self.source = source
+        self.objects = {kind: 0 for kind in ELEMENT_BASES}
+        # Values seen for each key, None once there are too many to remember
+        self.tags: Dict[str, Dict[str, Optional[set]]] = {kind: {} for kind in ELEMENT_BASES}
+
+    def add(self, element: OsmElement):
+        kind = element_kind(element)
+        self.objects[kind] += 1
+        tags = self.tags[kind]
+        for key, value in element.tags.items():
+            values = tags.get(key, set())
+            if values is None:
+                continue
+            values.add(value)
+            tags[key] = values if len(values) <= MAX_INVENTORY_VALUES else None
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "source": self.source,
+            "objects": self.objects,
+            "keys": {kind: len(tags) for kind, tags in self.tags.items()},
+        }
+
+def collect_tag_inventory(path: str) -> TagInventory:
+    """Stream an OSM extract and record the tags it contains."""
+    inventory = TagInventory(path)
+    for element in iter_elements(path):
+        inventory.add(element)
+    return inventory
+
+def _single_tag_matches(condition: Condition, key: str, values: Optional[set]) -> bool:
+    """Whether a condition on a single key can match one of the values seen for it."""
+    if values is None:
+        return True
+    return any(condition.applies(OsmElement("node", 0, {key: value}), None) for value in values)
+
+def condition_possible(condition: Condition, tags: Dict[str, Optional[set]], classes: set) -> bool:
+    """Whether a condition can be true for an object carrying tags seen in the inventory."""
+    if isinstance(condition, (KeyCondition, RegexpCondition)) and not condition.negated:
+        return condition.key in tags and _single_tag_matches(condition, condition.key, tags[condition.key])
+    if isinstance(condition, KeyValueCondition) and condition.operator != "!=":
+        return condition.key in tags and _single_tag_matches(condition, condition.key, tags[condition.key])
+    if isinstance(condition, KeyRegexpCondition) and not condition.negated:
+        for key, values in tags.items():
+            if not condition.key_regex.search(key):
+                continue
+            if condition.value_regex is None or values is None or any(condition.value_regex.search(value) for value in values):
+                return True
+        return False
+    if isinstance(condition, ClassCondition) and not condition.negated:
+        return condition.name in classes
+    # Negated conditions, eval expressions and pseudo classes are kept
+    return True
+
+def part_possible(part: SimpleSelector, inventory: TagInventory, classes: set) -> bool:
+    for kind, bases in ELEMENT_BASES.items():
+        if part.base not in bases or not inventory.objects[kind]:
+            continue
+        if all(condition_possible(condition, inventory.tags[kind], classes) for condition in part.conditions):
+            return True
+    return False
+
+def selector_possible(selector: Selector, inventory: TagInventory, classes: set) -> bool:
+    """Whether every part of a selector can match some object of the inventory."""
+    return all(part_possible(part, inventory, classes) for part in selector.parts)
+
+def tree_shake_stylesheet(text: str, inventory: TagInventory) -> Tuple[str, Dict[str, Any]]:
+    """Drop the selectors and rules which cannot match any object of the inventory's extract."""
+    stylesheet = parse_stylesheet(text)
+    object_rules = stylesheet.object_rules
+
+    # Classes are only available when a rule setting them survives, so grow the set until it is stable
+    classes: set = set()
+    while True:
+        reachable = set(classes)
+        for rule in object_rules:
+            if any(selector_possible(selector, inventory, classes) for selector in rule.selectors):
+                reachable.update(declaration.class_name for declaration in rule.declarations if declaration.class_name)
+        if reachable == classes:
+            break
+        classes = reachable
+
+    report = {"optimization": "tree-shake", "extract": inventory.source, "rules_before": len(object_rules),
+              "rules_removed": 0, "selectors_removed": 0}
+    for rule in reversed(stylesheet.rules):
+        if not rule.is_object_rule:
+            continue
+        kept = [selector for selector in rule.selectors if selector_possible(selector, inventory, classes)]
+        if len(kept) == len(rule.selectors):
+            continue
+        report["selectors_removed"] += len(rule.selectors) - len(kept)
+        if not kept:
+            report["rules_removed"] += 1
+            text = _remove_rule(text, rule)
+            continue
+        text = text[:rule.start] + ",\n".join(selector.to_mapcss() for selector in kept) + " " + text[rule.block_start:]
+
+    report["rules_after"] = report["rules_before"] - report["rules_removed"]
+    report["summary"] = (f"{report['rules_removed']} of {report['rules_before']} rules and {report['selectors_removed']} selectors "
+                         f"cannot match anything in '{inventory.source}' and were removed")
+    return text, report
+
+#####################
+# Zoom band merging #
+#####################
+
+def _zoom_key(rule: Rule) -> Optional[Tuple[Tuple[str, ...], Tuple[str, ...]]]:
+    """Selectors without their zoom range and declarations of a rule whose selectors all share one zoom range."""
+    zooms = {(selector.subject.min_zoom, selector.subject.max_zoom) for selector in rule.selectors}
+    if len(zooms) != 1 or any(len(selector.parts) > 1 for selector in rule.selectors):
+        return None
+    selectors = tuple(Selector([SimpleSelector(selector.subject.base, "", selector.subject.conditions)], layer=selector.layer).to_mapcss()
+                      for selector in rule.selectors)
+    return selectors, tuple(declaration.to_mapcss() for declaration in rule.declarations)
+
+def _tested_classes(rule: Rule) -> set:
+    return {condition.name for selector in rule.selectors for part in selector.parts for condition in part.conditions
+            if isinstance(condition, ClassCondition)}
+
+# Expression functions reading the properties set by earlier rules, also with a parent_ prefix
+PROPERTY_FUNCTIONS = {"prop", "is_prop_set"}
+
+def _reads_properties(rule: Rule) -> bool:
+    """Whether the rule reads properties set by other rules, which makes moving rules around it unsafe."""
+    expressions = [declaration.expression for declaration in rule.declarations if declaration.expression is not None]
+    expressions += [condition.expression for selector in rule.selectors for part in selector.parts for condition in part.conditions
+                    if isinstance(condition, ExpressionCondition)]
+    expressions += [condition.expression for selector in rule.selectors for link, conditions in selector.links for condition in conditions
+                    if isinstance(condition, ExpressionCondition)]
+    return any((name[len("parent_"):] if name.startswith("parent_") else name) in PROPERTY_FUNCTIONS
+               for expression in expressions for name in expression.function_names())
+
+def _subject_kinds(selector: Selector) -> set:
+    return {kind for kind, bases in ELEMENT_BASES.items() if selector.subject.base in bases}
+
+def _selectors_disjoint(a: Selector, b: Selector) -> bool:
+    """Whether no object can match both selectors, judging from their subjects only."""
+    if len(a.parts) > 1 or len(b.parts) > 1:
+        return False
+    if not _subject_kinds(a) & _subject_kinds(b):
+        return True
+    if a.subject.max_zoom < b.subject.min_zoom or b.subject.max_zoom < a.subject.min_zoom:
+        return True
+    # Tag value required by the first selector, True for any value and False for no tag
+    values = {}
+    for condition in a.subject.conditions:
+        if isinstance(condition, KeyValueCondition) and condition.operator == "=":
+            values[condition.key] = condition.value
+        elif isinstance(condition, KeyCondition) and condition.truth is None:
+            values.setdefault(condition.key, not condition.negated)
+    for condition in b.subject.conditions:
+        if isinstance(condition, KeyValueCondition) and condition.operator == "=" and condition.key in values:
+            if values[condition.key] is not True and values[condition.key] != condition.value:
+                return True
+        elif isinstance(condition, KeyCondition) and condition.truth is None and condition.key in values:
+            if (values[condition.key] is False) != condition.negated:
+                return True
+    return False
+
+def _rules_overlap(a: Rule, b: Rule) -> bool:
+    return any(not _selectors_disjoint(first, second) for first in a.selectors for second in b.selectors)
+
+def _moves_safely(moved: Rule, between: List[Rule]) -> bool:
+    """Whether a rule can be moved before or after the rules between without changing any style."""
+    moved_properties = {declaration.property for declaration in moved.declarations if declaration.property != "set"}
+    moved_classes = {declaration.class_name for declaration in moved.declarations if declaration.class_name}
+    for rule in between:
+        if not rule.is_object_rule or not _rules_overlap(moved, rule):
+            continue
+        properties = {declaration.property for declaration in rule.declarations if declaration.property != "set"}
+        classes = {declaration.class_name for declaration in rule.declarations if declaration.class_name}
+        if properties & moved_properties or classes & _tested_classes(moved) or moved_classes & _tested_classes(rule):
+            return False
+        if _reads_properties(rule) or _reads_properties(moved):
+            return False
+    return True
+
+def merge_zoom_bands(text: str) -> Tuple[str, Dict[str, Any]]:
+    """Merge rules which only differ by adjacent zoom ranges into one rule covering both.
+
+    Generated styles only have such rules once quantize_zoom_variables() gave
+    neighbouring _low/_mid/_high variables the same value.
+    """
+    stylesheet = parse_stylesheet(text)
+    rules = stylesheet.rules
+    keys = {rule.index: _zoom_key(rule) for rule in rules if rule.is_object_rule}
+    zooms = {index: (rules[index].selectors[0].subject.min_zoom, rules[index].selectors[0].subject.max_zoom) for index, key in keys.items() if key}
+    removed = set()
+
+    merged = True
+    while merged:
+        merged = False
+        for first in sorted(zooms):
+            if first in removed:
+                continue
+            for second in sorted(zooms):
+                if second <= first or second in removed or keys[second] != keys[first]:
+                    continue
+                (low, high), (other_low, other_high) = zooms[first], zooms[second]
+                if other_low != high + 1 and low != other_high + 1:
+                    continue
+                if not _moves_safely(rules[second], rules[first + 1:second]):
+                    continue
+                zooms[first] = (min(low, other_low), max(high, other_high))
+                removed.add(second)
+                merged = True
+
+    report = {"optimization": "merge-zoom-bands", "rules_before": len(stylesheet.object_rules), "rules_merged": len(removed)}
+    for rule in reversed(rules):
+        if rule.index in removed:
+            text = _remove_rule(text, rule)
+        elif rule.index in zooms and zooms[rule.index] != (rule.selectors[0].subject.min_zoom, rule.selectors[0].subject.max_zoom):
+            zoom_text = format_zoom(*zooms[rule.index])
+            selectors = [Selector([SimpleSelector(selector.subject.base, zoom_text, selector.subject.conditions)], layer=selector.layer).to_mapcss()
+                         for selector in rule.selectors]
+            text = text[:rule.start] + ",\n".join(selectors) + " " + text[rule.block_start:]
+
+    report["rules_after"] = report["rules_before"] - report["rules_merged"]
+    report["summary"] = f"{report['rules_merged']} rules merged into the rules of adjacent zoom ranges with the same declarations"
+    return text, report
+
+################
+# Minification #
+################
+
+# Shared declarations are only factored out of runs of at most this many adjacent rules
+MAX_FACTORED_RULES = 32
+
+def _declaration_text(declaration: Declaration) -> str:
+    return f"set .{declaration.class_name}" if declaration.property == "set" else f"{declaration.property}:{declaration.value_text}"
+
+def _rule_text(selectors: List[Selector], declarations: List[Declaration]) -> str:
+    return ",".join(selector.to_mapcss() for selector in selectors) + "{" + ";".join(_declaration_text(declaration) for declaration in declarations) + "}"
+
+def _compact_rule(rule: Rule) -> Rule:
+    """The rule without duplicate selectors and without declarations overridden within the rule itself."""
+    selectors = list({selector.to_mapcss(): selector for selector in reversed(rule.selectors)}.values())[::-1]
+    declarations = []
+    for position, declaration in enumerate(rule.declarations):
+        later = rule.declarations[position + 1:]
+        if declaration.property == "set" and any(other.class_name == declaration.class_name for other in declarations):
+            continue
+        if declaration.property != "set" and any(other.property == declaration.property for other in later) and not _reads_properties(rule):
+            continue
+        declarations.append(declaration)
+    return Rule(selectors, declarations, rule.start, rule.end, rule.line)
+
+def _selector_covers(cover: Selector, selector: Selector) -> bool:
+    """Whether a selector matches at least every object another one matches, in the same layer."""
+    if len(cover.parts) > 1 or len(selector.parts) > 1 or cover.layer != selector.layer or cover.layer == "*":
+        return False
+    if not _subject_kinds(selector) <= _subject_kinds(cover):
+        return False
+    if cover.subject.min_zoom > selector.subject.min_zoom or cover.subject.max_zoom < selector.subject.max_zoom:
+        return False
+    return all(_implied(condition, selector.subject.conditions) for condition in cover.subject.conditions)
+
+def _implied(condition: Condition, conditions: List[Condition]) -> bool:
+    """Whether a condition holds for every object meeting a list of conditions."""
+    if any(other.text == condition.text for other in conditions):
+        return True
+    if isinstance(condition, KeyCondition) and not condition.negated and condition.truth is None:
+        return any(isinstance(other, KeyCondition) and other.key == condition.key and not other.negated or
+                   isinstance(other, KeyValueCondition) and other.key == condition.key and other.operator == "=" and other.value
+                   for other in conditions)
+    return False
+
+def _drop_dead_declarations(rules: List[Rule]) -> int:
+    """Remove declarations always overridden by a later rule, returning how many were removed."""
+    dropped = 0
+    for position, rule in enumerate(rules):
+        if not rule.is_object_rule:
+            continue
+        kept = []
+        for declaration in rule.declarations:
+            dead = False
+            if declaration.property != "set":
+                for later_position in range(position + 1, len(rules)):
+                    later = rules[later_position]
+                    if _reads_properties(later):
+                        break
+                    if any(other.property == declaration.property for other in later.declarations) and \
+                            all(any(_selector_covers(cover, selector) for cover in later.selectors) for selector in rule.selectors):
+                        dead = True
+                        break
+            if dead and not _reads_properties(rule):
+                dropped += 1
+            else:
+                kept.append(declaration)
+        rule.declarations = kept
+    return dropped
+
+def _merge_identical_blocks(rules: List[Rule]) -> int:
+    """Merge rules with the same declarations into one selector list where the cascade allows it."""
+    merged = 0
+    position = 0
+    while position < len(rules):
+        rule = rules[position]
+        if not rule.is_object_rule:
+            position += 1
+            continue
+        key = [_declaration_text(declaration) for declaration in rule.declarations]
+        for other_position in range(position + 1, len(rules)):
+            other = rules[other_position]
+            if not other.is_object_rule or [_declaration_text(declaration) for declaration in other.declarations] != key:
+                continue
+            between = rules[position + 1:other_position]
+            if _moves_safely(other, between):
+                rules[position] = _compact_rule(Rule(rule.selectors + other.selectors, rule.declarations, rule.start, rule.end, rule.line))
+                del rules[other_position]
+            elif _moves_safely(rule, between):
+                rules[other_position] = _compact_rule(Rule(rule.selectors + other.selectors, other.declarations, other.start, other.end, other.line))
+                del rules[position]
+            else:
+                continue
+            merged += 1
+            break
+        else:
+            position += 1
+    return merged
+
+def _shared_declarations(run: List[Rule]) -> List[Declaration]:
+    """Declarations all rules of a run share, in the order of the first rule."""
+    texts = [{_declaration_text(declaration) for declaration in rule.declarations if declaration.property != "set"} for rule in run]
+    common = set.intersection(*texts)
+    return [declaration for declaration in run[0].declarations if _declaration_text(declaration) in common]
+
+def _factor_declarations(rules: List[Rule]) -> int:
+    """Move declarations shared by adjacent rules into one rule listing all their selectors, when it makes the style smaller.
+
+    Adjacent rules sharing a declaration set the same value, so applying it before
+    them changes no style as long as none of them reads properties.
+    """
+    factored = 0
+    position = 0
+    while position < len(rules):
+        best = None
+        for end in range(position + 2, min(position + MAX_FACTORED_RULES, len(rules)) + 1):
+            run = rules[position:end]
+            if not all(rule.is_object_rule and not _reads_properties(rule) for rule in run):
+                break
+            shared = _shared_declarations(run)
+            if not shared:
+                break
+            selectors = list({selector.to_mapcss(): selector for rule in run for selector in rule.selectors}.values())
+            before = sum(len(_rule_text(rule.selectors, rule.declarations)) for rule in run)
+            remaining = [[declaration for declaration in rule.declarations if declaration not in shared and
+                          _declaration_text(declaration) not in {_declaration_text(item) for item in shared}] for rule in run]
+            after = len(_rule_text(selectors, shared)) + sum(len(_rule_text(rule.selectors, declarations)) for rule, declarations in zip(run, remaining) if declarations)
+            if after < before and (best is None or before - after > best[0]):
+                best = (before - after, end, selectors, shared, remaining)
+        if best is None:
+            position += 1
+            continue
+        saved, end, selectors, shared, remaining = best
+        run = rules[position:end]
+        members = [Rule(rule.selectors, declarations, rule.start, rule.end, rule.line) for rule, declarations in zip(run, remaining) if declarations]
+        rules[position:end] = [Rule(selectors, shared, run[0].start, run[0].end, run[0].line)] + members
+        factored += 1
+        position += 1 + len(members)
+    return factored
+
+def minify_stylesheet(text: str) -> Tuple[str, Dict[str, Any]]:
+    """Rebuild a style as a compact equivalent: one rule per line, without comments, duplicates or dead declarations."""
+    stylesheet = parse_stylesheet(text)
+    rules = [_compact_rule(rule) for rule in stylesheet.rules]
+    report = {"optimization": "minify", "rules_before": len(stylesheet.object_rules), "bytes_before": len(text.encode("utf-8"))}
+
+    duplicates = sum(len(rule.declarations) for rule in stylesheet.rules) - sum(len(rule.declarations) for rule in rules)
+    report["declarations_removed"] = duplicates + _drop_dead_declarations(rules)
+    rules = [rule for rule in rules if rule.declarations or not rule.is_object_rule]
+    report["rules_merged"] = _merge_identical_blocks(rules)
+    report["rules_factored"] = _factor_declarations(rules)
+
+    text = "".join(_rule_text(rule.selectors, rule.declarations) + "\n" for rule in rules)
+    report["rules_after"] = sum(1 for rule in rules if rule.is_object_rule)
+    report["bytes_after"] = len(text.encode("utf-8"))
+    report["summary"] = (f"{report['rules_before']} rules and {report['bytes_before']} bytes down to {report['rules_after']} rules and "
+                         f"{report['bytes_after']} bytes ({report['rules_merged']} rules merged, {report['declarations_removed']} overridden "
+                         f"declarations removed, {report['rules_factored']} groups of shared declarations factored out)")
+    return text, report
+
+# Optimisation passes selectable with the generator's --optimize option, in the order they run
+OPTIMIZATIONS: Dict[str, Callable[[str], Tuple[str, Dict[str, Any]]]] = {
+    "expand-regex": expand_regex_selectors,
+    "merge-zoom-bands": merge_zoom_bands,
+    "minify": minify_stylesheet,
+}
+
+def optimize_style(text: str, optimizations: List[str], inventory: Optional[TagInventory] = None) -> Tuple[str, List[Dict[str, Any]]]:
+    """Run the selected optimisation passes over a rendered style, tree-shaking it first when given an inventory."""
+    reports = []
+    if inventory is not None:
+        text, report = tree_shake_stylesheet(text, inventory)
+        reports.append(report)
+    for name in OPTIMIZATIONS:
+        if name in optimizations:
+            text, report = OPTIMIZATIONS[name](text)
+            reports.append(report)
+    return text, reports
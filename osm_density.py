@@ -0,0 +1,150 @@
+"""Power grid density statistics computed from OSM extracts.
+
+The extract is streamed twice: the first pass finds the nodes of power lines and
+substation outlines, the second one only keeps the coordinates of those nodes to
+measure line lengths and locate substations, so memory grows with the size of the
+grid rather than with the size of the extract.
+"""
+import math
+from typing import Any, Dict, List, Tuple
+
+from osm_extract import iter_elements
+
+# Zoom level of the tiles densities are computed on (about 39x39 km at the equator)
+DENSITY_TILE_ZOOM = 10
+
+EARTH_CIRCUMFERENCE_KM = 40075.017
+
+# power=* values counted as line length
+LINE_POWER_VALUES = {"line", "minor_line", "cable"}
+
+# Densities per km² at which a tile counts as a sparse (score 0) or dense (score 1) grid
+DENSITY_REFERENCES = {
+    "towers_per_km2": (0.05, 1.0),
+    "poles_per_km2": (0.1, 5.0),
+    "line_km_per_km2": (0.02, 0.5),
+    "substations_per_km2": (0.002, 0.05),
+}
+
+# Percentile of the grid tiles used to score the extract, so that its dense parts drive the result
+SCORE_PERCENTILE = 90
+
+def tile_of(lat: float, lon: float, zoom: int = DENSITY_TILE_ZOOM) -> Tuple[int, int]:
+    """Web Mercator tile containing a coordinate."""
+    scale = 2 ** zoom
+    lat = max(min(lat, 85.0511), -85.0511)
+    x = int((lon + 180.0) / 360.0 * scale)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * scale)
+    return min(max(x, 0), scale - 1), min(max(y, 0), scale - 1)
+
+def tile_area_km2(y: int, zoom: int = DENSITY_TILE_ZOOM) -> float:
+    """Ground area of a tile row, using the latitude at the middle of the tile."""
+    lat = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 0.5) / 2 ** zoom))))
+    side = EARTH_CIRCUMFERENCE_KM * math.cos(math.radians(lat)) / 2 ** zoom
+    return side * side
+
+def distance_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great circle distance between two coordinates."""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return EARTH_CIRCUMFERENCE_KM / math.pi * math.asin(min(1.0, math.sqrt(a)))
+
+def percentile(values: List[float], percent: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    position = (len(values) - 1) * percent / 100
+    low = int(position)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (position - low)
+
+def _grid_nodes(path: str) -> set:
+    """Ids of the nodes of power lines and substation outlines."""
+    nodes = set()
+    for element in iter_elements(path):
+        if element.type != "way":
+            continue
+        power = element.tags.get("power")
+        if power in LINE_POWER_VALUES:
+            nodes.update(element.nodes)
+        elif power == "substation" and element.nodes:
+            nodes.add(element.nodes[0])
+    return nodes
+
+def collect_density_statistics(path: str, zoom: int = DENSITY_TILE_ZOOM) -> Dict[str, Any]:
+    """Count towers, poles, substations and line length per tile of an OSM extract."""
+    needed = _grid_nodes(path)
+    coordinates: Dict[int, Tuple[float, float]] = {}
+    tiles: Dict[Tuple[int, int], Dict[str, float]] = {}
+
+    def tile_counts(lat: float, lon: float) -> Dict[str, float]:
+        return tiles.setdefault(tile_of(lat, lon, zoom), {"towers": 0, "poles": 0, "line_km": 0.0, "substations": 0})
+
+    for element in iter_elements(path):
+        power = element.tags.get("power")
+        if element.type == "node":
+            if element.id in needed:
+                coordinates[element.id] = (element.lat, element.lon)
+            if power == "tower":
+                tile_counts(element.lat, element.lon)["towers"] += 1
+            elif power == "pole":
+                tile_counts(element.lat, element.lon)["poles"] += 1
+            elif power == "substation":
+                tile_counts(element.lat, element.lon)["substations"] += 1
+        elif element.type == "way" and power in LINE_POWER_VALUES:
+            points = [coordinates[node] for node in element.nodes if node in coordinates]
+            for (lat1, lon1), (lat2, lon2) in zip(points, points[1:]):
+                tile_counts((lat1 + lat2) / 2, (lon1 + lon2) / 2)["line_km"] += distance_km(lat1, lon1, lat2, lon2)
+        elif element.type == "way" and power == "substation" and element.nodes and element.nodes[0] in coordinates:
+            tile_counts(*coordinates[element.nodes[0]])["substations"] += 1
+
+    densities = []
+    for (x, y), counts in tiles.items():
+        area = tile_area_km2(y, zoom)
+        densities.append({
+            "tile": f"{zoom}/{x}/{y}",
+            "area_km2": round(area, 1),
+            "towers_per_km2": counts["towers"] / area,
+            "poles_per_km2": counts["poles"] / area,
+            "line_km_per_km2": counts["line_km"] / area,
+            "substations_per_km2": counts["substations"] / area,
+        })
+
+    statistics = {
+        "extract": path,
+        "tile_zoom": zoom,
+        "grid_tiles": len(densities),
+        "totals": {
+            "towers": sum(counts["towers"] for counts in tiles.values()),
+            "poles": sum(counts["poles"] for counts in tiles.values()),
+            "line_km": round(sum(counts["line_km"] for counts in tiles.values()), 1),
+            "substations": sum(counts["substations"] for counts in tiles.values()),
+        },
+        "densities": {
+            metric: {
+                "median": round(percentile([tile[metric] for tile in densities], 50), 4),
+                f"p{SCORE_PERCENTILE}": round(percentile([tile[metric] for tile in densities], SCORE_PERCENTILE), 4),
+                "max": round(max((tile[metric] for tile in densities), default=0.0), 4),
+            }
+            for metric in DENSITY_REFERENCES
+        },
+        "densest_tiles": [
+            {key: round(value, 4) if isinstance(value, float) else value for key, value in tile.items()}
+            for tile in sorted(densities, key=lambda tile: -tile["line_km_per_km2"])[:10]
+        ],
+    }
+    statistics["scores"] = {
+        metric: round(metric_score(statistics["densities"][metric][f"p{SCORE_PERCENTILE}"], *DENSITY_REFERENCES[metric]), 3)
+        for metric in DENSITY_REFERENCES
+    }
+    # Any kind of feature crowding the map is enough to call for the lighter rendering
+    statistics["density_score"] = max(statistics["scores"].values())
+    return statistics
+
+def metric_score(value: float, sparse: float, dense: float) -> float:
+    """Position of a density between the sparse and dense references on a log scale, from 0 to 1."""
+    if value <= sparse:
+        return 0.0
+    if value >= dense:
+        return 1.0
+    return math.log(value / sparse) / math.log(dense / sparse)
@@ -0,0 +1,300 @@
+"""Streaming readers for OSM XML and PBF extracts.
+
+Elements are yielded one at a time so that extracts of any size can be scanned in
+constant memory; load_dataset() keeps them in memory together with the parent
+ways and relations of every element, as needed to evaluate MapCSS child selectors.
+"""
+import bz2
+import gzip
+import struct
+import xml.etree.ElementTree as ElementTree
+import zlib
+from typing import Dict, Iterator, List, Optional, Tuple
+
+class OsmElement:
+    """A node, way or relation with its tags, coordinates, node list or members."""
+    __slots__ = ("type", "id", "tags", "lat", "lon", "nodes", "members")
+
+    def __init__(self, type: str, id: int, tags: Optional[Dict[str, str]] = None, lat: Optional[float] = None,
+                 lon: Optional[float] = None, nodes: Optional[List[int]] = None,
+                 members: Optional[List[Tuple[str, int, str]]] = None):
+        self.type = type
+        self.id = id
+        self.tags = tags if tags is not None else {}
+        self.lat = lat
+        self.lon = lon
+        self.nodes = nodes if nodes is not None else []
+        self.members = members if members is not None else []
+
+    def is_closed(self) -> bool:
+        """Whether the element is a closed way."""
+        return self.type == "way" and len(self.nodes) > 2 and self.nodes[0] == self.nodes[-1]
+
+    def is_multipolygon(self) -> bool:
+        """Whether the element is a multipolygon (or boundary) relation."""
+        return self.type == "relation" and self.tags.get("type") in ("multipolygon", "boundary")
+
+    def __repr__(self) -> str:
+        return f"OsmElement({self.type}/{self.id}, {self.tags})"
+
+def iter_elements(path: str) -> Iterator[OsmElement]:
+    """Stream the elements of an OSM XML (.osm, optionally .gz/.bz2) or PBF (.pbf) file."""
+    if path.endswith(".pbf"):
+        return iter_pbf_elements(path)
+    return iter_xml_elements(path)
+
+def _open_binary(path: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    if path.endswith(".bz2"):
+        return bz2.open(path, "rb")
+    return open(path, "rb")
+
+def iter_xml_elements(path: str) -> Iterator[OsmElement]:
+    """Stream the elements of an OSM XML file, discarding parsed XML as it goes."""
+    with _open_binary(path) as f:
+        context = ElementTree.iterparse(f, events=("start", "end"))
+        _, root = next(context)
+        for event, xml_element in context:
+            if event != "end" or xml_element.tag not in ("node", "way", "relation"):
+                continue
+
+            tags = {tag.get("k"): tag.get("v") for tag in xml_element.iter("tag")}
+            element = OsmElement(xml_element.tag, int(xml_element.get("id")), tags)
+            if xml_element.tag == "node":
+                element.lat = float(xml_element.get("lat", 0))
+                element.lon = float(xml_element.get("lon", 0))
+            elif xml_element.tag == "way":
+                element.nodes = [int(nd.get("ref")) for nd in xml_element.iter("nd")]
+            else:
+                element.members = [
+                    (member.get("type"), int(member.get("ref")), member.get("role", ""))
+                    for member in xml_element.iter("member")
+                ]
+
+            yield element
+            root.clear()
+
+# Minimal protocol buffers decoding, enough for the OSM PBF format
+
+def _varint(buffer: bytes, pos: int) -> Tuple[int, int]:
+    result = 0
+    shift = 0
+    while True:
+        byte = buffer[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+def _zigzag(value: int) -> int:
+    return (value >> 1) ^ -(value & 1)
+
+def _signed(value: int) -> int:
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+def _fields(buffer: bytes) -> Iterator[Tuple[int, object]]:
+    """Yield (field number, value) pairs, length-delimited values as bytes."""
+    pos = 0
+    end = len(buffer)
+    while pos < end:
+        key, pos = _varint(buffer, pos)
+        wire_type = key & 7
+        if wire_type == 0:
+            value, pos = _varint(buffer, pos)
+        elif wire_type == 2:
+            length, pos = _varint(buffer, pos)
+            value = buffer[pos:pos + length]
+            pos += length
+        elif wire_type == 1:
+            value = buffer[pos:pos + 8]
+            pos += 8
+        elif wire_type == 5:
+            value = buffer[pos:pos + 4]
+            pos += 4
+        else:
+            raise ValueError(f"unsupported protobuf wire type {wire_type}")
+        yield key >> 3, value
+
+def _packed(buffer: bytes) -> List[int]:
+    values = []
+    pos = 0
+    end = len(buffer)
+    while pos < end:
+        value, pos = _varint(buffer, pos)
+        values.append(value)
+    return values
+
+def _packed_delta(buffer: bytes) -> List[int]:
+    values = []
+    current = 0
+    for value in _packed(buffer):
+        current += _zigzag(value)
+        values.append(current)
+    return values
+
+def _read_blobs(f) -> Iterator[Tuple[str, bytes]]:
+    while True:
+        header_size = f.read(4)
+        if len(header_size) < 4:
+            return
+        blob_type = ""
+        data_size = 0
+        for number, value in _fields(f.read(struct.unpack(">I", header_size)[0])):
+            if number == 1:
+                blob_type = value.decode("utf-8")
+            elif number == 3:
+                data_size = value
+
+        data = b""
+        for number, value in _fields(f.read(data_size)):
+            if number == 1:
+                data = value
+            elif number == 3:
+                data = zlib.decompress(value)
+            elif number in (4, 5, 6, 7):
+                raise ValueError("only raw and zlib compressed PBF blobs are supported")
+        yield blob_type, data
+
+def _pbf_tags(keys: List[int], values: List[int], strings: List[str]) -> Dict[str, str]:
+    return {strings[k]: strings[v] for k, v in zip(keys, values)}
+
+def _pbf_block_elements(data: bytes) -> Iterator[OsmElement]:
+    strings = []
+    groups = []
+    granularity = 100
+    lat_offset = lon_offset = 0
+    for number, value in _fields(data):
+        if number == 1:
+            strings = [s.decode("utf-8") for n, s in _fields(value) if n == 1]
+        elif number == 2:
+            groups.append(value)
+        elif number == 17:
+            granularity = value
+        elif number == 19:
+            lat_offset = _signed(value)
+        elif number == 20:
+            lon_offset = _signed(value)
+
+    def coordinate(offset: int, value: int) -> float:
+        return (offset + granularity * value) / 1e9
+
+    for group in groups:
+        for number, value in _fields(group):
+            if number == 1:
+                node_id = lat = lon = 0
+                keys, values = [], []
+                for field, content in _fields(value):
+                    if field == 1:
+                        node_id = _zigzag(content)
+                    elif field == 2:
+                        keys = _packed(content)
+                    elif field == 3:
+                        values = _packed(content)
+                    elif field == 8:
+                        lat = _zigzag(content)
+                    elif field == 9:
+                        lon = _zigzag(content)
+                yield OsmElement("node", node_id, _pbf_tags(keys, values, strings),
+                                 coordinate(lat_offset, lat), coordinate(lon_offset, lon))
+            elif number == 2:
+                ids, lats, lons, keys_vals = [], [], [], []
+                for field, content in _fields(value):
+                    if field == 1:
+                        ids = _packed_delta(content)
+                    elif field == 8:
+                        lats = _packed_delta(content)
+                    elif field == 9:
+                        lons = _packed_delta(content)
+                    elif field == 10:
+                        keys_vals = _packed(content)
+                position = 0
+                for i, node_id in enumerate(ids):
+                    tags = {}
+                    while position < len(keys_vals) and keys_vals[position] != 0:
+                        tags[strings[keys_vals[position]]] = strings[keys_vals[position + 1]]
+                        position += 2
+                    position += 1
+                    yield OsmElement("node", node_id, tags, coordinate(lat_offset, lats[i]), coordinate(lon_offset, lons[i]))
+            elif number == 3:
+                way_id = 0
+                keys, values, refs = [], [], []
+                for field, content in _fields(value):
+                    if field == 1:
+                        way_id = _signed(content)
+                    elif field == 2:
+                        keys = _packed(content)
+                    elif field == 3:
+                        values = _packed(content)
+                    elif field == 8:
+                        refs = _packed_delta(content)
+                yield OsmElement("way", way_id, _pbf_tags(keys, values, strings), nodes=refs)
+            elif number == 4:
+                relation_id = 0
+                keys, values, roles, member_ids, member_types = [], [], [], [], []
+                for field, content in _fields(value):
+                    if field == 1:
+                        relation_id = _signed(content)
+                    elif field == 2:
+                        keys = _packed(content)
+                    elif field == 3:
+                        values = _packed(content)
+                    elif field == 8:
+                        roles = _packed(content)
+                    elif field == 9:
+                        member_ids = _packed_delta(content)
+                    elif field == 10:
+                        member_types = _packed(content)
+                members = [
+                    (("node", "way", "relation")[member_type], member_id, strings[role])
+                    for member_type, member_id, role in zip(member_types, member_ids, roles)
+                ]
+                yield OsmElement("relation", relation_id, _pbf_tags(keys, values, strings), members=members)
+
+def iter_pbf_elements(path: str) -> Iterator[OsmElement]:
+    """Stream the elements of an OSM PBF file, one decoded block at a time."""
+    with open(path, "rb") as f:
+        for blob_type, data in _read_blobs(f):
+            if blob_type == "OSMData":
+                yield from _pbf_block_elements(data)
+
+class OsmDataset:
+    """In-memory OSM data with parent lookups for MapCSS child selectors."""
+
+    def __init__(self, elements: Iterator[OsmElement]):
+        self.nodes: Dict[int, OsmElement] = {}
+        self.ways: Dict[int, OsmElement] = {}
+        self.relations: Dict[int, OsmElement] = {}
+        collections = {"node": self.nodes, "way": self.ways, "relation": self.relations}
+        for element in elements:
+            collections[element.type][element.id] = element
+
+        # Parents of each element as (parent, role, position) tuples
+        self.parents: Dict[Tuple[str, int], List[Tuple[OsmElement, str, int]]] = {}
+        for way in self.ways.values():
+            for position, node_id in enumerate(way.nodes):
+                self.parents.setdefault(("node", node_id), []).append((way, "", position))
+        for relation in self.relations.values():
+            for position, (member_type, member_id, role) in enumerate(relation.members):
+                self.parents.setdefault((member_type, member_id), []).append((relation, role, position))
+
+    def __iter__(self) -> Iterator[OsmElement]:
+        yield from self.nodes.values()
+        yield from self.ways.values()
+        yield from self.relations.values()
+
+    def __len__(self) -> int:
+        return len(self.nodes) + len(self.ways) + len(self.relations)
+
+    def parents_of(self, element: OsmElement) -> List[Tuple[OsmElement, str, int]]:
+        """Ways and relations containing the element."""
+        return self.parents.get((element.type, element.id), [])
+
+    def parent_ways(self, element: OsmElement) -> int:
+        """Number of ways containing a node."""
+        return len({parent.id for parent, role, position in self.parents_of(element) if parent.type == "way"})
+
+def load_dataset(path: str) -> OsmDataset:
+    """Read a whole OSM extract into memory."""
+    return OsmDataset(iter_elements(path))
@@ -0,0 +1,322 @@
+"""Synthetic power grids written as OSM files, for reproducible load tests.
+
+Grids are drawn from a seeded random generator, so the same seed, size, density and
+voltage rules always give the same file. Nodes are written to the output as they are
+generated while ways and relations are spooled to temporary files and appended at
+the end, keeping the usual nodes, ways, relations order, so memory stays flat from
+ten thousand to ten million objects.
+"""
+import gzip
+import math
+import random
+import tempfile
+from typing import Any, Dict, List, Optional, Tuple
+from xml.sax.saxutils import quoteattr
+
+KM_PER_DEGREE = 111.32
+
+# Usual operating voltages, voltages of each voltage rule are picked among them
+COMMON_VOLTAGES = [400, 1000, 11000, 15000, 20000, 33000, 63000, 66000, 90000, 110000, 132000, 150000,
+                   220000, 225000, 275000, 330000, 380000, 400000, 500000, 765000, 800000]
+
+# Share of each kind of feature in the grid
+FEATURE_WEIGHTS = {"line": 30, "minor_line": 22, "cable": 6, "substation": 14, "plant": 5, "node": 23}
+
+# Objects per km² for a density of 0 (rural grid) and 1 (dense urban grid)
+OBJECTS_PER_KM2 = (2.0, 60.0)
+
+# Tag mixes of the features, as (tags, weight) choices
+LIFECYCLES = [({}, 86), ({"construction": "yes"}, 4), ({"construction:power": None}, 4), ({"disused": "yes"}, 3),
+              ({"disused:power": None}, 2), ({"removed:power": None}, 1)]
+SUBSTATION_ROLES = ["transmission", "distribution", "generation", "industrial", "minor_distribution"]
+GENERATOR_SOURCES = ["nuclear", "wind", "hydro", "solar", "coal", "gas", "biomass", "oil"]
+TOWER_DESIGNS = ["donau", "barrel", "delta", "portal", "one-level", "two-level", "y-frame"]
+NODE_FEATURES = [
+    ({"power": "generator", "generator:source": "solar"}, 20),
+    ({"power": "generator", "generator:source": "wind"}, 10),
+    ({"man_made": "street_cabinet", "street_cabinet": "power"}, 12),
+    ({"power": "pole", "transformer": "distribution"}, 12),
+    ({"power": "pole", "switch": "disconnector"}, 5),
+    ({"power": "catenary_mast"}, 8),
+    ({"power": "substation", "substation": "minor_distribution"}, 10),
+    ({"power": "substation", "substation": "industrial", "operator": "Synthetic Industries"}, 4),
+    ({"power": "tower"}, 5),
+    ({"power": "transformer"}, 6),
+    ({"power": "switch"}, 4),
+    ({"power": "heliostat"}, 2),
+    ({"power": "compensator"}, 2),
+]
+
+def voltage_bands(voltage_rules: List[Tuple[Optional[int], Optional[int], str, str]]) -> List[Dict[str, Any]]:
+    """Voltages of each voltage rule, picked among the common voltages within [lower, upper).
+
+    The (None, None) rule stands for lines without a voltage tag. Rules holding no
+    common voltage get one in the middle of their range.
+    """
+    bands = []
+    for lower, upper, color, halo in voltage_rules:
+        if lower is None and upper is None:
+            bands.append({"label": "no voltage", "lower": None, "upper": None, "voltages": []})
+            continue
+        voltages = [voltage for voltage in COMMON_VOLTAGES if (lower is None or voltage >= lower) and (upper is None or voltage < upper)]
+        if not voltages:
+            voltages = [(lower or 0) + max(((upper or 2 * (lower or 1)) - (lower or 0)) // 2, 1)]
+        label = f"{lower if lower is not None else '…'}-{upper if upper is not None else '…'}"
+        bands.append({"label": label, "lower": lower, "upper": upper, "voltages": voltages})
+    return bands
+
+# Single band of the grids generated without voltage rules, spread over all the common voltages
+COMMON_VOLTAGES_BAND = {"label": "common voltages", "lower": None, "upper": None, "voltages": COMMON_VOLTAGES}
+
+def _open_output(path: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, "wt", encoding="utf-8")
+    return open(path, "w", encoding="utf-8")
+
+def _tags_xml(tags: Dict[str, str]) -> str:
+    return "".join(f"    <tag k={quoteattr(key)} v={quoteattr(str(value))} />\n" for key, value in tags.items())
+
+class SyntheticGrid:
+    """Random power grid features streamed to an OSM XML file."""
+
+    def __init__(self, output, way_spool, relation_spool, seed: int, center: Tuple[float, float], side_km: float,
+                 voltage_rules: Optional[List[Tuple[Optional[int], Optional[int], str, str]]]):
+        self.output = output
+        self.way_spool = way_spool
+        self.relation_spool = relation_spool
+        self.random = random.Random(seed)
+        self.center = center
+        self.side_km = side_km
+        self.bands = voltage_bands(voltage_rules) if voltage_rules else [COMMON_VOLTAGES_BAND]
+        self.next_id = {"node": 1, "way": 1, "relation": 1}
+        self.counts = {"node": 0, "way": 0, "relation": 0}
+        self.features = {feature: 0 for feature in FEATURE_WEIGHTS}
+        self.band_lines = [0] * len(self.bands)
+
+    @property
+    def objects(self) -> int:
+        return sum(self.counts.values())
+
+    def _id(self, element_type: str) -> int:
+        element_id = self.next_id[element_type]
+        self.next_id[element_type] += 1
+        self.counts[element_type] += 1
+        return element_id
+
+    def _choice(self, choices: List[Tuple[Dict[str, Any], int]]) -> Dict[str, Any]:
+        return self.random.choices([tags for tags, weight in choices], [weight for tags, weight in choices])[0]
+
+    def node(self, lat: float, lon: float, tags: Optional[Dict[str, str]] = None) -> int:
+        node_id = self._id("node")
+        lat, lon = max(min(lat, 85.0), -85.0), (lon + 180.0) % 360.0 - 180.0
+        if tags:
+            self.output.write(f"  <node id='{node_id}' version='1' lat='{lat:.7f}' lon='{lon:.7f}'>\n{_tags_xml(tags)}  </node>\n")
+        else:
+            self.output.write(f"  <node id='{node_id}' version='1' lat='{lat:.7f}' lon='{lon:.7f}' />\n")
+        return node_id
+
+    def way(self, nodes: List[int], tags: Dict[str, str]) -> int:
+        way_id = self._id("way")
+        node_refs = "".join(f"    <nd ref='{node_id}' />\n" for node_id in nodes)
+        self.way_spool.write(f"  <way id='{way_id}' version='1'>\n{node_refs}{_tags_xml(tags)}  </way>\n")
+        return way_id
+
+    def relation(self, members: List[Tuple[str, int, str]], tags: Dict[str, str]) -> int:
+        relation_id = self._id("relation")
+        member_refs = "".join(f"    <member type='{member_type}' ref='{member_id}' role={quoteattr(role)} />\n" for member_type, member_id, role in members)
+        self.relation_spool.write(f"  <relation id='{relation_id}' version='1'>\n{member_refs}{_tags_xml(tags)}  </relation>\n")
+        return relation_id
+
+    # Geometry
+
+    def point(self) -> Tuple[float, float]:
+        lat, lon = self.center
+        half = self.side_km / 2
+        return (lat + self.random.uniform(-half, half) / KM_PER_DEGREE,
+                lon + self.random.uniform(-half, half) / (KM_PER_DEGREE * math.cos(math.radians(lat))))
+
+    def offset(self, lat: float, lon: float, east_km: float, north_km: float) -> Tuple[float, float]:
+        return lat + north_km / KM_PER_DEGREE, lon + east_km / (KM_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01))
+
+    def ring(self, lat: float, lon: float, width_km: float, height_km: float, tags: Optional[Dict[str, str]] = None) -> int:
+        """Closed rectangular way around a point."""
+        corners = [self.node(*self.offset(lat, lon, east, north))
+                   for east, north in ((-width_km / 2, -height_km / 2), (width_km / 2, -height_km / 2),
+                                       (width_km / 2, height_km / 2), (-width_km / 2, height_km / 2))]
+        return self.way(corners + corners[:1], tags or {})
+
+    # Tags
+
+    def voltage(self) -> Tuple[Optional[str], int]:
+        """Voltage tag of a line from a random voltage rule, sometimes with a second circuit voltage."""
+        band = self.random.randrange(len(self.bands))
+        self.band_lines[band] += 1
+        voltages = self.bands[band]["voltages"]
+        if not voltages:
+            return None, band
+        voltage = str(self.random.choice(voltages))
+        if self.random.random() < 0.15:
+            voltage += ";" + str(self.random.choice(self.bands[self.random.randrange(len(self.bands))]["voltages"] or voltages))
+        return voltage, band
+
+    def lifecycle(self, power: str, tags: Dict[str, str]) -> Dict[str, str]:
+        """Tags of a line or cable in service, under construction, disused or removed."""
+        lifecycle = self._choice(LIFECYCLES)
+        tags = dict(tags)
+        for key, value in lifecycle.items():
+            if value is None:
+                # Lifecycle prefix, such as construction:power=line without power=*
+                del tags["power"]
+            tags[key] = value or power
+        return tags
+
+    # Features
+
+    def supported_line(self, power: str, support: str, span_km: Tuple[float, float], supports: Tuple[int, int]):
+        """Line of towers or poles, split into a few ways sharing their end supports, optionally in a circuit relation."""
+        lat, lon = self.point()
+        heading = self.random.uniform(0, 2 * math.pi)
+        voltage, band = self.voltage()
+        tags = {"power": power}
+        if voltage:
+            tags["voltage"] = voltage
+        if power == "line":
+            tags["cables"] = str(self.random.choice([3, 3, 3, 6, 6, 9, 12]))
+            tags["circuits"] = str(self.random.choice([1, 1, 1, 2, 2, 3, 4]))
+        elif self.random.random() < 0.2:
+            tags["cables"] = str(self.random.choice([2, 3, 4]))
+        if self.random.random() < 0.3:
+            tags["name"] = f"Synthetic {power.replace('_', ' ')} {self.features['line'] + self.features['minor_line'] + self.features['cable']}"
+        tags = self.lifecycle(power, tags)
+
+        nodes = []
+        for i in range(self.random.randint(*supports)):
+            support_tags = {"power": support} if support else {}
+            if support == "tower" and self.random.random() < 0.3:
+                support_tags["design"] = self.random.choice(TOWER_DESIGNS)
+            if support and self.random.random() < 0.1:
+                support_tags["ref"] = str(i + 1)
+            nodes.append(self.node(lat, lon, support_tags))
+            span = self.random.uniform(*span_km)
+            heading += self.random.uniform(-0.3, 0.3)
+            lat, lon = self.offset(lat, lon, span * math.cos(heading), span * math.sin(heading))
+
+        ways = []
+        cuts = sorted(self.random.sample(range(1, len(nodes) - 1), min(self.random.randint(0, 2), len(nodes) - 2)))
+        for start, end in zip([0] + cuts, cuts + [len(nodes) - 1]):
+            segment_tags = dict(tags)
+            crossing = self.random.random()
+            if power == "cable" and crossing < 0.3 or crossing < 0.03:
+                segment_tags["tunnel"] = "yes"
+                segment_tags["location"] = "underground"
+            elif crossing < 0.1:
+                segment_tags["bridge"] = "yes"
+            ways.append(self.way(nodes[start:end + 1], segment_tags))
+
+        if power != "minor_line" and self.random.random() < 0.3:
+            circuit = {"type": "power", "power": "circuit"}
+            if voltage:
+                circuit["voltage"] = voltage.split(";")[0]
+            self.relation([("way", way_id, "") for way_id in ways], circuit)
+
+    def substation(self):
+        """Substation area with its busbars, bays, portal, transformers and switches."""
+        lat, lon = self.point()
+        voltage, band = self.voltage()
+        tags = {"power": "substation", "substation": self.random.choice(SUBSTATION_ROLES)}
+        if voltage:
+            tags["voltage"] = voltage
+        size = self.random.uniform(0.05, 0.3)
+        multipolygon = self.random.random() < 0.1
+        outline = self.ring(lat, lon, size, size * self.random.uniform(0.5, 1.5), None if multipolygon else tags)
+        if multipolygon:
+            self.relation([("way", outline, "outer")], dict({"type": "multipolygon"}, **tags))
+        line_tags = {"power": "line", "voltage": voltage} if voltage else {"power": "line"}
+
+        busbars = self.random.randint(1, 3)
+        for i in range(busbars):
+            north = (i - busbars / 2) * size / 6
+            start, end = self.offset(lat, lon, -size / 3, north), self.offset(lat, lon, size / 3, north)
+            self.way([self.node(*start), self.node(*end)], dict(line_tags, line="busbar"))
+        for i in range(self.random.randint(2, 6)):
+            east = (i - 3) * size / 10
+            start, end = self.offset(lat, lon, east, -size / 2.5), self.offset(lat, lon, east, size / 2.5)
+            self.way([self.node(*start), self.node(*end, {"power": "switch"} if self.random.random() < 0.5 else None)], dict(line_tags, line="bay"))
+        if self.random.random() < 0.5:
+            start, end = self.offset(lat, lon, -size / 2.2, size / 2.4), self.offset(lat, lon, -size / 2.2, -size / 2.4)
+            self.way([self.node(*start), self.node(*end)], {"power": "portal"})
+        for i in range(self.random.randint(1, 3)):
+            self.node(*self.offset(lat, lon, size / 4, (i - 1) * size / 5), {"power": "transformer"})
+        if self.random.random() < 0.2:
+            self.ring(*self.offset(lat, lon, -size / 4, 0), size / 5, size / 5, dict({"power": "switchgear"}, **({"voltage": voltage} if voltage else {})))
+
+    def plant(self):
+        """Power plant area with its generators."""
+        lat, lon = self.point()
+        source = self.random.choice(GENERATOR_SOURCES)
+        size = self.random.uniform(0.2, 1.0)
+        self.ring(lat, lon, size, size, {"power": "plant", "plant:source": source})
+        for i in range(self.random.randint(1, 8)):
+            position = self.offset(lat, lon, self.random.uniform(-size / 3, size / 3), self.random.uniform(-size / 3, size / 3))
+            if source in ("solar", "coal", "gas") and self.random.random() < 0.4:
+                self.ring(*position, size / 10, size / 10, {"power": "generator", "generator:source": source})
+            else:
+                self.node(*position, {"power": "generator", "generator:source": source})
+
+    def add_feature(self):
+        feature = self.random.choices(list(FEATURE_WEIGHTS), list(FEATURE_WEIGHTS.values()))[0]
+        self.features[feature] += 1
+        if feature == "line":
+            self.supported_line("line", "tower", (0.25, 0.45), (4, 40))
+        elif feature == "minor_line":
+            self.supported_line("minor_line", "pole", (0.05, 0.1), (3, 25))
+        elif feature == "cable":
+            self.supported_line("cable", "", (0.05, 0.3), (2, 10))
+        elif feature == "substation":
+            self.substation()
+        elif feature == "plant":
+            self.plant()
+        else:
+            self.node(*self.point(), dict(self._choice(NODE_FEATURES)))
+
+def generate_grid(output_file: str, objects: int, seed: int = 0, density: float = 0.5, center: Tuple[float, float] = (0.0, 20.0),
+                  voltage_rules: Optional[List[Tuple[Optional[int], Optional[int], str, str]]] = None) -> Dict[str, Any]:
+    """Write a synthetic grid of about the given number of objects and return its statistics.
+
+    The grid covers a square around the center sized for the density, between 0 for a
+    rural grid and 1 for a dense urban one. Line voltages are spread evenly over the
+    voltage rules, so that every voltage class of a style gets exercised.
+    """
+    if not 0 <= density <= 1:
+        raise ValueError(f"density {density} must be between 0 and 1")
+    if objects < 1:
+        raise ValueError("the grid needs at least one object")
+    sparse, dense = OBJECTS_PER_KM2
+    side_km = math.sqrt(objects / (sparse + (dense - sparse) * density))
+
+    with _open_output(output_file) as output, tempfile.TemporaryFile("w+", encoding="utf-8") as way_spool, \
+            tempfile.TemporaryFile("w+", encoding="utf-8") as relation_spool:
+        output.write("<?xml version='1.0' encoding='UTF-8'?>\n<osm version='0.6' upload='never' generator='color-my-grid synthetic-grid'>\n")
+        grid = SyntheticGrid(output, way_spool, relation_spool, seed, center, side_km, voltage_rules)
+        while grid.objects < objects:
+            grid.add_feature()
+        for spool in (way_spool, relation_spool):
+            spool.seek(0)
+            while True:
+                chunk = spool.read(1 << 20)
+                if not chunk:
+                    break
+                output.write(chunk)
+        output.write("</osm>\n")
+
+    return {
+        "objects": grid.objects,
+        "nodes": grid.counts["node"],
+        "ways": grid.counts["way"],
+        "relations": grid.counts["relation"],
+        "seed": seed,
+        "density": density,
+        "side_km": round(side_km, 3),
+        "features": grid.features,
+        "voltage_bands": [{"label": band["label"], "lower": band["lower"], "upper": band["upper"], "lines": lines} for band, lines in zip(grid.bands, grid.band_lines)],
+    }
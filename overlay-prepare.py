@@ -0,0 +1,439 @@
+import argparse
+import collections
+import concurrent.futures
+import csv
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from xml.sax.saxutils import quoteattr
+
+from mapcss_engine import (ClassCondition, EvaluationStats, Environment, KeyCondition, KeyValueCondition, PseudoClassCondition,
+                           RegexpCondition, parse_stylesheet)
+from osm_density import tile_of
+from osm_extract import OsmElement
+
+# Style whose overlay rules decide which points are worth writing
+DEFAULT_STYLE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ohmygrid-default.mapcss")
+
+# Tag keys the overlay selectors of a style are recognised by
+OVERLAY_KEYS = {"item", "Type", "type", "reason"}
+
+# Column names recognised in the exports, compared without case, spaces or punctuation
+LATITUDE_COLUMNS = ["lat", "latitude", "y"]
+LONGITUDE_COLUMNS = ["lon", "lng", "long", "longitude", "x"]
+POINT_COLUMNS = ["coord", "coordinates", "location", "geometry", "wkt", "point"]
+COUNTRY_COLUMNS = ["country", "countryarea", "countrylabel", "countrycode", "iso2", "iso3"]
+
+# Tags written for each overlay source: tag -> columns it is read from, in order of preference.
+# "item", "Type", "type" and "reason" are the keys the template's overlay selectors test.
+SOURCES = {
+    "osmose": {
+        "item": ["item"],
+        "class": ["class"],
+        "level": ["level"],
+        "name": ["title", "subtitle"],
+        "osmose:uuid": ["uuid", "id"],
+    },
+    "gem": {
+        "Type": ["type", "technology", "fueltype"],
+        "name": ["plantprojectname", "plantname", "projectname", "name", "unitname"],
+        "capacity": ["capacitymw", "capacity"],
+        "status": ["status"],
+        "gem:id": ["gemunitphaseid", "gemlocationid", "gemunitid", "id"],
+    },
+    "wikidata": {
+        "type": ["typelabel", "instancelabel", "instanceoflabel", "type"],
+        "name": ["itemlabel", "label", "name"],
+        "wikidata": ["item", "wikidata", "qid"],
+    },
+    "issues": {
+        "reason": ["reason", "issue", "error"],
+        "name": ["name", "title"],
+    },
+}
+
+# Maximum number of shard spool files a reader keeps open at once
+MAX_OPEN_SHARDS = 128
+
+def normalize(name: str) -> str:
+    return re.sub(r"[^a-z0-9]", "", name.lower())
+
+def column(record: Dict[str, Any], candidates: List[str]) -> Optional[str]:
+    """First non-empty value among candidate columns of a record with normalized names."""
+    for candidate in candidates:
+        value = record.get(candidate)
+        if value not in (None, ""):
+            return str(value).strip()
+    return None
+
+def detect_source(record: Dict[str, Any]) -> Optional[str]:
+    """Guess the overlay source of an export from the columns of its first record."""
+    if "item" in record and str(record["item"]).strip().isdigit():
+        return "osmose"
+    if "wikidata" in record or "itemlabel" in record or "wikidata.org/entity/" in str(record.get("item", "")):
+        return "wikidata"
+    if any(name in record for name in ("gemunitphaseid", "gemlocationid", "capacitymw")):
+        return "gem"
+    if "reason" in record:
+        return "issues"
+    return None
+
+def coordinates(record: Dict[str, Any]) -> Optional[Tuple[float, float]]:
+    """Latitude and longitude of a record, from separate columns or a WKT "Point(lon lat)" value."""
+    latitude, longitude = column(record, LATITUDE_COLUMNS), column(record, LONGITUDE_COLUMNS)
+    try:
+        if latitude is not None and longitude is not None:
+            return float(latitude), float(longitude)
+        point = column(record, POINT_COLUMNS)
+        match = re.search(r"point\s*\(\s*(-?[\d.]+)\s+(-?[\d.]+)\s*\)", point or "", re.IGNORECASE)
+        if match:
+            return float(match.group(2)), float(match.group(1))
+    except ValueError:
+        pass
+    return None
+
+def overlay_tags(record: Dict[str, Any], source: str) -> Dict[str, str]:
+    """Tags of an overlay point, as expected by the template's overlay selectors."""
+    tags = {}
+    for tag, candidates in SOURCES[source].items():
+        value = column(record, candidates)
+        if value is not None:
+            tags[tag] = value
+    if source == "wikidata" and "wikidata" in tags:
+        tags["wikidata"] = tags["wikidata"].rsplit("/", 1)[-1]
+    return tags
+
+class OverlayRules:
+    """Node selectors of a style testing the overlay keys, telling which points the style draws."""
+
+    def __init__(self, text: str):
+        stylesheet = parse_stylesheet(text)
+        self.settings = stylesheet.settings
+        self.selectors = [selector for selector, rule in stylesheet.object_selectors
+                          if selector.index_key in OVERLAY_KEYS and len(selector.parts) == 1 and selector.subject.base in ("node", "*")]
+        # Tags the selectors test, or None when some condition may read any tag and every point has to be tested
+        self.keys = set()
+        for selector in self.selectors:
+            for condition in selector.subject.conditions:
+                if isinstance(condition, (KeyCondition, KeyValueCondition, RegexpCondition)):
+                    self.keys.add(condition.key)
+                elif not isinstance(condition, (ClassCondition, PseudoClassCondition)):
+                    self.keys = None
+                    break
+            if self.keys is None:
+                break
+        self._drawn: Dict[Tuple[Tuple[str, str], ...], bool] = {}
+
+    def draws(self, tags: Dict[str, str]) -> bool:
+        """Whether some overlay selector matches a point with these tags, at some zoom level."""
+        key = tuple(sorted((k, v) for k, v in tags.items() if self.keys is None or k in self.keys))
+        if key not in self._drawn:
+            element = OsmElement("node", -1, tags, 0.0, 0.0)
+            self._drawn[key] = any(
+                selector.matches(element, Environment(element, None, max(selector.subject.min_zoom, 0), self.settings, EvaluationStats()), "node")
+                for selector in self.selectors)
+        return self._drawn[key]
+
+# Overlay rules of each worker process, by style text
+_OVERLAY_RULES: Dict[str, OverlayRules] = {}
+
+def overlay_rules(text: str) -> OverlayRules:
+    if text not in _OVERLAY_RULES:
+        _OVERLAY_RULES[text] = OverlayRules(text)
+    return _OVERLAY_RULES[text]
+
+############
+# Readers #
+############
+
+def _open_text(path: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8-sig", newline="")
+    return open(path, "r", encoding="utf-8-sig", newline="")
+
+def iter_csv_records(path: str) -> Iterator[Dict[str, Any]]:
+    """Stream the rows of a CSV or TSV export, with normalized column names."""
+    with _open_text(path) as f:
+        sample = f.read(65536)
+        f.seek(0)
+        delimiter = "\t" if sample.count("\t") > sample.count(",") else ","
+        reader = csv.reader(f, delimiter=delimiter)
+        header = [normalize(name) for name in next(reader, [])]
+        for row in reader:
+            yield dict(zip(header, row))
+
+def _feature_record(feature: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    geometry = feature.get("geometry") or {}
+    if geometry.get("type") != "Point" or len(geometry.get("coordinates") or []) < 2:
+        return None
+    record = {normalize(key): value for key, value in (feature.get("properties") or {}).items()}
+    record["lon"], record["lat"] = geometry["coordinates"][:2]
+    return record
+
+def iter_geojson_records(path: str, chunk_size: int = 1 << 20) -> Iterator[Optional[Dict[str, Any]]]:
+    """Stream the point features of a GeoJSON FeatureCollection or GeoJSON lines file.
+
+    Features are decoded one at a time from a sliding buffer, so that memory does not
+    grow with the size of the collection. Features without a point geometry yield None.
+    """
+    decoder = json.JSONDecoder()
+    with _open_text(path) as f:
+        buffer = f.read(chunk_size)
+        stripped = buffer.lstrip()
+        if stripped.startswith("{") and '"features"' not in buffer[:chunk_size // 2] and "\n{" in stripped:
+            # GeoJSON lines: one feature per line
+            f.seek(0)
+            for line in f:
+                if line.strip():
+                    yield _feature_record(json.loads(line))
+            return
+
+        start = buffer.find('"features"')
+        while start < 0:
+            more = f.read(chunk_size)
+            if not more:
+                return
+            buffer += more
+            start = buffer.find('"features"')
+        while buffer.find("[", start) < 0:
+            more = f.read(chunk_size)
+            if not more:
+                return
+            buffer += more
+        position = buffer.index("[", start) + 1
+
+        # position only moves forward, the consumed text is dropped when the next chunk is read
+        while True:
+            while position < len(buffer) and buffer[position] in " \t\r\n,":
+                position += 1
+            if position == len(buffer):
+                more = f.read(chunk_size)
+                if not more:
+                    return
+                buffer, position = more, 0
+                continue
+            if buffer[position] == "]":
+                return
+            try:
+                feature, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                more = f.read(chunk_size)
+                if not more:
+                    raise ValueError(f"{path}: truncated GeoJSON feature")
+                buffer, position = buffer[position:] + more, 0
+                continue
+            yield _feature_record(feature)
+            position = end
+
+def iter_records(path: str) -> Iterator[Optional[Dict[str, Any]]]:
+    """Stream the records of a CSV/TSV or GeoJSON export, optionally gzipped."""
+    name = path[:-3] if path.endswith(".gz") else path
+    if name.endswith((".geojson", ".json", ".geojsonl", ".geojsons", ".ndjson")):
+        return iter_geojson_records(path)
+    return iter_csv_records(path)
+
+############
+# Sharding #
+############
+
+def shard_key(latitude: float, longitude: float, country: Optional[str], shard_by: str, tile_zoom: int) -> str:
+    """Shard of a point: its country as written in the export (empty when unknown) or its tile."""
+    if shard_by == "country":
+        return country or ""
+    x, y = tile_of(latitude, longitude, tile_zoom)
+    return f"{tile_zoom}-{x}-{y}"
+
+def _key_hash(shard: str) -> str:
+    return hashlib.sha1(shard.encode("utf-8")).hexdigest()[:8]
+
+def shard_names(shards: List[str], shard_by: str) -> Dict[str, str]:
+    """File name of each shard, without extension.
+
+    Country names are reduced to letters, digits, "-" and "_". Countries reduced to
+    the same name, ignoring case for case-insensitive file systems, get the hash of
+    their original name appended so that they keep their own files.
+    """
+    if shard_by != "country":
+        return {shard: shard for shard in shards}
+    names = {shard: re.sub(r"[^\w-]+", "_", shard).strip("_") or "unknown" for shard in shards}
+    clashes = collections.Counter(name.lower() for name in names.values())
+    return {shard: name if clashes[name.lower()] == 1 else f"{name}-{_key_hash(shard)}" for shard, name in names.items()}
+
+def spool_file(spool_dir: str, shard: str, index: int) -> str:
+    """Spool file of a shard for one input, named after the hash of the shard as countries may be any text."""
+    return os.path.join(spool_dir, f"{_key_hash(shard)}.{index}.jsonl")
+
+def spool_input(task: Tuple[int, int, str, str, str, int, str, Optional[str], bool]) -> Dict[str, Any]:
+    """Read one export and append its points to per-shard spool files, returning the shard statistics."""
+    index, inputs, path, source, shard_by, tile_zoom, spool_dir, style, keep_unstyled = task
+    records = iter_records(path)
+    rules = overlay_rules(style) if style is not None else None
+    stats = {"input": path, "source": source, "points": 0, "skipped": 0, "unstyled": 0, "shards": {}}
+    handles: Dict[str, Any] = {}
+    count = 0
+    try:
+        for record in records:
+            if record is None:
+                stats["skipped"] += 1
+                continue
+            if stats["source"] == "auto":
+                stats["source"] = detect_source(record)
+                if stats["source"] is None:
+                    raise ValueError(f"{path}: cannot tell the overlay source from its columns, use --source")
+            point = coordinates(record)
+            tags = overlay_tags(record, stats["source"])
+            if point is None or not (-90 <= point[0] <= 90 and -180 <= point[1] <= 180) or not tags:
+                stats["skipped"] += 1
+                continue
+            if rules is not None and not rules.draws(tags):
+                stats["unstyled"] += 1
+                if not keep_unstyled:
+                    continue
+
+            shard = shard_key(point[0], point[1], column(record, COUNTRY_COLUMNS), shard_by, tile_zoom)
+            handle = handles.get(shard)
+            if handle is None:
+                if len(handles) >= MAX_OPEN_SHARDS:
+                    handles.pop(next(iter(handles))).close()
+                handle = handles[shard] = open(spool_file(spool_dir, shard, index), "a", encoding="utf-8")
+            count += 1
+            # Negative ids, unique over all inputs, keep JOSM from treating the points as OSM data
+            handle.write(json.dumps([-(count * inputs + index + 1), point[0], point[1], tags]) + "\n")
+
+            shard_stats = stats["shards"].setdefault(shard, {"points": 0, "bbox": [point[1], point[0], point[1], point[0]]})
+            shard_stats["points"] += 1
+            bbox = shard_stats["bbox"]
+            bbox[:] = [min(bbox[0], point[1]), min(bbox[1], point[0]), max(bbox[2], point[1]), max(bbox[3], point[0])]
+            stats["points"] += 1
+    finally:
+        for handle in handles.values():
+            handle.close()
+    return stats
+
+def write_shard(task: Tuple[str, List[str], str, str]) -> str:
+    """Merge the spool files of one shard into an .osm or GeoJSON file."""
+    shard, spools, output_file, output_format = task
+    with open(output_file, "w", encoding="utf-8") as out:
+        if output_format == "osm":
+            out.write("<?xml version='1.0' encoding='UTF-8'?>\n<osm version='0.6' upload='never' generator='color-my-grid overlay-prepare'>\n")
+        else:
+            out.write('{"type": "FeatureCollection", "features": [\n')
+        first = True
+        for spool in spools:
+            with open(spool, "r", encoding="utf-8") as f:
+                for line in f:
+                    node_id, latitude, longitude, tags = json.loads(line)
+                    if output_format == "osm":
+                        out.write(f"  <node id='{node_id}' version='1' lat='{latitude:.7f}' lon='{longitude:.7f}'>\n")
+                        for key, value in tags.items():
+                            out.write(f"    <tag k={quoteattr(key)} v={quoteattr(value)} />\n")
+                        out.write("  </node>\n")
+                    else:
+                        feature = {"type": "Feature", "geometry": {"type": "Point", "coordinates": [longitude, latitude]}, "properties": tags}
+                        out.write(("" if first else ",\n") + json.dumps(feature))
+                    first = False
+        out.write("</osm>\n" if output_format == "osm" else "\n]}\n")
+    return shard
+
+def prepare_overlays(inputs: List[str], output_dir: str, source: str = "auto", shard_by: str = "tile", tile_zoom: int = 7,
+                     output_format: str = "osm", jobs: Optional[int] = None, style: Optional[str] = None, keep_unstyled: bool = False) -> Dict[str, Any]:
+    """Shard overlay exports into per-country or per-tile files and return the index describing them.
+
+    With the text of a style, points none of its overlay selectors match are counted
+    as unstyled and left out, unless keep_unstyled is set.
+    """
+    start = time.perf_counter()
+    os.makedirs(output_dir, exist_ok=True)
+    spool_dir = tempfile.mkdtemp(prefix=".spool-", dir=output_dir)
+    extension = ".osm" if output_format == "osm" else ".geojson"
+    try:
+        tasks = [(index, len(inputs), path, source, shard_by, tile_zoom, spool_dir, style, keep_unstyled) for index, path in enumerate(inputs)]
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+            input_stats = list(executor.map(spool_input, tasks))
+
+            shards: Dict[str, Dict[str, Any]] = {}
+            for index, stats in enumerate(input_stats):
+                for shard, shard_stats in stats["shards"].items():
+                    entry = shards.setdefault(shard, {"points": 0, "bbox": list(shard_stats["bbox"]), "sources": {}, "spools": []})
+                    entry["points"] += shard_stats["points"]
+                    entry["sources"][stats["source"]] = entry["sources"].get(stats["source"], 0) + shard_stats["points"]
+                    bbox, other = entry["bbox"], shard_stats["bbox"]
+                    entry["bbox"] = [min(bbox[0], other[0]), min(bbox[1], other[1]), max(bbox[2], other[2]), max(bbox[3], other[3])]
+                    entry["spools"].append(spool_file(spool_dir, shard, index))
+
+            names = shard_names(list(shards), shard_by)
+            write_tasks = [(shard, entry["spools"], os.path.join(output_dir, names[shard] + extension), output_format) for shard, entry in sorted(shards.items())]
+            list(executor.map(write_shard, write_tasks))
+    finally:
+        shutil.rmtree(spool_dir, ignore_errors=True)
+
+    index = {
+        "inputs": [{key: stats[key] for key in ("input", "source", "points", "skipped", "unstyled")} for stats in input_stats],
+        "shard_by": shard_by,
+        "format": output_format,
+        "points": sum(stats["points"] for stats in input_stats),
+        "skipped": sum(stats["skipped"] for stats in input_stats),
+        "unstyled": sum(stats["unstyled"] for stats in input_stats),
+        "unstyled_kept": keep_unstyled,
+        "shards": [],
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+    for shard, entry in sorted(shards.items(), key=lambda item: names[item[0]]):
+        shard_entry = {"name": names[shard], "file": names[shard] + extension, "points": entry["points"], "sources": entry["sources"],
+                       "bbox": [round(value, 7) for value in entry["bbox"]]}
+        if shard_by == "country":
+            shard_entry["country"] = shard
+        index["shards"].append(shard_entry)
+    if shard_by == "tile":
+        index["tile_zoom"] = tile_zoom
+    with open(os.path.join(output_dir, "index.json"), "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=2)
+    return index
+
+def main():
+    parser = argparse.ArgumentParser(description="Shard Osmose, GEM and Wikidata exports into small overlay files styled by the template's marker rules.")
+    parser.add_argument("inputs", nargs="+", help="CSV/TSV or GeoJSON exports, optionally gzipped")
+    parser.add_argument("--source", choices=["auto"] + list(SOURCES), default="auto", help="overlay source of the inputs (default: guessed from their columns)")
+    parser.add_argument("--shard-by", choices=["tile", "country"], default="tile", help="split the points per map tile or per country column (default: tile)")
+    parser.add_argument("--tile-zoom", type=int, default=7, help="zoom level of the tiles with --shard-by tile (default: 7, about 300x300 km)")
+    parser.add_argument("--format", choices=["osm", "geojson"], default="osm", help="format of the shard files (default: osm)")
+    parser.add_argument("--output-dir", default="overlays", help="directory for the shard files and index.json (default: overlays)")
+    parser.add_argument("--jobs", type=int, default=None, help="number of worker processes (default: CPU count)")
+    parser.add_argument("--style", default=DEFAULT_STYLE, help="generated style whose overlay rules the points are checked against (default: ohmygrid-default.mapcss)")
+    parser.add_argument("--keep-unstyled", action="store_true", help="also write the points none of the style's overlay rules draws")
+    args = parser.parse_args()
+
+    for path in args.inputs + [args.style]:
+        if not os.path.exists(path):
+            raise OSError(f"can't find the file '{path}'")
+    with open(args.style, "r", encoding="utf-8") as f:
+        style = f.read()
+    if not OverlayRules(style).selectors:
+        raise ValueError(f"'{args.style}' has no rule for the overlay keys ({', '.join(sorted(OVERLAY_KEYS))})")
+
+    print(f"📥 Reading {len(args.inputs)} exports...")
+    index = prepare_overlays(args.inputs, args.output_dir, args.source, args.shard_by, args.tile_zoom, args.format, args.jobs, style, args.keep_unstyled)
+
+    for entry in index["inputs"]:
+        print(f"✅ {entry['input']}: {entry['points']} {entry['source']} points" + (f", {entry['skipped']} skipped" if entry["skipped"] else ""))
+        if entry["unstyled"]:
+            print(f"⚠️ {entry['unstyled']} points match no overlay rule of '{args.style}'" +
+                  (", kept anyway" if args.keep_unstyled else " and were left out (use --keep-unstyled to keep them)"))
+    print(f"\n{'Shard':20} {'Points':>8}  Sources")
+    for shard in sorted(index["shards"], key=lambda shard: -shard["points"])[:15]:
+        print(f"{shard['file']:20} {shard['points']:>8}  {', '.join(f'{source} {count}' for source, count in shard['sources'].items())}")
+    print(f"\n📊 {index['points']} points in {len(index['shards'])} shards in {index['seconds']}s, index saved as '{os.path.join(args.output_dir, 'index.json')}'")
+
+if __name__ == "__main__":
+    try:
+        main()
+    except (OSError, ValueError) as e:
+        print(f"❌ {e}")
+        sys.exit(1)
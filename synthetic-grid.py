@@ -0,0 +1,91 @@
+import argparse
+import importlib.util
+import json
+import os
+import sys
+import time
+from typing import Any, List, Optional, Tuple
+
+from osm_synthetic import generate_grid
+
+def load_generator():
+    """mapcss-generator.py, which cannot be imported by name, for its voltage rules parser and presets."""
+    spec = importlib.util.spec_from_file_location("mapcss_generator", os.path.join(os.path.dirname(os.path.abspath(__file__)), "mapcss-generator.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def load_voltage_rules(source: str, variant: Optional[str] = None) -> List[Tuple[Optional[int], Optional[int], str, str]]:
+    """Voltage rules from a preset name, a JSON file holding a preset name or a list of rules, or a variant of a batch configuration.
+
+    Variants take their rules like the batch mode does: from the variant, then from the
+    configuration, then from their base preset.
+    """
+    generator = load_generator()
+    if source in generator.PRESETS and not os.path.exists(source):
+        return generator.parse_voltage_rules(source)
+
+    with open(source, "r", encoding="utf-8") as f:
+        rules: Any = json.load(f)
+    if isinstance(rules, dict):
+        config = rules
+        variants = [entry for entry in config.get("variants", []) if variant is None or entry.get("name") == variant]
+        if not variants:
+            raise ValueError(f"no variant{f' named {variant}' if variant else ''} in '{source}'")
+        base = variants[0].get("base", config.get("base", "default"))
+        if base not in generator.PRESETS:
+            raise ValueError(f"variant '{variants[0].get('name')}': unknown base preset '{base}' (use one of {', '.join(generator.PRESETS)})")
+        rules = variants[0].get("voltage_rules", config.get("voltage_rules", base))
+    return generator.parse_voltage_rules(rules)
+
+def parse_size(size: str) -> int:
+    """Number of objects, accepting k and M suffixes such as 10k or 1.5M."""
+    multiplier = {"k": 1000, "m": 1000000}.get(size[-1:].lower(), 1)
+    try:
+        return int(float(size[:-1] if multiplier > 1 else size) * multiplier)
+    except ValueError:
+        raise ValueError(f"invalid size '{size}', use a number such as 50000, 10k or 2M")
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic power grid as an OSM file, to load test styles on data of a controlled size.")
+    parser.add_argument("output", help="OSM file to write (.osm or .osm.gz)")
+    parser.add_argument("--objects", default="10k", help="number of nodes, ways and relations, e.g. 10k, 500k or 10M (default: 10k)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed, the same seed always gives the same grid (default: 0)")
+    parser.add_argument("--density", type=float, default=0.5, help="grid density from 0 (rural) to 1 (dense urban) (default: 0.5)")
+    parser.add_argument("--center", default="0,20", metavar="LAT,LON", help="center of the grid (default: 0,20)")
+    parser.add_argument("--voltage-rules", metavar="PRESET|FILE", help="preset name, JSON voltage rules or batch configuration to spread line voltages over (default: common voltages)")
+    parser.add_argument("--variant", help="batch configuration variant to take the voltage rules from (default: the first one)")
+    parser.add_argument("--json", metavar="FILE", help="save the grid statistics as JSON")
+    args = parser.parse_args()
+
+    objects = parse_size(args.objects)
+    try:
+        center = tuple(float(value) for value in args.center.split(","))
+    except ValueError:
+        center = ()
+    if len(center) != 2:
+        raise ValueError(f"invalid center '{args.center}', use LAT,LON")
+    voltage_rules = load_voltage_rules(args.voltage_rules, args.variant) if args.voltage_rules else None
+
+    print(f"⚙️ Generating about {objects} objects (seed {args.seed}, density {args.density})...")
+    start = time.perf_counter()
+    stats = generate_grid(args.output, objects, args.seed, args.density, center, voltage_rules)
+    stats["seconds"] = round(time.perf_counter() - start, 3)
+
+    print(f"✅ {stats['nodes']} nodes, {stats['ways']} ways and {stats['relations']} relations over {stats['side_km']}×{stats['side_km']} km in {stats['seconds']}s")
+    print("📊 Features: " + ", ".join(f"{count} {feature}" for feature, count in stats["features"].items()))
+    if voltage_rules:
+        print("⚡ Lines per voltage rule: " + ", ".join(f"{band['label']}: {band['lines']}" for band in stats["voltage_bands"]))
+    print(f"💾 Grid saved as '{args.output}' ({os.path.getsize(args.output) / 1e6:.1f} MB)")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(stats, f, indent=2)
+        print(f"💾 Statistics saved as '{args.json}'")
+
+if __name__ == "__main__":
+    try:
+        main()
+    except (OSError, ValueError) as e:
+        print(f"❌ {e}")
+        sys.exit(1)
@@ -0,0 +1,28 @@
+import importlib.util
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The tested modules live at the repository root, next to the scripts
+sys.path.insert(0, ROOT)
+
+@pytest.fixture(scope="session")
+def generator():
+    """mapcss-generator.py, which cannot be imported by name."""
+    spec = importlib.util.spec_from_file_location("mapcss_generator", os.path.join(ROOT, "mapcss-generator.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+@pytest.fixture(scope="session")
+def template():
+    with open(os.path.join(ROOT, "map_your_grid_template.mapcss"), "r", encoding="utf-8") as f:
+        return f.read()
+
+@pytest.fixture(scope="session")
+def default_style():
+    with open(os.path.join(ROOT, "ohmygrid-default.mapcss"), "r", encoding="utf-8") as f:
+        return f.read()
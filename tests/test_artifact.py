@@ -0,0 +1,47 @@
+import os
+
+import pytest
+
+from conftest import ROOT
+
+PRESET_STYLES = [("default", "ohmygrid-default.mapcss"), ("dense", "ohmygrid-default-high-density.mapcss")]
+
+@pytest.mark.parametrize("preset, style_file", PRESET_STYLES)
+def test_presets_render_the_committed_styles(generator, template, preset, style_file):
+    with open(os.path.join(ROOT, style_file), "r", encoding="utf-8") as f:
+        expected = f.read()
+    values, voltage_rules = generator.PRESETS[preset]
+    assert generator.render_style(template, values, voltage_rules) == expected
+    assert generator.render_artifact(generator.compile_template(template), values, voltage_rules) == expected
+
+def test_templates_with_jinja_blocks_are_rendered_with_jinja(generator):
+    template = "{% if segment_width_low > 2 %}way { width: {{ segment_width_low }}; }{% endif %}\n"
+    artifact = generator.compile_template(template)
+    assert artifact["jinja"]
+    assert generator.render_artifact(artifact, generator.DEFAULT_VALUES, []) == "way { width: 4; }"
+
+def test_artifacts_are_cached_under_the_template_hash(generator, template, tmp_path, monkeypatch):
+    monkeypatch.setattr(generator, "_artifacts", {})
+    template_file = tmp_path / "template.mapcss"
+    template_file.write_text(template, encoding="utf-8")
+    cache_dir = tmp_path / "cache"
+    artifact = generator.load_template_artifact(str(template_file), str(cache_dir))
+    assert os.listdir(cache_dir) == [f"{generator.template_hash(template)}.jsonl"]
+    assert list(generator.iter_artifact_chunks(artifact)) == generator.compile_template(template)["chunks"]
+
+    generator._artifacts.clear()
+    assert generator.load_template_artifact(str(template_file), str(cache_dir)) == artifact
+    template_file.write_text(template + "\n/* edited */\n", encoding="utf-8")
+    assert generator.load_template_artifact(str(template_file), str(cache_dir)) != artifact
+    assert len(os.listdir(cache_dir)) == 2
+
+def test_an_unwritable_cache_only_warns(generator, template, tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(generator, "_artifacts", {})
+    template_file = tmp_path / "template.mapcss"
+    template_file.write_text(template, encoding="utf-8")
+    blocked = tmp_path / "file"
+    blocked.write_text("not a directory")
+    artifact = generator.load_template_artifact(str(template_file), str(blocked / "cache"))
+    assert "Cannot cache the compiled template" in capsys.readouterr().out
+    assert artifact["chunks_file"] is None
+    assert list(generator.iter_artifact_chunks(artifact)) == generator.compile_template(template)["chunks"]
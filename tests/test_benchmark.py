@@ -0,0 +1,25 @@
+def test_artifact_and_jinja_cases(generator, template):
+    rules = generator.benchmark_voltage_rules(10)
+    artifact = generator.benchmark_case(template, rules, "flat", 2, "artifact")
+    jinja = generator.benchmark_case(template, rules, "flat", 2, "jinja")
+    assert "compile_template" in artifact["phases"] and not any(phase.startswith("jinja_") for phase in artifact["phases"])
+    assert "jinja_render" in jinja["phases"] and "compile_template" not in jinja["phases"]
+    # Both renderers give the same style, timed separately
+    assert artifact["output"] == jinja["output"]
+    assert len(artifact["runs"]) == 2 and min(artifact["runs"]) <= artifact["seconds"] <= max(artifact["runs"])
+
+def test_regressions_above_noise(generator):
+    baseline = {"cases": {"short": {"seconds": 0.004}, "long": {"seconds": 0.2}, "steady": {"seconds": 0.2}}}
+    cases = {"short": {"seconds": 0.012}, "long": {"seconds": 0.3}, "steady": {"seconds": 0.22}, "new": {"seconds": 1.0}}
+    regressions = generator.compare_benchmark(cases, baseline, 0.25)
+    # Tripling a few milliseconds is noise, 50% on 200 ms is not
+    assert [(regression["case"], regression["change"]) for regression in regressions] == [("long", 0.5)]
+
+def test_unchanged_code_passes(generator, tmp_path, capsys):
+    template_file = tmp_path / "template.mapcss"
+    template_file.write_text("way[power=line] { color: {{line_color}}; }\n/* Power lines voltage-based styles */\n/* End of power lines voltage-based styles */\n",
+                             encoding="utf-8")
+    baseline = str(tmp_path / "baseline.json")
+    assert generator.run_benchmark(str(template_file), [10], ["flat"], 3, save_baseline=baseline) == 0
+    assert generator.run_benchmark(str(template_file), [10], ["flat"], 3, baseline_file=baseline) == 0
+    assert "✅ No case" in capsys.readouterr().out
@@ -0,0 +1,27 @@
+import pytest
+
+from mapcss_coverage import coverage_rows, rule_coverage
+from osm_extract import iter_elements
+from osm_synthetic import generate_grid
+
+@pytest.fixture(scope="module")
+def grid(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("grid") / "grid.osm")
+    generate_grid(path, 1500, seed=3)
+    return path
+
+def test_parallel_coverage_equals_serial(grid, default_style):
+    serial = rule_coverage(grid, default_style, [12, 16], jobs=1)
+    parallel = rule_coverage(grid, default_style, [12, 16], jobs=2)
+    assert parallel == serial
+    assert serial["objects"] == sum(1 for element in iter_elements(grid))
+    assert 0 < serial["dead_rules"] < len(serial["rules"])
+
+def test_rule_index_only_changes_the_tests(grid, default_style):
+    indexed = rule_coverage(grid, default_style, [16], jobs=1)
+    scanned = rule_coverage(grid, default_style, [16], jobs=1, use_index=False)
+    assert [rule["hits"] for rule in indexed["rules"]] == [rule["hits"] for rule in scanned["rules"]]
+    assert sum(rule["tests"] for rule in indexed["rules"]) < sum(rule["tests"] for rule in scanned["rules"])
+    rows = coverage_rows(indexed)
+    assert rows[0][-1] == indexed["bands"][-1]
+    assert len(rows) == 1 + sum(len(rule["selectors"]) for rule in indexed["rules"])
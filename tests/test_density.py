@@ -0,0 +1,47 @@
+import pytest
+
+from osm_density import DENSITY_REFERENCES, collect_density_statistics, metric_score
+
+def write_towers(path, count, step):
+    """OSM extract with count towers spaced step degrees apart from 0.1, 20.1."""
+    nodes = "".join(f'  <node id="{i + 1}" lat="{0.1 + (i // 50) * step}" lon="{20.1 + (i % 50) * step}"><tag k="power" v="tower"/></node>\n' for i in range(count))
+    path.write_text(f'<?xml version="1.0" encoding="UTF-8"?>\n<osm version="0.6">\n{nodes}</osm>\n', encoding="utf-8")
+    return str(path)
+
+def test_density_values_follow_the_presets_at_both_ends(generator):
+    assert generator.density_values(0) == generator.DEFAULT_VALUES
+    dense = dict(generator.DENSE_VALUES, **{var: zooms[1] for var, zooms in generator.DENSITY_ZOOM_GATES.items()})
+    assert generator.density_values(1) == dense
+
+def test_density_values_move_widths_in_half_pixels_and_zoom_gates_in_levels(generator):
+    values = generator.density_values(0.25)
+    # A quarter of the way from 10 (default) to 0.5 (dense) is 7.625, rounded to the nearest half pixel
+    assert values["substation_area_width_low"] == 7.5
+    assert values["casing_min_zoom"] == 4
+    assert values["line_label_min_zoom"] == 18
+    assert all(isinstance(values[var], int) for var in generator.DENSITY_ZOOM_GATES)
+
+def test_metric_score_is_logarithmic_between_the_references():
+    sparse, dense = DENSITY_REFERENCES["towers_per_km2"]
+    assert metric_score(sparse / 2, sparse, dense) == 0.0
+    assert metric_score(dense * 2, sparse, dense) == 1.0
+    assert metric_score((sparse * dense) ** 0.5, sparse, dense) == pytest.approx(0.5)
+
+def test_density_score_of_sparse_and_dense_extracts(tmp_path):
+    sparse = collect_density_statistics(write_towers(tmp_path / "sparse.osm", 10, 0.05))
+    assert sparse["totals"]["towers"] == 10
+    assert sparse["density_score"] == 0.0
+
+    # 2000 towers within a tenth of a degree crowd a single tile of about 1500 km²
+    dense = collect_density_statistics(write_towers(tmp_path / "dense.osm", 2000, 0.002))
+    assert dense["grid_tiles"] == 1
+    assert dense["scores"]["towers_per_km2"] == 1.0
+    assert dense["density_score"] == 1.0
+
+def test_density_variants_check_their_base_preset(generator, tmp_path):
+    job = generator.resolve_variant({"name": "auto", "density_from": "region.osm", "base": "dense"}, {}, str(tmp_path))
+    assert job["base"] == "dense"
+    assert job["voltage_rules"] == generator.DENSE_VOLTAGE_RULES
+    assert job["density_from"] == str(tmp_path / "region.osm")
+    with pytest.raises(ValueError, match="unknown base preset 'sparse'"):
+        generator.resolve_variant({"name": "auto", "density_from": "region.osm", "base": "sparse"}, {}, str(tmp_path))
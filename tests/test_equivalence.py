@@ -0,0 +1,39 @@
+from mapcss_equivalence import check_equivalence
+
+STYLE = """way[power=line] {
+    color: #888888;
+    width: 2;
+}
+way[power=line][voltage>=220000] {
+    color: #FF0000;
+}
+node|z14-[power=tower] {
+    symbol-shape: square;
+}
+"""
+
+def test_equivalent_rewrite():
+    # Same paint with the rules written differently
+    rewritten = STYLE.replace("color: #888888;\n    width: 2;", "width: 2;\n    color: #888888;")
+    report = check_equivalence(STYLE, rewritten, cases=300, jobs=1)
+    assert report["equivalent"]
+    assert report["failures"] == 0 and report["examples"] == []
+
+def test_counterexample_is_shrunk():
+    changed = STYLE.replace("voltage>=220000", "voltage>220000")
+    report = check_equivalence(STYLE, changed, cases=600, jobs=1)
+    assert not report["equivalent"]
+    example = report["examples"][0]
+    # Only the tags telling the styles apart are left, with a single voltage
+    assert example["object"]["kind"] in ("way", "area")
+    assert example["object"]["tags"] == {"power": "line", "voltage": "220000"}
+    assert example["object"]["parent"] is None
+    assert example["differences"] == {"default": {"color": ["#ff0000", "#888888"]}}
+
+def test_zoom_difference_and_seed():
+    changed = STYLE.replace("node|z14-", "node|z15-")
+    report = check_equivalence(STYLE, changed, cases=600, jobs=1)
+    assert not report["equivalent"]
+    assert {example["object"]["zoom"] for example in report["examples"]} == {14}
+    # The same seed gives the same report, in parallel as well
+    assert check_equivalence(STYLE, changed, cases=600, jobs=2) == report
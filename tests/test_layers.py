@@ -0,0 +1,40 @@
+import re
+
+import pytest
+
+from mapcss_engine import parse_stylesheet
+from mapcss_equivalence import check_equivalence
+from mapcss_layers import layer_file, split_layers
+
+def test_layers_loaded_together_paint_like_the_combined_style(default_style):
+    layers = split_layers(default_style)
+    assert [layer["layer"] for layer in layers] == ["nodes", "areas", "lines", "circuits", "overlays"]
+    # JOSM applies the style sources in turn to the same objects, like one stylesheet made of all of them
+    report = check_equivalence(default_style, "\n".join(layer["text"] for layer in layers), cases=1000, jobs=1)
+    assert report["equivalent"], report["examples"]
+
+def test_every_layer_stands_alone(default_style):
+    for layer in split_layers(default_style):
+        stylesheet = parse_stylesheet(layer["text"])
+        assert len(stylesheet.object_rules) == layer["rules"]
+        assert layer["text"].startswith(f"/* Layer '{layer['layer']}': {layer['rules']} rules.")
+        assert f"({layer['layer']})\"" in layer["text"]
+        # Only the settings its rules read are declared
+        assert set(re.findall(r'setting\("([^"]+)"\)', layer["text"])) == set(stylesheet.settings)
+        if "set .voltage_" in layer["text"]:
+            assert "way.voltage_no, area.voltage_no" in layer["text"]
+
+def test_styles_without_layer_markers_cannot_be_split():
+    with pytest.raises(ValueError, match="none of the layer markers"):
+        split_layers("way { width: 1; }\n")
+
+def test_layer_files_sit_next_to_the_style():
+    assert layer_file("build/grid.mapcss", "lines") == "build/grid-lines.mapcss"
+    assert layer_file("grid", "nodes") == "grid-nodes.mapcss"
+
+def test_minified_layers_paint_like_the_minified_style(generator, default_style):
+    result, reports, layers = generator.finish_style(default_style, ["minify"], split_layers=True)
+    # Each layer is minified on its own, only its annotation is left as a comment
+    assert all(layer["text"].count("/*") == 1 for layer in layers)
+    report = check_equivalence(result, "\n".join(layer["text"] for layer in layers), cases=500, jobs=1)
+    assert report["equivalent"], report["examples"]
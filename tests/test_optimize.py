@@ -0,0 +1,80 @@
+from mapcss_engine import apply_stylesheet, parse_stylesheet, resolved_style, style_cardinality
+from mapcss_equivalence import check_equivalence
+from mapcss_optimize import collect_tag_inventory, expand_regex_selectors, merge_zoom_bands, minify_stylesheet, regex_alternatives, tree_shake_stylesheet
+from osm_extract import OsmDataset, OsmElement, load_dataset
+
+def test_expand_regex_paints_like_the_default_style(default_style):
+    expanded, report = expand_regex_selectors(default_style)
+    assert report["selectors_expanded"] > 0
+    assert "way[/^(construction:|disused:|removed:)?power$/" not in expanded
+    assert check_equivalence(default_style, expanded, cases=1000, jobs=1)["equivalent"]
+
+def test_regex_alternatives_only_lists_anchored_regexes():
+    assert regex_alternatives("^(construction:|disused:)?power$") == ["power", "construction:power", "disused:power"]
+    assert regex_alternatives("line|minor_line") is None
+    assert regex_alternatives("^line.*$") is None
+
+def test_minify_paints_like_the_default_style(default_style):
+    minified, report = minify_stylesheet(default_style)
+    assert report["rules_after"] < report["rules_before"]
+    assert check_equivalence(default_style, minified, cases=1000, jobs=1)["equivalent"]
+
+def test_minify_keeps_declarations_read_by_is_prop_set():
+    text = "way[power=line]{width:2}\nway[power=line][is_prop_set(width)]{color:red}\nway[power]{width:3}\n"
+    minified, report = minify_stylesheet(text)
+    assert len(parse_stylesheet(minified).object_rules) == 3
+    assert check_equivalence(text, minified, cases=200, jobs=1)["equivalent"]
+
+SMALL_EXTRACT = """<?xml version="1.0" encoding="UTF-8"?>
+<osm version="0.6">
+  <node id="1" lat="0.0" lon="20.0"><tag k="power" v="tower"/></node>
+  <node id="2" lat="0.01" lon="20.0"><tag k="power" v="tower"/></node>
+  <node id="3" lat="0.02" lon="20.0"/>
+  <node id="4" lat="0.02" lon="20.01"/>
+  <node id="5" lat="0.03" lon="20.01"/>
+  <way id="10"><nd ref="1"/><nd ref="2"/><tag k="power" v="line"/><tag k="voltage" v="225000;63000"/><tag k="circuits" v="2"/></way>
+  <way id="11"><nd ref="3"/><nd ref="4"/><nd ref="5"/><nd ref="3"/><tag k="power" v="substation"/><tag k="substation" v="transmission"/></way>
+</osm>
+"""
+
+def test_tree_shake_keeps_the_style_of_every_object_of_the_extract(default_style, tmp_path):
+    extract = tmp_path / "small.osm"
+    extract.write_text(SMALL_EXTRACT, encoding="utf-8")
+    shaken, report = tree_shake_stylesheet(default_style, collect_tag_inventory(str(extract)))
+    assert report["rules_removed"] > 0
+    assert "[Type" not in shaken
+
+    dataset = load_dataset(str(extract))
+    original, reduced = parse_stylesheet(default_style), parse_stylesheet(shaken)
+    for zoom in (10, 15, 18, 22):
+        for element in dataset:
+            assert resolved_style(apply_stylesheet(reduced, element, zoom, dataset)) == resolved_style(apply_stylesheet(original, element, zoom, dataset))
+
+ZOOM_BANDS_STYLE = """way|z0-15[power=line] { width: 2; }
+way|z16-19[power=line] { width: 2; }
+way|z20-[power=line] { width: 3; }
+way|z0-15[power=cable] { width: 1; }
+way|z16-[power=cable] { width: 1; }
+"""
+
+def test_merge_zoom_bands_lowers_the_distinct_style_count():
+    dataset = OsmDataset([OsmElement("way", 1, {"power": "line"}, nodes=[1, 2]), OsmElement("way", 2, {"power": "cable"}, nodes=[2, 3])])
+    merged, report = merge_zoom_bands(ZOOM_BANDS_STYLE)
+    assert report["rules_merged"] == 2
+    assert "way|z-19[power=line]" in merged and "way[power=cable]" in merged
+
+    before = style_cardinality(parse_stylesheet(ZOOM_BANDS_STYLE), dataset)
+    after = style_cardinality(parse_stylesheet(merged), dataset)
+    assert (len(before["bands"]), before["distinct_styles"]) == (3, 6)
+    assert (len(after["bands"]), after["distinct_styles"]) == (2, 4)
+    assert check_equivalence(ZOOM_BANDS_STYLE, merged, cases=200, jobs=1)["equivalent"]
+
+def test_merge_zoom_bands_needs_quantized_widths_on_the_template(generator, template, default_style):
+    assert merge_zoom_bands(default_style)[1]["rules_merged"] == 0
+    values, changes = generator.quantize_zoom_variables(generator.DEFAULT_VALUES, 1)
+    assert "segment_width_mid: 3 -> 4" in changes
+    style = generator.render_style(template, values, generator.DEFAULT_VOLTAGE_RULES)
+    merged, report = merge_zoom_bands(style)
+    assert report["rules_merged"] > 0
+    assert "way.power_segment_all { width: 4; }" in merged
+    assert check_equivalence(style, merged, cases=1000, jobs=1)["equivalent"]
@@ -0,0 +1,93 @@
+import gzip
+import importlib.util
+import json
+import os
+import sys
+
+import pytest
+
+from conftest import ROOT
+from osm_extract import iter_elements
+
+@pytest.fixture(scope="module")
+def overlays():
+    """overlay-prepare.py, registered under a name so that its worker processes can find its functions."""
+    spec = importlib.util.spec_from_file_location("overlay_prepare", os.path.join(ROOT, "overlay-prepare.py"))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["overlay_prepare"] = module
+    spec.loader.exec_module(module)
+    yield module
+    del sys.modules["overlay_prepare"]
+
+def write_osmose(path, rows):
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        f.write("lat,lon,item,class,title,country\n")
+        for row in rows:
+            f.write(",".join(str(value) for value in row) + "\n")
+
+def write_gem(path, features):
+    collection = {"type": "FeatureCollection", "features": [
+        {"type": "Feature", "geometry": {"type": "Point", "coordinates": [lon, lat]}, "properties": {"Type": kind, "GEM unit/phase ID": gem_id, "Country": country}}
+        for lat, lon, kind, gem_id, country in features
+    ]}
+    # A feature without a point geometry is skipped
+    collection["features"].append({"type": "Feature", "geometry": None, "properties": {"Type": "coal"}})
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(collection, f)
+
+def test_csv_and_geojson_shards(overlays, default_style, tmp_path):
+    osmose, gem = str(tmp_path / "osmose.csv.gz"), str(tmp_path / "gem.geojson")
+    write_osmose(osmose, [(45.5, 4.5, 8280, 1, "Missing line", "France"), (45.6, 4.6, 7040, 2, "Power line", "France"),
+                          (-33.9, 18.4, 8280, 1, "Missing line", "South Africa")])
+    write_gem(gem, [(45.7, 4.7, "coal", "G1", "France"), (-33.8, 18.5, "gas", "G2", "South Africa")])
+
+    index = overlays.prepare_overlays([osmose, gem], str(tmp_path / "out"), jobs=1, style=default_style)
+    assert [(entry["source"], entry["points"], entry["skipped"]) for entry in index["inputs"]] == [("osmose", 3, 0), ("gem", 2, 1)]
+    assert len(index["shards"]) == 2
+    assert all(shard["sources"] == ({"osmose": 2, "gem": 1} if shard["points"] == 3 else {"osmose": 1, "gem": 1}) for shard in index["shards"])
+
+    elements = [element for shard in index["shards"] for element in iter_elements(str(tmp_path / "out" / shard["file"]))]
+    assert len(elements) == 5
+    # Ids are negative and unique over all the inputs
+    assert all(element.id < 0 for element in elements)
+    assert len({element.id for element in elements}) == 5
+    assert {element.tags.get("Type") for element in elements} == {None, "coal", "gas"}
+    assert [name for name in os.listdir(str(tmp_path / "out")) if name.startswith(".spool-")] == []
+
+def test_geojson_output(overlays, default_style, tmp_path):
+    gem = str(tmp_path / "gem.geojson")
+    write_gem(gem, [(45.7, 4.7, "coal", "G1", "France")])
+    index = overlays.prepare_overlays([gem], str(tmp_path / "out"), output_format="geojson", jobs=1, style=default_style)
+    with open(tmp_path / "out" / index["shards"][0]["file"], "r", encoding="utf-8") as f:
+        features = json.load(f)["features"]
+    assert features[0]["geometry"]["coordinates"] == [4.7, 45.7]
+    assert features[0]["properties"]["Type"] == "coal"
+
+def test_unstyled_points(overlays, default_style, tmp_path):
+    osmose = str(tmp_path / "osmose.csv.gz")
+    # Item 1234 has no rule in the style
+    write_osmose(osmose, [(45.5, 4.5, 8280, 1, "Missing line", "France"), (45.6, 4.6, 1234, 1, "Something else", "France")])
+
+    index = overlays.prepare_overlays([osmose], str(tmp_path / "dropped"), jobs=1, style=default_style)
+    assert (index["points"], index["unstyled"]) == (1, 1)
+    index = overlays.prepare_overlays([osmose], str(tmp_path / "kept"), jobs=1, style=default_style, keep_unstyled=True)
+    assert (index["points"], index["unstyled"]) == (2, 1)
+
+    rules = overlays.OverlayRules(default_style)
+    assert rules.draws({"item": "8280"}) and rules.draws({"reason": "missing voltage"})
+    assert not rules.draws({"item": "1234"}) and not rules.draws({"wikidata": "Q42"})
+
+def test_country_shard_names(overlays, default_style, tmp_path):
+    names = overlays.shard_names(["France", "france", "Côte d'Ivoire", "Bosnia/Herzegovina", "Bosnia Herzegovina", ""], "country")
+    assert names["Côte d'Ivoire"] == "Côte_d_Ivoire"
+    assert names[""] == "unknown"
+    assert names["France"].startswith("France-") and names["france"].startswith("france-")
+    assert names["Bosnia/Herzegovina"] != names["Bosnia Herzegovina"]
+    assert len({name.lower() for name in names.values()}) == len(names)
+
+    osmose = str(tmp_path / "osmose.csv.gz")
+    write_osmose(osmose, [(45.5, 4.5, 8280, 1, "Missing line", "Bosnia/Herzegovina"), (45.6, 4.6, 8280, 1, "Missing line", "Bosnia Herzegovina")])
+    index = overlays.prepare_overlays([osmose], str(tmp_path / "out"), shard_by="country", jobs=1, style=default_style)
+    assert sorted(shard["country"] for shard in index["shards"]) == ["Bosnia Herzegovina", "Bosnia/Herzegovina"]
+    assert all(shard["points"] == 1 for shard in index["shards"])
+    assert len({shard["file"] for shard in index["shards"]}) == 2
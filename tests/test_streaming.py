@@ -0,0 +1,82 @@
+import os
+import tracemalloc
+
+import pytest
+
+from conftest import ROOT
+
+# Markers, placeholders and line endings cut at every position by small blocks
+TRICKY_TEMPLATE = (
+    "way[power=line] {\r\n    width: {{ segment_width_low }};\r\n}\r"
+    "/* End of switchgears voltage-based styles */\n"
+    "/* Voltage-based classes */\nold classes {{line_color}}\n/* End of voltage-based classes */\r\n"
+    "node { text: \"{x}\"; symbol-size: {{node_size_low}}{{node_size_low}}; }\n"
+    "/* Switchgears voltage-based styles */\n/* Power lines voltage-based styles */\n"
+    "/* End of switchgears voltage-based styles */\n{{ undefined_variable }}\n"
+    "/* Power lines voltage-based styles */\n/* End of power lines voltage-based styles */\r\n"
+)
+
+def stream(generator, template, block_size):
+    artifact = {"jinja": False, "variables": []}
+    blocks = [template[i:i + block_size] for i in range(0, len(template), block_size)]
+    artifact["chunks"] = list(generator.iter_template_chunks(blocks, artifact))
+    return artifact
+
+@pytest.mark.parametrize("block_size", [1, 2, 3, 5, 8, 13, 64, 1 << 16])
+def test_blocks_do_not_change_the_style(generator, block_size):
+    values, voltage_rules = generator.PRESETS["default"]
+    expected = generator.render_style(TRICKY_TEMPLATE, values, voltage_rules)
+    compiled = generator.compile_template(TRICKY_TEMPLATE)
+    artifact = stream(generator, TRICKY_TEMPLATE, block_size)
+    assert (artifact["jinja"], artifact["variables"]) == (False, compiled["variables"])
+    assert generator.render_artifact(artifact, values, voltage_rules) == expected
+
+    jinja_template = TRICKY_TEMPLATE + "{% if true %}x{% endif %}"
+    assert stream(generator, jinja_template, block_size)["jinja"]
+
+@pytest.mark.parametrize("cached", [True, False])
+def test_streamed_files_render_the_committed_style(generator, default_style, tmp_path, monkeypatch, cached):
+    monkeypatch.setattr(generator, "_artifacts", {})
+    monkeypatch.setattr(generator, "TEMPLATE_BLOCK_SIZE", 97)
+    artifact = generator.load_template_artifact(os.path.join(ROOT, "map_your_grid_template.mapcss"), str(tmp_path / "cache") if cached else None)
+    values, voltage_rules = generator.PRESETS["default"]
+    generator.write_style(str(tmp_path / "style.mapcss"), artifact, values, voltage_rules)
+    assert (tmp_path / "style.mapcss").read_text(encoding="utf-8") == default_style
+
+def test_jinja_templates_are_read_from_their_file(generator, tmp_path, monkeypatch):
+    monkeypatch.setattr(generator, "_artifacts", {})
+    template_file = tmp_path / "template.mapcss"
+    template_file.write_text("{% if segment_width_low > 2 %}way { width: {{ segment_width_low }}; }{% endif %}\n", encoding="utf-8")
+    artifact = generator.load_template_artifact(str(template_file), str(tmp_path / "cache"))
+    assert artifact["jinja"]
+    generator.write_style(str(tmp_path / "style.mapcss"), artifact, generator.DEFAULT_VALUES, [])
+    assert (tmp_path / "style.mapcss").read_text(encoding="utf-8") == "way { width: 4; }"
+
+def peak_memory(generator, template_file, cache_dir, output_file):
+    """Peak memory of loading and writing a style, with its size in bytes."""
+    values, voltage_rules = generator.PRESETS["default"]
+    generator._artifacts.clear()
+    tracemalloc.start()
+    try:
+        artifact = generator.load_template_artifact(str(template_file), cache_dir)
+        size = generator.write_style(str(output_file), artifact, values, voltage_rules)
+        return tracemalloc.get_traced_memory()[1], size
+    finally:
+        tracemalloc.stop()
+
+@pytest.mark.parametrize("cached", [True, False])
+def test_memory_stays_bounded_by_one_section(generator, template, tmp_path, monkeypatch, cached):
+    monkeypatch.setattr(generator, "_artifacts", {})
+    section = generator.line_voltage_section(generator.PRESETS["default"][1])
+    peaks = []
+    for rules in (5000, 25000):
+        big_template = generator.benchmark_template(template, rules)
+        assert len(big_template) > 20 * len(section)
+        template_file = tmp_path / f"template-{rules}.mapcss"
+        template_file.write_text(big_template, encoding="utf-8")
+        peak, size = peak_memory(generator, template_file, str(tmp_path / "cache") if cached else None, tmp_path / "style.mapcss")
+        assert size > len(big_template) / 2
+        peaks.append(peak)
+    # Five times the template, not more memory
+    assert peaks[1] < 1.2 * peaks[0]
+    assert peaks[1] < len(big_template) / 2
@@ -0,0 +1,52 @@
+import importlib.util
+import json
+import os
+
+import pytest
+
+from conftest import ROOT
+from osm_synthetic import generate_grid
+
+@pytest.fixture(scope="module")
+def synthetic_grid():
+    """synthetic-grid.py, which cannot be imported by name."""
+    spec = importlib.util.spec_from_file_location("synthetic_grid", os.path.join(ROOT, "synthetic-grid.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+def test_same_seed_same_grid(generator, tmp_path):
+    rules = generator.PRESETS["default"][1]
+    stats = [generate_grid(str(tmp_path / f"grid-{run}.osm"), 2000, seed, 0.5, (0.0, 20.0), rules) for run, seed in enumerate((7, 7, 8))]
+    assert read(tmp_path / "grid-0.osm") == read(tmp_path / "grid-1.osm")
+    assert read(tmp_path / "grid-0.osm") != read(tmp_path / "grid-2.osm")
+    assert stats[0] == stats[1]
+    assert stats[0]["objects"] >= 2000
+
+def test_voltage_rules_presets(generator, synthetic_grid, tmp_path):
+    assert synthetic_grid.load_voltage_rules("dense") == generator.PRESETS["dense"][1]
+
+    config = tmp_path / "batch.json"
+    config.write_text(json.dumps({"variants": [
+        {"name": "plain"},
+        {"name": "preset", "voltage_rules": "dense"},
+        {"name": "listed", "voltage_rules": [[220000, None, "#FF0000"]]},
+    ]}), encoding="utf-8")
+    assert synthetic_grid.load_voltage_rules(str(config)) == generator.PRESETS["default"][1]
+    assert synthetic_grid.load_voltage_rules(str(config), "preset") == generator.PRESETS["dense"][1]
+    assert synthetic_grid.load_voltage_rules(str(config), "listed") == [(220000, None, "#FF0000", "#FFFFFF")]
+    with pytest.raises(ValueError):
+        synthetic_grid.load_voltage_rules(str(config), "missing")
+
+def test_voltage_band_labels(tmp_path):
+    stats = generate_grid(str(tmp_path / "grid.osm"), 1000)
+    assert [band["label"] for band in stats["voltage_bands"]] == ["common voltages"]
+
+    rules = [(None, None, "#888888", "#FFFFFF"), (None, 50000, "#0000FF", "#FFFFFF"), (50000, None, "#FF0000", "#FFFFFF")]
+    stats = generate_grid(str(tmp_path / "grid.osm"), 1000, voltage_rules=rules)
+    assert [band["label"] for band in stats["voltage_bands"]] == ["no voltage", "…-50000", "50000-…"]
+    assert sum(band["lines"] for band in stats["voltage_bands"]) > 0
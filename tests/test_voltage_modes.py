@@ -0,0 +1,32 @@
+import pytest
+
+from mapcss_engine import evaluate_dataset, parse_stylesheet
+from mapcss_equivalence import check_equivalence
+from osm_extract import OsmDataset, OsmElement
+
+def test_compiled_mode_paints_like_the_flat_style(generator, template, default_style):
+    style = generator.render_style(template, generator.DEFAULT_VALUES, generator.DEFAULT_VOLTAGE_RULES, "compiled")
+    assert style.count(generator.VOLTAGE_1ST_EXPRESSION) == 1
+    report = check_equivalence(default_style, style, cases=1000, jobs=1)
+    assert report["equivalent"], report["examples"]
+
+def test_tree_mode_paints_like_the_flat_style(generator, template, default_style):
+    style = generator.render_style(template, generator.DEFAULT_VALUES, generator.DEFAULT_VOLTAGE_RULES, "tree")
+    report = check_equivalence(default_style, style, cases=1000, jobs=1)
+    assert report["equivalent"], report["examples"]
+
+def test_tree_cost_matches_the_conditions_evaluated_on_the_whole_style(generator, template):
+    voltage_rules = generator.benchmark_voltage_rules(40)
+    voltages = [lower if lower is not None else upper - 1 for lower, upper, rules in generator.voltage_intervals(voltage_rules)]
+    dataset = OsmDataset(OsmElement("way", i + 1, {"power": "line", "voltage": str(voltage)}) for i, voltage in enumerate(voltages))
+
+    conditions = {}
+    for voltage_mode in ("flat", "tree"):
+        stylesheet = parse_stylesheet(generator.render_style(template, generator.DEFAULT_VALUES, voltage_rules, voltage_mode))
+        conditions[voltage_mode] = evaluate_dataset(stylesheet, dataset, [18])["total"]["conditions_evaluated"]
+
+    cost = generator.voltage_selector_cost(voltage_rules)
+    measured = (conditions["tree"] - conditions["flat"]) / len(voltages)
+    assert measured == pytest.approx(cost["tree"]["average"] - cost["flat"]["average"], abs=0.01)
+    # Every intermediate class is tested on every power way, so the tree saves far less than N - log2(N) conditions
+    assert cost["tree"]["average"] > 2 * len(voltage_rules)
@@ -0,0 +1,43 @@
+def test_canonical_voltage_rules_keep_the_presets(generator):
+    for values, voltage_rules in generator.PRESETS.values():
+        assert generator.canonical_voltage_rules(voltage_rules) == (voltage_rules, [])
+
+def test_canonical_voltage_rules_resolve_overlaps_with_the_last_rule(generator):
+    rules, notes = generator.canonical_voltage_rules([
+        (None, None, "#FFFFFF", "#000000"),
+        (0, 132000, "#111111", "#FFFFFF"),
+        (100000, 200000, "#222222", "#FFFFFF"),
+    ])
+    assert rules == [
+        (None, None, "#FFFFFF", "#000000"),
+        (0, 100000, "#111111", "#FFFFFF"),
+        (100000, 200000, "#222222", "#FFFFFF"),
+    ]
+    assert any("100 to 132 kV is covered by several rules" in note for note in notes)
+
+def test_canonical_voltage_rules_sort_merge_and_report_gaps(generator):
+    rules, notes = generator.canonical_voltage_rules([
+        (300000, None, "#333333", "#FFFFFF"),
+        (None, None, "#FFFFFF", "#000000"),
+        (50000, 132000, "#111111", "#FFFFFF"),
+        (None, 50000, "#111111", "#FFFFFF"),
+        (5000, 5000, "#444444", "#FFFFFF"),
+    ])
+    assert rules == [
+        (None, None, "#FFFFFF", "#000000"),
+        (None, 132000, "#111111", "#FFFFFF"),
+        (300000, None, "#333333", "#FFFFFF"),
+    ]
+    assert any("no rule for 132 to 300 kV" in note for note in notes)
+    assert any("5 to 5 kV in #444444 is never applied" in note for note in notes)
+
+def test_canonical_voltage_rules_keep_the_last_no_voltage_rule(generator):
+    rules, notes = generator.canonical_voltage_rules([(None, None, "#FFFFFF", "#000000"), (None, None, "#EEEEEE", "#000000")])
+    assert rules == [(None, None, "#EEEEEE", "#000000")]
+    assert notes
+
+def test_batch_variants_get_canonical_rules(generator, tmp_path, capsys):
+    variant = {"name": "overlapping", "voltage_rules": [[None, None, "#FFFFFF", "#000000"], [0, 132000, "#111111"], [100000, 200000, "#222222"]]}
+    job = generator.resolve_variant(variant, {}, str(tmp_path))
+    assert job["voltage_rules"] == [(None, None, "#FFFFFF", "#000000"), (0, 100000, "#111111", "#FFFFFF"), (100000, 200000, "#222222", "#FFFFFF")]
+    assert "⚠️ Variant 'overlapping': " in capsys.readouterr().out
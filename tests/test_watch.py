@@ -0,0 +1,70 @@
+import email.utils
+import http.client
+import http.server
+import threading
+
+import pytest
+
+@pytest.fixture
+def style_server(generator):
+    styles = {"grid": {"body": b"way { width: 2; }\n", "etag": '"abc"', "last_modified": 1700000000, "variant": "grid"}}
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), generator.make_style_handler(styles))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server.server_address[1], styles
+    server.shutdown()
+    server.server_close()
+
+def request(port, path, method="GET", headers=None):
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+    connection.request(method, path, headers=headers or {})
+    response = connection.getresponse()
+    body = response.read()
+    connection.close()
+    return response, body
+
+def test_styles_are_served_with_validators(style_server):
+    port, styles = style_server
+    response, body = request(port, "/grid.mapcss")
+    assert response.status == 200
+    assert body == styles["grid"]["body"]
+    assert response.getheader("ETag") == '"abc"'
+    assert response.getheader("Last-Modified") == email.utils.formatdate(1700000000, usegmt=True)
+
+    response, body = request(port, "/")
+    assert body == b"/grid.mapcss\n"
+    assert request(port, "/other.mapcss")[0].status == 404
+
+def test_conditional_requests_get_not_modified(style_server):
+    port, styles = style_server
+    response, body = request(port, "/grid.mapcss", headers={"If-None-Match": '"old", "abc"'})
+    assert (response.status, body) == (304, b"")
+    assert request(port, "/grid.mapcss", headers={"If-None-Match": '"old"'})[0].status == 200
+
+    since = email.utils.formatdate(1700000000, usegmt=True)
+    assert request(port, "/grid.mapcss", headers={"If-Modified-Since": since})[0].status == 304
+    earlier = email.utils.formatdate(1699999999, usegmt=True)
+    assert request(port, "/grid.mapcss", headers={"If-Modified-Since": earlier})[0].status == 200
+    # If-None-Match wins over If-Modified-Since
+    assert request(port, "/grid.mapcss", headers={"If-None-Match": '"old"', "If-Modified-Since": since})[0].status == 200
+
+    styles["grid"].update(body=b"way { width: 3; }\n", etag='"def"', last_modified=1700000001)
+    response, body = request(port, "/grid.mapcss", headers={"If-None-Match": '"abc"'})
+    assert (response.status, body) == (200, b"way { width: 3; }\n")
+
+def test_head_requests_get_no_body(style_server):
+    port, styles = style_server
+    response, body = request(port, "/grid.mapcss", method="HEAD")
+    assert (response.status, body) == (200, b"")
+    assert response.getheader("Content-Length") == str(len(styles["grid"]["body"]))
+
+def test_fingerprints_follow_the_template(generator, tmp_path):
+    template = tmp_path / "template.mapcss"
+    template.write_text("way { width: {{segment_width_low}}; }\n", encoding="utf-8")
+    job = generator.resolve_variant({"name": "grid", "template": "template.mapcss"}, {}, str(tmp_path))
+    fingerprint = generator.job_fingerprint(job)
+    assert generator.job_fingerprint(job) == fingerprint
+
+    template.write_text("way { width: {{segment_width_mid}}; }\n", encoding="utf-8")
+    assert generator.job_fingerprint(job) != fingerprint
+    job["values"] = dict(job["values"], segment_width_low=9)
+    assert generator.job_fingerprint(job) != fingerprint